@@ -0,0 +1,384 @@
+""" Module to drive remote tasks from an asyncio event loop """
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from biobb_remote.ssh_session import SSHSession
+from biobb_remote.task import FINISHED, CANCELLED
+
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_MAX_CHANNELS = 8
+
+_DEFAULT_EXECUTOR = None
+_DEFAULT_EXECUTOR_LOCK = threading.Lock()
+
+
+def get_default_executor():
+    """
+    | async_task.get_default_executor
+    | Returns the thread pool shared by all async objects not given an explicit executor.
+    | Blocking paramiko calls run here, so the number of threads is fixed whatever the number of tasks.
+    """
+    global _DEFAULT_EXECUTOR
+    with _DEFAULT_EXECUTOR_LOCK:
+        if _DEFAULT_EXECUTOR is None:
+            _DEFAULT_EXECUTOR = ThreadPoolExecutor(
+                max_workers=DEFAULT_MAX_WORKERS, thread_name_prefix='biobb_async'
+            )
+    return _DEFAULT_EXECUTOR
+
+
+class AsyncTaskError(Exception):
+    """
+    | biobb_remote async_task.AsyncTaskError
+    | Raised instead of exiting when a remote operation fails inside the event loop
+    """
+
+
+class _SharedSession():
+    """
+    | Private. async_task._SharedSession
+    | Thread-safe proxy to a SSHSession shared by several tasks.
+    | Commands run on independent channels, sftp operations are serialized.
+
+    Args:
+        session (SSHSession): Open session
+    """
+    def __init__(self, session):
+        self.session = session
+        self.sftp_lock = threading.Lock()
+
+    def run_command(self, command, forward_agent=False):
+        return self.session.run_command(command, forward_agent)
+
+    def run_sftp(self, oper, input_file_path, output_file_path='', reuse_session=True):
+        with self.sftp_lock:
+            return self.session.run_sftp(oper, input_file_path, output_file_path, reuse_session)
+
+    def open_file(self, file_path, mode='rb'):
+        with self.sftp_lock:
+            return self.session.open_file(file_path, mode)
+
+    def get_dir_stats(self, dir_path, refresh=False):
+        with self.sftp_lock:
+            return self.session.get_dir_stats(dir_path, refresh)
+
+    def invalidate_metadata(self, path=None):
+        self.session.invalidate_metadata(path)
+
+    def is_active(self):
+        return self.session.is_active()
+
+    def close(self):
+        self.session.close()
+
+
+class AsyncSSHSession():
+    """
+    | biobb_remote async_task.AsyncSSHSession
+    | Awaitable wrapper around SSHSession. Blocking calls run on a shared thread pool.
+
+    Args:
+        ssh_data (SSHCredentials): SSHCredentials object
+        executor (Executor) (Optional): (None) Executor for blocking calls, defaults to the shared one
+        max_channels (int) (Optional): (8) Max concurrent operations on the connection
+        debug (bool) (Optional): (False) Prints verbose debug information on ssh transactions
+    """
+    def __init__(self, ssh_data, executor=None, max_channels=DEFAULT_MAX_CHANNELS, debug=False):
+        self.ssh_data = ssh_data
+        self.executor = executor
+        self.max_channels = max_channels
+        self.debug = debug
+        self.shared = None
+        self._channels = None
+        self._connect_lock = None
+
+    async def _call(self, func, *args, timeout=None):
+        """
+        | Private. AsyncSSHSession._call
+        | Runs a blocking function in the executor, converting exits into AsyncTaskError
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor or get_default_executor(), _no_exit, func, *args)
+        if timeout:
+            return await asyncio.wait_for(future, timeout)
+        return await future
+
+    async def connect(self, timeout=None):
+        """
+        | AsyncSSHSession.connect
+        | Opens the SSH connection if not already active
+
+        Args:
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+            self._channels = asyncio.Semaphore(self.max_channels)
+        async with self._connect_lock:
+            if self.shared and self.shared.is_active():
+                return self
+            session = await self._call(
+                lambda: SSHSession(ssh_data=self.ssh_data, debug=self.debug), timeout=timeout
+            )
+            self.shared = _SharedSession(session)
+        return self
+
+    async def run_command(self, command, timeout=None):
+        """
+        | AsyncSSHSession.run_command
+        | Runs a shell command on remote, returns stdout, stderr tuple
+
+        Args:
+            command (str | list(str)): Command or list of commands to execute on remote.
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        await self.connect()
+        async with self._channels:
+            return await self._call(self.shared.run_command, command, timeout=timeout)
+
+    async def run_sftp(self, oper, input_file_path, output_file_path='', timeout=None):
+        """
+        | AsyncSSHSession.run_sftp
+        | Performs a sftp operation, see SSHSession.run_sftp for available operations
+
+        Args:
+            oper (str): Operation to perform
+            input_file_path (str): Input file path or input string
+            output_file_path (str) (Optional): ('') Output file path. Not required in some ops.
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        await self.connect()
+        async with self._channels:
+            return await self._call(
+                self.shared.run_sftp, oper, input_file_path, output_file_path, timeout=timeout
+            )
+
+    async def put(self, local_file_path, remote_file_path, timeout=None):
+        """
+        | AsyncSSHSession.put
+        | Uploads a single file
+        """
+        return await self.run_sftp('put', local_file_path, remote_file_path, timeout=timeout)
+
+    async def get(self, remote_file_path, local_file_path, timeout=None):
+        """
+        | AsyncSSHSession.get
+        | Downloads a single file
+        """
+        return await self.run_sftp('get', remote_file_path, local_file_path, timeout=timeout)
+
+    def close(self):
+        """
+        | AsyncSSHSession.close
+        | Closes the connection
+        """
+        if self.shared:
+            self.shared.close()
+            self.shared = None
+
+
+class AsyncSessionPool():
+    """
+    | biobb_remote async_task.AsyncSessionPool
+    | Keeps one AsyncSSHSession per (host, userid), shared by all tasks on the same host
+
+    Args:
+        executor (Executor) (Optional): (None) Executor for blocking calls, defaults to the shared one
+        max_channels (int) (Optional): (8) Max concurrent operations per connection
+    """
+    def __init__(self, executor=None, max_channels=DEFAULT_MAX_CHANNELS):
+        self.executor = executor
+        self.max_channels = max_channels
+        self.sessions = {}
+
+    def get_session(self, ssh_data, debug=False):
+        """
+        | AsyncSessionPool.get_session
+        | Returns the (not yet connected) session for the given credentials
+
+        Args:
+            ssh_data (SSHCredentials): SSHCredentials object
+            debug (bool) (Optional): (False) Prints verbose debug information on ssh transactions
+        """
+        key = (ssh_data.host, ssh_data.userid)
+        if key not in self.sessions:
+            self.sessions[key] = AsyncSSHSession(
+                ssh_data, executor=self.executor, max_channels=self.max_channels, debug=debug
+            )
+        return self.sessions[key]
+
+    def close(self):
+        """
+        | AsyncSessionPool.close
+        | Closes all connections
+        """
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
+
+
+class AsyncTask():
+    """
+    | biobb_remote async_task.AsyncTask
+    | Awaitable interface to a Task (or inherited class, e.g. Slurm).
+    | The task keeps all its data, only the SSH connection is shared through the pool.
+
+    Args:
+        task (Task): Task object, with credentials and host configuration already set
+        pool (AsyncSessionPool) (Optional): (None) Pool of shared connections, a private one is used if not set
+    """
+    def __init__(self, task, pool=None):
+        self.task = task
+        self.pool = pool or AsyncSessionPool()
+        self.session = self.pool.get_session(task.ssh_data, debug=task.debug)
+
+    @property
+    def id(self):
+        return self.task.id
+
+    async def connect(self, timeout=None):
+        """
+        | AsyncTask.connect
+        | Opens (or re-uses) the shared connection and attaches it to the task
+
+        Args:
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        await self.session.connect(timeout=timeout)
+        self.task.ssh_session = self.session.shared
+        return self
+
+    async def _run(self, func, *args, timeout=None, **kwargs):
+        """
+        | Private. AsyncTask._run
+        | Runs a blocking Task method on the shared connection
+        """
+        await self.connect()
+        return await self.session._call(lambda: func(*args, **kwargs), timeout=timeout)
+
+    async def run_command(self, command, timeout=None):
+        """
+        | AsyncTask.run_command
+        | Runs a shell command on remote, returns stdout, stderr tuple
+        """
+        await self.connect()
+        return await self.session.run_command(command, timeout=timeout)
+
+    async def send_input_data(self, remote_base_path, timeout=None, **kwargs):
+        """
+        | AsyncTask.send_input_data
+        | Uploads input data bundle, see Task.send_input_data for arguments
+
+        Args:
+            remote_base_path (str): Path to remote base directory, task folders created within
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        return await self._run(self.task.send_input_data, remote_base_path, timeout=timeout, **kwargs)
+
+    async def submit(self, timeout=None, **kwargs):
+        """
+        | AsyncTask.submit
+        | Submits the task, see Task.submit for arguments. Polling is not allowed here, use wait.
+
+        Args:
+            timeout (float) (Optional): (None) Max time to wait for the submission (seconds)
+        """
+        kwargs['poll_time'] = 0
+        await self._run(self.task.submit, timeout=timeout, **kwargs)
+        return self.task.task_data['remote_job_id']
+
+    async def status(self, timeout=None):
+        """
+        | AsyncTask.status
+        | Updates and returns job status (task.JOB_STATUS codes)
+
+        Args:
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        return await self._run(self.task._check_job_status, timeout=timeout)
+
+    async def wait(self, poll_time=30, timeout=None):
+        """
+        | AsyncTask.wait
+        | Waits until job is finished or cancelled, returns final status.
+        | Raises asyncio.TimeoutError on timeout. The job keeps running if the wait is cancelled.
+
+        Args:
+            poll_time (float) (Optional): (30) Polling interval (seconds)
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        async def _poll():
+            while True:
+                status = await self.status()
+                if status in (FINISHED, CANCELLED):
+                    return status
+                await asyncio.sleep(poll_time)
+        if timeout:
+            return await asyncio.wait_for(_poll(), timeout)
+        return await _poll()
+
+    async def cancel(self, remove_data=False, timeout=None):
+        """
+        | AsyncTask.cancel
+        | Cancels the remote job
+
+        Args:
+            remove_data (bool) (Optional): (False) Removes remote working directory
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        return await self._run(self.task.cancel, remove_data=remove_data, timeout=timeout)
+
+    async def get_output_data(self, local_data_path='', timeout=None, **kwargs):
+        """
+        | AsyncTask.get_output_data
+        | Downloads the remote working dir, see Task.get_output_data for arguments
+
+        Args:
+            local_data_path (str) (Optional): ('') Path to local working dir
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        return await self._run(self.task.get_output_data, local_data_path, timeout=timeout, **kwargs)
+
+    async def clean_remote(self, timeout=None):
+        """
+        | AsyncTask.clean_remote
+        | Removes remote working dir
+        """
+        return await self._run(self.task.clean_remote, timeout=timeout)
+
+    async def run(self, remote_base_path, local_data_path, poll_time=30, timeout=None, **submit_args):
+        """
+        | AsyncTask.run
+        | Uploads, submits, waits and downloads. Cancels the remote job if the coroutine is
+        | cancelled or times out while the job is queued or running.
+
+        Args:
+            remote_base_path (str): Path to remote base directory
+            local_data_path (str): Local directory with input data, also used for output
+            poll_time (float) (Optional): (30) Polling interval (seconds)
+            timeout (float) (Optional): (None) Max time to wait for job completion (seconds)
+        """
+        self.task.set_local_data_bundle(local_data_path)
+        await self.send_input_data(remote_base_path)
+        await self.submit(**submit_args)
+        try:
+            status = await self.wait(poll_time=poll_time, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            await asyncio.shield(self.cancel())
+            raise
+        if status == FINISHED:
+            await self.get_output_data(local_data_path)
+        return status
+
+
+def _no_exit(func, *args):
+    """
+    | Private. async_task._no_exit
+    | Calls func converting SystemExit (used for errors in blocking API) into AsyncTaskError
+    """
+    try:
+        return func(*args)
+    except SystemExit as err:
+        raise AsyncTaskError(str(err)) from None
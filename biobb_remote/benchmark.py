@@ -0,0 +1,320 @@
+""" Module to run strong-scaling benchmarks of a run script on a remote host """
+
+import sys
+import json
+import time
+import shlex
+
+from os.path import join as opj
+
+from biobb_remote.task import FINISHED, CANCELLED
+
+TIMES_FILE = 'biobb_walltime.txt'
+
+
+def default_configurations(host_config, max_nodes=4, cpus_per_task=1, num_gpus=0):
+    """
+    | benchmark.default_configurations
+    | Builds a series of prep_auto_settings arguments: 1/4, 1/2 node and 1, 2, 4... full nodes
+
+    Args:
+        host_config (dict): Host configuration
+        max_nodes (int) (Optional): (4) Largest number of nodes
+        cpus_per_task (int) (Optional): (1) OMP threads per MPI task
+        num_gpus (int) (Optional): (0) GPUs per node
+    """
+    cores_per_node = host_config['cores_per_node']
+    configs = []
+    for fraction in (4, 2):
+        if cores_per_node % fraction == 0 and cores_per_node / fraction >= cpus_per_task:
+            configs.append({
+                'total_cores': int(cores_per_node / fraction),
+                'cpus_per_task': cpus_per_task,
+                'num_gpus': num_gpus
+            })
+    nodes = 1
+    while nodes <= max_nodes:
+        configs.append({'nodes': nodes, 'cpus_per_task': cpus_per_task, 'num_gpus': num_gpus})
+        nodes *= 2
+    return configs
+
+
+class ScalingBenchmark():
+    """
+    | biobb_remote benchmark.ScalingBenchmark
+    | Class to submit the same run script at increasing core/node counts and
+    | compute speedup and parallel efficiency.
+    | Inputs are uploaded once, each run works in a sub-folder linking to them.
+
+    Args:
+        task (Task): Task object (e.g. Slurm) with credentials and host configuration set
+        local_run_script (str): Path to local bash script or script string (leading '#script' tag). $BIOBB_LAUNCHER contains the launcher for each configuration
+        local_data_path (str): Local directory with input data
+        remote_base_path (str): Remote base path
+        configurations (list(dict)) (Optional): (None) prep_auto_settings arguments per run, defaults to default_configurations
+        queue_settings (str) (Optional): (default) Base queue settings label (e.g. for time or qos)
+        modules (str | list(str)) (Optional): (None) Modules to load (defined in host configuration)
+        copy_inputs (bool) (Optional): (False) Copy inputs to each run folder instead of linking them
+    """
+    def __init__(
+            self,
+            task,
+            local_run_script,
+            local_data_path,
+            remote_base_path,
+            configurations=None,
+            queue_settings='default',
+            modules=None,
+            copy_inputs=False
+            ):
+        self.task = task
+        self.local_run_script = local_run_script
+        self.local_data_path = local_data_path
+        self.remote_base_path = remote_base_path
+        if configurations:
+            self.configurations = configurations
+        else:
+            self.configurations = default_configurations(task.host_config)
+        self.queue_settings = queue_settings
+        self.modules = modules
+        self.copy_inputs = copy_inputs
+        self.runs = []
+
+    def run(self, poll_time=60, job_name='scaling'):
+        """
+        | ScalingBenchmark.run
+        | Uploads inputs, submits all configurations, waits for them and collects wall times
+
+        Args:
+            poll_time (int) (Optional): (60) Polling interval (seconds)
+            job_name (str) (Optional): ('scaling') Prefix for job names
+        """
+        self.task.set_local_data_bundle(self.local_data_path)
+        self.task.send_input_data(self.remote_base_path)
+        input_files = list(self.task.task_data['local_data_bundle'].get_file_names())
+        run_script = self._get_timed_script()
+
+        self.runs = []
+        for config in self.configurations:
+            profile = self.task.prep_launch_profile(**config)
+            run_task = self._new_run_task()
+            self._link_inputs(run_task, input_files)
+            settings = profile['settings']
+            label = '{}n_{}x{}'.format(settings['nodes'], settings['ntasks'], settings['cpus-per-task'])
+            run_task.submit(
+                job_name='{}_{}'.format(job_name, label),
+                queue_settings=self.queue_settings,
+                modules=self.modules,
+                local_run_script=run_script,
+                launch_profile=profile
+            )
+            self.runs.append({
+                'label': label,
+                'task': run_task,
+                'nodes': settings['nodes'],
+                'ntasks': settings['ntasks'],
+                'cpus_per_task': settings['cpus-per-task'],
+                'cores': settings['ntasks'] * settings['cpus-per-task'],
+                'job_id': run_task.task_data['remote_job_id'],
+                'state': None,
+                'wall_time': None
+            })
+
+        pending = list(self.runs)
+        while pending:
+            pending = [
+                run for run in pending
+                if run['task']._check_job_status() not in (FINISHED, CANCELLED)
+            ]
+            if pending:
+                print("Waiting for {} benchmark jobs".format(len(pending)))
+                time.sleep(poll_time)
+
+        for run in self.runs:
+            run['state'], run['wall_time'] = self._get_wall_time(run['task'])
+
+        return self.get_table()
+
+    def get_table(self):
+        """
+        | ScalingBenchmark.get_table
+        | Returns a list of dicts with cores, wall time, speedup and efficiency per configuration.
+        | The smallest completed configuration is taken as reference.
+        """
+        done = [run for run in self.runs if run['wall_time']]
+        table = []
+        if done:
+            ref = min(done, key=lambda run: run['cores'])
+        for run in sorted(self.runs, key=lambda run: run['cores']):
+            row = {k: v for k, v in run.items() if k != 'task'}
+            if run['wall_time']:
+                row['speedup'] = ref['wall_time'] / run['wall_time']
+                row['efficiency'] = row['speedup'] * ref['cores'] / run['cores']
+            else:
+                row['speedup'] = None
+                row['efficiency'] = None
+            table.append(row)
+        return table
+
+    def recommend(self, efficiency_threshold=0.7):
+        """
+        | ScalingBenchmark.recommend
+        | Largest configuration keeping parallel efficiency above threshold
+
+        Args:
+            efficiency_threshold (float) (Optional): (0.7) Minimum acceptable efficiency
+        """
+        candidates = [
+            row for row in self.get_table()
+            if row['efficiency'] is not None and row['efficiency'] >= efficiency_threshold
+        ]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda row: row['cores'])
+
+    def print_table(self, efficiency_threshold=0.7, file=sys.stdout):
+        """
+        | ScalingBenchmark.print_table
+        | Prints results table and recommended configuration
+
+        Args:
+            efficiency_threshold (float) (Optional): (0.7) Minimum acceptable efficiency
+            file (file handle) (Optional): (sys.stdout) Output stream
+        """
+        print(
+            '{:16s} {:>5s} {:>6s} {:>5s} {:>6s} {:>10s} {:>8s} {:>8s} {:>10s}'.format(
+                'Config', 'Nodes', 'Tasks', 'Thr', 'Cores', 'Wall(s)', 'Speedup', 'Eff', 'State'
+            ),
+            file=file
+        )
+        for row in self.get_table():
+            print(
+                '{:16s} {:5d} {:6d} {:5d} {:6d} {:>10s} {:>8s} {:>8s} {:>10s}'.format(
+                    row['label'], row['nodes'], row['ntasks'], row['cpus_per_task'], row['cores'],
+                    _fmt(row['wall_time'], '{:.0f}'), _fmt(row['speedup'], '{:.2f}'),
+                    _fmt(row['efficiency'], '{:.2f}'), str(row['state'])
+                ),
+                file=file
+            )
+        best = self.recommend(efficiency_threshold)
+        if best:
+            print(
+                "Recommended on {}: {} ({} cores, efficiency {:.2f})".format(
+                    self.task.host_config['description'], best['label'], best['cores'], best['efficiency']
+                ),
+                file=file
+            )
+        else:
+            print("No configuration reaches efficiency {}".format(efficiency_threshold), file=file)
+
+    def record(self, history):
+        """
+        | ScalingBenchmark.record
+        | Adds completed runs to a performance history
+
+        Args:
+            history (PerformanceHistory): Performance history
+        """
+        # Runs use a wrapped script and linked inputs, record them as the original ones
+        fingerprint = self.task.get_script_fingerprint(self.local_run_script)
+        input_size = self.task.get_input_size()
+        for run in self.runs:
+            if run['wall_time']:
+                history.record_task(
+                    run['task'],
+                    wall_time=run['wall_time'],
+                    save=False,
+                    fingerprint=fingerprint,
+                    input_size=input_size
+                )
+        history.save()
+
+    def save(self, output_path):
+        """
+        | ScalingBenchmark.save
+        | Saves results table as json
+
+        Args:
+            output_path (str): Path to file
+        """
+        with open(output_path, 'w') as output_file:
+            json.dump(
+                {
+                    'host': self.task.host_config['description'],
+                    'configurations': self.configurations,
+                    'results': self.get_table()
+                },
+                output_file,
+                indent=3
+            )
+
+    def _new_run_task(self):
+        """
+        | Private. ScalingBenchmark._new_run_task
+        | Task for a single configuration, working in a sub-folder of the inputs directory
+        """
+        run_task = self.task.__class__()
+        run_task.ssh_data = self.task.ssh_data
+        run_task.host_config = self.task.host_config
+        run_task.debug = self.task.debug
+        run_task.ssh_session = self.task.ssh_session
+        run_task.task_data['remote_base_path'] = self.task._remote_wdir()
+        return run_task
+
+    def _link_inputs(self, run_task, input_files):
+        """
+        | Private. ScalingBenchmark._link_inputs
+        | Creates run working dir with links (or copies) of the shared inputs
+        """
+        if self.copy_inputs:
+            cmd = 'cp -p'
+        else:
+            cmd = 'ln -sf'
+        run_task._open_ssh_session()
+        stdout, stderr = run_task.ssh_session.run_command(
+            'mkdir -p {wdir} && cd {wdir} && {cmd} {files} .'.format(
+                wdir=shlex.quote(run_task._remote_wdir()),
+                cmd=cmd,
+                files=' '.join(shlex.quote(opj(self.task._remote_wdir(), file)) for file in input_files)
+            )
+        )
+        if stderr:
+            sys.exit('Error while preparing benchmark working dir: ' + stderr)
+
+    def _get_timed_script(self):
+        """
+        | Private. ScalingBenchmark._get_timed_script
+        | Run script recording start and end times, used when accounting is not available
+        """
+        if self.local_run_script.find('#script') == -1:
+            with open(self.local_run_script, 'r') as scr_file:
+                script = scr_file.read()
+        else:
+            script = self.local_run_script
+        return '#script\nBIOBB_T0=$(date +%s)\ntrap \'echo $BIOBB_T0 $(date +%s) > {}\' EXIT\n{}'.format(
+            TIMES_FILE, script
+        )
+
+    def _get_wall_time(self, run_task):
+        """
+        | Private. ScalingBenchmark._get_wall_time
+        | Wall time from queue accounting, or from the times file written by the job
+        """
+        data = run_task.get_job_accounting()
+        if data and data.get('elapsed') is not None:
+            if data['state'] != 'COMPLETED':
+                return data['state'], None
+            return data['state'], data['elapsed']
+        try:
+            start, end = run_task.ssh_session.run_sftp(
+                'file', opj(run_task._remote_wdir(), TIMES_FILE)
+            ).split()
+            return 'COMPLETED', int(end) - int(start)
+        except (SystemExit, ValueError, AttributeError):
+            return 'UNKNOWN', None
+
+
+def _fmt(value, fmt):
+    if value is None:
+        return '-'
+    return fmt.format(value)
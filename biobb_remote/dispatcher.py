@@ -0,0 +1,313 @@
+""" Module to route tasks among several remote clusters """
+
+import sys
+import time
+import threading
+
+from biobb_remote.slurm import Slurm
+from biobb_remote.task import DataBundle, FINISHED, CANCELLED
+
+DEFAULT_BANDWIDTH = 10 * 1024 * 1024  # bytes/s
+DEFAULT_LOAD_WEIGHT = 600  # seconds per unit of load
+
+
+class Cluster():
+    """
+    | biobb_remote dispatcher.Cluster
+    | Remote cluster available to the dispatcher
+
+    Args:
+        name (str): Label for the cluster
+        credentials (SSHCredentials | str): SSHCredentials object or path to packed credentials file
+        host_config_path (str): Path to host configuration file
+        remote_base_path (str): Remote base path for task working dirs
+        task_class (class) (Optional): (Slurm) Task class for the cluster queue system
+        max_concurrent (int) (Optional): (10) Max tasks dispatched and not yet released
+        queue_settings (str) (Optional): (default) Base queue settings label
+        bandwidth (float) (Optional): (10 MB/s) Estimated upload bandwidth (bytes/s), used for transfer cost
+    """
+    def __init__(
+            self,
+            name,
+            credentials,
+            host_config_path,
+            remote_base_path,
+            task_class=Slurm,
+            max_concurrent=10,
+            queue_settings='default',
+            bandwidth=DEFAULT_BANDWIDTH
+            ):
+        self.name = name
+        self.credentials = credentials
+        self.host_config_path = host_config_path
+        self.remote_base_path = remote_base_path
+        self.task_class = task_class
+        self.max_concurrent = max_concurrent
+        self.queue_settings = queue_settings
+        self.bandwidth = bandwidth
+        self.active = {}
+        self.probe = self.new_task()
+
+    def new_task(self):
+        """
+        | Cluster.new_task
+        | Returns a new task with credentials and host configuration set
+        """
+        task = self.task_class()
+        task.set_credentials(self.credentials)
+        task.load_host_config(self.host_config_path)
+        return task
+
+    def has_free_slot(self):
+        """
+        | Cluster.has_free_slot
+        | Whether a new task can be dispatched
+        """
+        return len(self.active) < self.max_concurrent
+
+    def is_eligible(self, requirements):
+        """
+        | Cluster.is_eligible
+        | Whether the cluster can run a task with the given requirements
+
+        Args:
+            requirements (dict): prep_auto_settings arguments (total_cores, nodes, cpus_per_task, num_gpus)
+        """
+        host_config = self.probe.host_config
+        if requirements.get('num_gpus', 0) > host_config['gpus_per_node']:
+            return False
+        if requirements.get('cpus_per_task', 1) > host_config['cores_per_node']:
+            return False
+        if 'limit_nodes' in host_config:
+            nodes = requirements.get('nodes', 0) or \
+                -(-requirements.get('total_cores', 0) // host_config['cores_per_node'])
+            if nodes > host_config['limit_nodes']:
+                return False
+        return True
+
+
+class ClusterDispatcher():
+    """
+    | biobb_remote dispatcher.ClusterDispatcher
+    | Class to route tasks to the best of several clusters. Eligible clusters are scored by
+    | expected seconds to completion: estimated start time (or queue load if not available),
+    | input transfer time, predicted runtime (if a performance history is given), and for GPU
+    | jobs a penalty when the cluster has not enough idle GPU nodes.
+
+    Args:
+        clusters (list(Cluster)) (Optional): (None) Clusters available
+        history (PerformanceHistory) (Optional): (None) Performance history to predict runtimes
+        load_weight (float) (Optional): (600) Seconds added per unit of queue load
+        snapshot_ttl (float) (Optional): (60) Max age of queue snapshots (seconds)
+    """
+    def __init__(self, clusters=None, history=None, load_weight=DEFAULT_LOAD_WEIGHT, snapshot_ttl=60):
+        self.clusters = {}
+        for cluster in clusters or []:
+            self.add_cluster(cluster)
+        self.history = history
+        self.load_weight = load_weight
+        self.snapshot_ttl = snapshot_ttl
+        self.lock = threading.Condition()
+
+    def add_cluster(self, cluster):
+        """
+        | ClusterDispatcher.add_cluster
+        | Adds a cluster
+
+        Args:
+            cluster (Cluster): Cluster to add
+        """
+        self.clusters[cluster.name] = cluster
+
+    def score(self, cluster, requirements, input_size=0, local_run_script=''):
+        """
+        | ClusterDispatcher.score
+        | Expected seconds to completion on a cluster, None if not eligible
+
+        Args:
+            cluster (Cluster): Cluster to score
+            requirements (dict): prep_auto_settings arguments (total_cores, nodes, cpus_per_task, num_gpus)
+            input_size (int) (Optional): (0) Input size in bytes
+            local_run_script (str) (Optional): ('') Run script, to predict runtime from history
+        """
+        if not cluster.is_eligible(requirements):
+            return None
+        probe = cluster.probe
+        settings = probe.prep_auto_settings(**requirements)
+        details = {'transfer': input_size / float(cluster.bandwidth)}
+        try:
+            if hasattr(probe, 'estimate_start_delay'):
+                details['start'] = probe.estimate_start_delay(settings)
+                if details['start'] is None:
+                    return None
+            snapshot = probe.get_queue_snapshot(ttl=self.snapshot_ttl)
+        except (Exception, SystemExit) as err:
+            print("Warning: cluster {} not available: {}".format(cluster.name, err))
+            return None
+        if details.get('start') is None:
+            # Queue pressure is already in the start estimate when available
+            load = snapshot.get_load() if snapshot else None
+            details['load'] = self.load_weight * (load or 0.)
+        else:
+            details['load'] = 0.
+        details['gpu'] = self._gpu_penalty(cluster, requirements, snapshot)
+        details['runtime'] = 0.
+        if self.history and local_run_script:
+            predicted = self.history.predict(
+                probe.host_config['description'],
+                probe.get_script_fingerprint(local_run_script),
+                input_size,
+                settings
+            )
+            if predicted:
+                details['runtime'] = predicted
+        details['total'] = details.get('start') or 0.
+        details['total'] += details['transfer'] + details['load'] + details['gpu'] + details['runtime']
+        return details
+
+    def _gpu_penalty(self, cluster, requirements, snapshot):
+        """
+        | Private. ClusterDispatcher._gpu_penalty
+        | Seconds added when the GPU nodes needed are not idle, in proportion to the missing nodes.
+        | 0 for CPU jobs or when the snapshot has no GPU information
+        """
+        num_gpus = requirements.get('num_gpus', 0)
+        if not num_gpus or snapshot is None:
+            return 0.
+        idle = snapshot.get_idle_gpu_nodes()
+        if idle is None:
+            return 0.
+        # num_gpus is per node
+        needed = max(
+            requirements.get('nodes', 0) or
+            -(-requirements.get('total_cores', 0) // cluster.probe.host_config['cores_per_node']),
+            1
+        )
+        return self.load_weight * max(needed - idle, 0) / float(needed)
+
+    def rank(self, requirements, input_size=0, local_run_script=''):
+        """
+        | ClusterDispatcher.rank
+        | Eligible clusters sorted by score, as (cluster name, score details) tuples
+
+        Args:
+            requirements (dict): prep_auto_settings arguments (total_cores, nodes, cpus_per_task, num_gpus)
+            input_size (int) (Optional): (0) Input size in bytes
+            local_run_script (str) (Optional): ('') Run script, to predict runtime from history
+        """
+        ranking = []
+        for name, cluster in self.clusters.items():
+            details = self.score(cluster, requirements, input_size, local_run_script)
+            if details is not None:
+                ranking.append((name, details))
+        ranking.sort(key=lambda item: item[1]['total'])
+        return ranking
+
+    def dispatch(self, requirements, local_data_path, submit_args=None, wait=True, poll_time=30):
+        """
+        | ClusterDispatcher.dispatch
+        | Uploads input data and submits the task to the best cluster with a free slot.
+        | Returns the submitted task. Call release (or check_active) when the task is done.
+
+        Args:
+            requirements (dict): prep_auto_settings arguments (total_cores, nodes, cpus_per_task, num_gpus)
+            local_data_path (str): Local directory with input data
+            submit_args (dict) (Optional): (None) Additional arguments to Task.submit (local_run_script, modules, ...)
+            wait (bool) (Optional): (True) Wait for a free slot if all eligible clusters are full
+            poll_time (int) (Optional): (30) Interval to check for released slots when waiting (seconds)
+        """
+        submit_args = dict(submit_args or {})
+        # Probe tasks are shared by concurrent dispatches, only measure inputs here
+        input_bundle = DataBundle('dispatch_input')
+        input_bundle.add_dir(local_data_path)
+        input_size = input_bundle.get_total_size()
+        ranking = self.rank(requirements, input_size, submit_args.get('local_run_script', ''))
+        if not ranking:
+            sys.exit("Error: no eligible cluster for requirements {}".format(requirements))
+
+        with self.lock:
+            while True:
+                free = [
+                    (name, details) for name, details in ranking
+                    if self.clusters[name].has_free_slot()
+                ]
+                if free or not wait:
+                    break
+                self.lock.wait(poll_time)
+                self.check_active()
+            if not free:
+                return None
+            name, details = free[0]
+            cluster = self.clusters[name]
+            task = cluster.new_task()
+            cluster.active[task.id] = task
+
+        print("Dispatching task {} to {} (expected {:.0f}s)".format(task.id, name, details['total']))
+        try:
+            task.set_local_data_bundle(local_data_path)
+            task.send_input_data(cluster.remote_base_path)
+            submit_args.setdefault('queue_settings', cluster.queue_settings)
+            submit_args.setdefault('launch_profile', task.prep_launch_profile(**requirements))
+            task.submit(**submit_args)
+        except (Exception, SystemExit):
+            self.release(task)
+            raise
+        task.task_data['dispatch'] = {
+            'cluster': name,
+            'scores': {cl_name: cl_details for cl_name, cl_details in ranking}
+        }
+        task.modified = True
+        return task
+
+    def release(self, task):
+        """
+        | ClusterDispatcher.release
+        | Frees the slot used by a task
+
+        Args:
+            task (Task): Dispatched task
+        """
+        with self.lock:
+            for cluster in self.clusters.values():
+                cluster.active.pop(task.id, None)
+            self.lock.notify_all()
+
+    def check_active(self):
+        """
+        | ClusterDispatcher.check_active
+        | Updates status of dispatched tasks and releases finished or cancelled ones. Returns released tasks.
+        """
+        done = []
+        with self.lock:
+            active = [task for cluster in self.clusters.values() for task in cluster.active.values()]
+        for task in active:
+            # Tasks holding a slot while still uploading or submitting have no job yet
+            if not task.task_data.get('remote_job_id'):
+                continue
+            if task._check_job_status() in (FINISHED, CANCELLED):
+                done.append(task)
+        for task in done:
+            self.release(task)
+        return done
+
+    def get_active_counts(self):
+        """
+        | ClusterDispatcher.get_active_counts
+        | Number of dispatched, not released, tasks per cluster
+        """
+        return {name: len(cluster.active) for name, cluster in self.clusters.items()}
+
+    def wait_all(self, poll_time=60):
+        """
+        | ClusterDispatcher.wait_all
+        | Waits until all dispatched tasks are finished. Returns the tasks released.
+
+        Args:
+            poll_time (int) (Optional): (60) Polling interval (seconds)
+        """
+        released = []
+        while any(cluster.active for cluster in self.clusters.values()):
+            released += self.check_active()
+            if any(cluster.active for cluster in self.clusters.values()):
+                time.sleep(poll_time)
+        return released
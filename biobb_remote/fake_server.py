@@ -0,0 +1,426 @@
+""" Module providing an in-process SSH/SFTP server for offline tests and benchmarks """
+
+import os
+import time
+import queue
+import socket
+import struct
+import getpass
+import threading
+import subprocess
+
+import paramiko
+from paramiko import ServerInterface, SFTPServerInterface, SFTPServer, SFTPAttributes, SFTPHandle, RSAKey
+from paramiko.sftp import SFTP_OK
+from paramiko.common import cMSG_CHANNEL_SUCCESS
+
+from biobb_remote.ssh_credentials import SSHCredentials
+
+LOCAL_ADDRESS = '127.0.0.1'
+
+
+def run_shell_command(command, env=None):
+    """
+    | fake_server.run_shell_command
+    | Default command handler, runs command in a local bash shell. Returns stdout, stderr, exit code
+
+    Args:
+        command (str): Command line
+        env (dict) (Optional): (None) Environment for the command
+    """
+    proc = subprocess.run(['bash', '-c', command], stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    return proc.stdout, proc.stderr, proc.returncode
+
+
+class _LocalSFTPHandle(SFTPHandle):
+    """
+    | Private. fake_server._LocalSFTPHandle
+    | Handle on a local file
+    """
+    def stat(self):
+        try:
+            return SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def chattr(self, attr):
+        try:
+            SFTPServer.set_file_attr(self.filename, attr)
+            return SFTP_OK
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+
+class _LocalSFTPServer(SFTPServerInterface):
+    """
+    | Private. fake_server._LocalSFTPServer
+    | SFTP operations on the local file system (paths are used as given, no chroot)
+    """
+    def list_folder(self, path):
+        try:
+            out = []
+            for file_name in os.listdir(path):
+                attr = SFTPAttributes.from_stat(os.lstat(os.path.join(path, file_name)))
+                attr.filename = file_name
+                out.append(attr)
+            return out
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def stat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.stat(path))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def lstat(self, path):
+        try:
+            return SFTPAttributes.from_stat(os.lstat(path))
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+    def open(self, path, flags, attr):
+        try:
+            binary_flag = getattr(os, 'O_BINARY', 0)
+            flags |= binary_flag
+            mode = getattr(attr, 'st_mode', None) or 0o666
+            fd = os.open(path, flags, mode)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        if (flags & os.O_CREAT) and (attr is not None):
+            attr._flags &= ~attr.FLAG_PERMISSIONS
+            SFTPServer.set_file_attr(path, attr)
+        if flags & os.O_WRONLY:
+            fstr = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            fstr = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            fstr = 'rb'
+        try:
+            file_obj = os.fdopen(fd, fstr)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        handle = _LocalSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = file_obj
+        handle.writefile = file_obj
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(oldpath, newpath)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(path)
+            if attr is not None:
+                SFTPServer.set_file_attr(path, attr)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def rmdir(self, path):
+        try:
+            os.rmdir(path)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def chattr(self, path, attr):
+        try:
+            SFTPServer.set_file_attr(path, attr)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def symlink(self, target_path, path):
+        try:
+            os.symlink(target_path, path)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+        return SFTP_OK
+
+    def readlink(self, path):
+        try:
+            return os.readlink(path)
+        except OSError as err:
+            return SFTPServer.convert_errno(err.errno)
+
+
+class _ServerInterface(ServerInterface):
+    """
+    | Private. fake_server._ServerInterface
+    | Accepts the authorized key, and runs exec requests in worker threads
+    """
+    def __init__(self, server):
+        self.server = server
+
+    def get_allowed_auths(self, username):
+        return 'publickey'
+
+    def check_auth_publickey(self, username, key):
+        if self.server.authorized_key is None or key == self.server.authorized_key:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_exec_request(self, channel, command):
+        self.server._exec_accepted[id(channel.transport), channel.remote_chanid] = threading.Event()
+        threading.Thread(
+            target=self.server._run_exec, args=(channel, command.decode()), daemon=True
+        ).start()
+        return True
+
+
+class FakeSSHServer():
+    """
+    | biobb_remote fake_server.FakeSSHServer
+    | In-process SSH/SFTP server listening on localhost, for tests and benchmarks without a real host.
+    | Commands run through command_handler (a local shell by default), SFTP works on the local file system.
+
+    Args:
+        port (int) (Optional): (0) Port to listen on, 0 to pick a free one
+        command_handler (function) (Optional): (None) Function (command, env) returning stdout, stderr (bytes or str) and exit code
+        env (dict) (Optional): (None) Environment for commands, defaults to the current one
+        authorized_key (PKey) (Optional): (None) Only key accepted, a new one is generated if not given
+    """
+    def __init__(self, port=0, command_handler=None, env=None, authorized_key=None):
+        self.command_handler = command_handler or run_shell_command
+        self.env = env or dict(os.environ)
+        self.host_key = RSAKey.generate(2048)
+        self.authorized_key = authorized_key or RSAKey.generate(2048)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((LOCAL_ADDRESS, port))
+        self.port = self.sock.getsockname()[1]
+        self.transports = []
+        self.commands_run = 0
+        self._exec_accepted = {}
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """
+        | FakeSSHServer.start
+        | Starts accepting connections in a background thread
+        """
+        self.sock.listen(100)
+        self._running = True
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """
+        | FakeSSHServer.stop
+        | Closes all connections and the listening socket
+        """
+        self._running = False
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+        for transport in self.transports:
+            transport.close()
+        self.transports = []
+
+    def get_credentials(self, userid=None):
+        """
+        | FakeSSHServer.get_credentials
+        | SSHCredentials to connect to the server
+
+        Args:
+            userid (str) (Optional): (None) User id, defaults to the current user
+        """
+        credentials = SSHCredentials(
+            host=LOCAL_ADDRESS, userid=userid or getpass.getuser(), look_for_keys=False, port=self.port
+        )
+        credentials.key = self.authorized_key
+        return credentials
+
+    def _accept_loop(self):
+        """
+        | Private. FakeSSHServer._accept_loop
+        | Accepts connections and starts a paramiko server transport for each
+        """
+        while self._running:
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            client.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            transport = paramiko.Transport(client)
+            transport.add_server_key(self.host_key)
+            transport.set_subsystem_handler('sftp', SFTPServer, _LocalSFTPServer)
+            self._watch_replies(transport)
+            try:
+                transport.start_server(server=_ServerInterface(self))
+            except (paramiko.SSHException, EOFError):
+                transport.close()
+                continue
+            self.transports.append(transport)
+
+    def _watch_replies(self, transport):
+        """
+        | Private. FakeSSHServer._watch_replies
+        | Flags exec requests once accepted. The reply is sent by the transport thread after
+        | check_channel_exec_request returns, the channel must not be closed before that.
+        """
+        send_user_message = transport._send_user_message
+
+        def _send(message):
+            send_user_message(message)
+            data = message.asbytes()
+            if data[:1] == cMSG_CHANNEL_SUCCESS:
+                event = self._exec_accepted.pop((id(transport), struct.unpack('>I', data[1:5])[0]), None)
+                if event:
+                    event.set()
+        transport._send_user_message = _send
+
+    def _run_exec(self, channel, command):
+        """
+        | Private. FakeSSHServer._run_exec
+        | Runs a command and sends its output and exit status back
+        """
+        self.commands_run += 1
+        accepted = self._exec_accepted.get((id(channel.transport), channel.remote_chanid))
+        try:
+            stdout, stderr, code = self.command_handler(command, self.env)
+        except Exception as err:
+            stdout, stderr, code = '', 'fake_server: {}\n'.format(err), 1
+        if accepted:
+            accepted.wait(5)
+        try:
+            if stdout:
+                channel.sendall(stdout.encode() if isinstance(stdout, str) else stdout)
+            if stderr:
+                channel.sendall_stderr(stderr.encode() if isinstance(stderr, str) else stderr)
+            channel.send_exit_status(code)
+        finally:
+            channel.close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class LatencyProxy():
+    """
+    | biobb_remote fake_server.LatencyProxy
+    | TCP proxy on localhost adding latency and a bandwidth limit, to emulate a remote link.
+    | Each direction is delayed and limited independently.
+
+    Args:
+        target_port (int): Local port to forward to
+        latency (float) (Optional): (0) One-way delay (seconds)
+        bandwidth (float) (Optional): (0) Max bytes/s per direction, 0 for no limit
+        port (int) (Optional): (0) Port to listen on, 0 to pick a free one
+    """
+    def __init__(self, target_port, latency=0., bandwidth=0., port=0):
+        self.target_port = target_port
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind((LOCAL_ADDRESS, port))
+        self.port = self.sock.getsockname()[1]
+        self.connections = []
+        self._running = False
+
+    def start(self):
+        """
+        | LatencyProxy.start
+        | Starts accepting connections in a background thread
+        """
+        self.sock.listen(100)
+        self._running = True
+        threading.Thread(target=self._accept_loop, daemon=True).start()
+        return self
+
+    def stop(self):
+        """
+        | LatencyProxy.stop
+        | Closes all connections and the listening socket
+        """
+        self._running = False
+        for sock in [self.sock] + self.connections:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        self.connections = []
+
+    def _accept_loop(self):
+        while self._running:
+            try:
+                client, addr = self.sock.accept()
+            except OSError:
+                break
+            server = socket.create_connection((LOCAL_ADDRESS, self.target_port))
+            for sock in (client, server):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.connections += [client, server]
+            for src, dst in ((client, server), (server, client)):
+                chunks = queue.Queue()
+                threading.Thread(target=self._read, args=(src, chunks), daemon=True).start()
+                threading.Thread(target=self._write, args=(dst, chunks), daemon=True).start()
+
+    def _read(self, src, chunks):
+        """
+        | Private. LatencyProxy._read
+        | Queues incoming data with its due time
+        """
+        while True:
+            try:
+                data = src.recv(65536)
+            except OSError:
+                data = b''
+            chunks.put((time.time() + self.latency, data))
+            if not data:
+                break
+
+    def _write(self, dst, chunks):
+        """
+        | Private. LatencyProxy._write
+        | Forwards data once due, at most at bandwidth bytes/s
+        """
+        next_free = 0.
+        while True:
+            due, data = chunks.get()
+            wait = max(due, next_free) - time.time()
+            if wait > 0:
+                time.sleep(wait)
+            if not data:
+                try:
+                    dst.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                break
+            try:
+                dst.sendall(data)
+            except OSError:
+                break
+            if self.bandwidth:
+                next_free = max(next_free, time.time()) + len(data) / float(self.bandwidth)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,706 @@
+""" Module simulating a SLURM queue manager on the local host, for offline tests and benchmarks """
+
+import os
+import sys
+import json
+import time
+import shlex
+import fcntl
+import signal
+import getpass
+import argparse
+import threading
+import subprocess
+
+from os.path import join as opj
+
+# paramiko (through fake_server) is imported only when needed, to keep the mock executables start-up light
+from biobb_remote.perf_history import parse_time
+
+FAKE_COMMANDS = ['sbatch', 'squeue', 'scancel', 'sacct']
+FAKE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Run script line to set the simulated runtime of a job (seconds)
+RUNTIME_TAG = '#FAKE_SLURM runtime='
+SHELL_CHARS = set(';&|<>()$`\\"\'*?[]#~\n')
+SQUEUE_DEFAULT_FORMAT = '%i %P %j %u %t %M %D %R'
+SQUEUE_FIELDS = {
+    'i': 'id', 'P': 'partition', 'j': 'name', 'u': 'user', 't': 'state_code', 'T': 'state',
+    'M': 'time_used', 'D': 'nodes', 'R': 'reason', 'S': 'start'
+}
+STATE_CODES = {'PENDING': 'PD', 'RUNNING': 'R'}
+SBATCH_OPTIONS = {
+    '-J': 'name', '--job-name': 'name',
+    '-D': 'wdir', '--chdir': 'wdir',
+    '-o': 'stdout', '--output': 'stdout',
+    '-e': 'stderr', '--error': 'stderr',
+    '-p': 'partition', '--partition': 'partition',
+    '-t': 'time', '--time': 'time',
+    '--nodes': 'nodes', '-N': 'nodes'
+}
+
+
+class FakeScheduler():
+    """
+    | biobb_remote fake_slurm.FakeScheduler
+    | Simulated SLURM scheduler. Jobs are kept as files in a state directory, so the mock
+    | executables (sbatch, squeue, scancel, sacct) and the in-process server share them.
+    | A job is pending for queue_delay seconds and running for its runtime. With execute set,
+    | the script is also run at submission, and the job ends when both the script and the runtime are done.
+
+    Args:
+        state_dir (str): Directory to keep jobs
+        queue_delay (float) (Optional): (0) Seconds jobs remain pending
+        runtime (float) (Optional): (0) Default simulated runtime (seconds). Use '#FAKE_SLURM runtime=N' in a script to override
+        execute (bool) (Optional): (False) Run job scripts
+        partition (str) (Optional): ('main') Partition name
+    """
+    def __init__(self, state_dir, queue_delay=0., runtime=0., execute=False, partition='main'):
+        self.state_dir = state_dir
+        self.jobs_dir = opj(state_dir, 'jobs')
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.config = {
+            'queue_delay': queue_delay,
+            'runtime': runtime,
+            'execute': execute,
+            'partition': partition
+        }
+        with open(opj(state_dir, 'config.json'), 'w') as config_file:
+            json.dump(self.config, config_file)
+        self.processes = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_state_dir(cls, state_dir):
+        """
+        | FakeScheduler.from_state_dir
+        | Scheduler using an existing state directory (as used by the mock executables)
+
+        Args:
+            state_dir (str): State directory
+        """
+        scheduler = cls.__new__(cls)
+        scheduler.state_dir = state_dir
+        scheduler.jobs_dir = opj(state_dir, 'jobs')
+        with open(opj(state_dir, 'config.json')) as config_file:
+            scheduler.config = json.load(config_file)
+        scheduler.processes = {}
+        scheduler.lock = threading.Lock()
+        return scheduler
+
+    def install_commands(self, bin_dir=None):
+        """
+        | FakeScheduler.install_commands
+        | Writes sbatch, squeue, scancel and sacct executables using this state directory. Returns bin dir
+
+        Args:
+            bin_dir (str) (Optional): (None) Directory for the executables, defaults to state_dir/bin
+        """
+        bin_dir = bin_dir or opj(self.state_dir, 'bin')
+        os.makedirs(bin_dir, exist_ok=True)
+        pkg_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        for command in FAKE_COMMANDS:
+            path = opj(bin_dir, command)
+            with open(path, 'w') as cmd_file:
+                cmd_file.write(
+                    '#!/bin/sh\nPYTHONPATH={root}${{PYTHONPATH:+:$PYTHONPATH}} exec {python} -m biobb_remote.fake_slurm {state} {cmd} "$@"\n'.format(
+                        root=shlex.quote(pkg_root),
+                        python=shlex.quote(sys.executable),
+                        state=shlex.quote(self.state_dir),
+                        cmd=command
+                    )
+                )
+            os.chmod(path, 0o755)
+        return bin_dir
+
+    def run(self, command, args):
+        """
+        | FakeScheduler.run
+        | Runs a mock command, returns stdout, stderr, exit code
+
+        Args:
+            command (str): sbatch, squeue, scancel or sacct
+            args (list(str)): Command arguments
+        """
+        if command not in FAKE_COMMANDS:
+            return '', '{}: command not found\n'.format(command), 127
+        return getattr(self, command)(args)
+
+    # Job store
+    def _job_path(self, job_id):
+        return opj(self.jobs_dir, '{}.json'.format(job_id))
+
+    def _new_job_id(self):
+        """
+        | Private. FakeScheduler._new_job_id
+        | Next job id, shared with other processes using the same state dir
+        """
+        with open(opj(self.state_dir, 'last_id'), 'a+') as id_file:
+            fcntl.flock(id_file, fcntl.LOCK_EX)
+            id_file.seek(0)
+            last_id = int(id_file.read() or 0) + 1
+            id_file.seek(0)
+            id_file.truncate()
+            id_file.write(str(last_id))
+            fcntl.flock(id_file, fcntl.LOCK_UN)
+        return last_id
+
+    def load_job(self, job_id):
+        """
+        | FakeScheduler.load_job
+        | Returns a job record, None if unknown
+
+        Args:
+            job_id (str): Job id
+        """
+        try:
+            with open(self._job_path(job_id)) as job_file:
+                return json.load(job_file)
+        except (IOError, ValueError):
+            return None
+
+    def _save_job(self, job):
+        tmp_path = self._job_path(job['id']) + '.tmp'
+        with open(tmp_path, 'w') as job_file:
+            json.dump(job, job_file)
+        os.replace(tmp_path, self._job_path(job['id']))
+
+    def get_job_ids(self):
+        """
+        | FakeScheduler.get_job_ids
+        | All job ids, in submission order
+        """
+        return sorted(
+            int(file[:-5]) for file in os.listdir(self.jobs_dir) if file.endswith('.json')
+        )
+
+    def get_state(self, job, now=None):
+        """
+        | FakeScheduler.get_state
+        | Current state, start and end times of a job
+
+        Args:
+            job (dict): Job record
+            now (float) (Optional): (None) Reference time, defaults to now
+        """
+        now = now or time.time()
+        start = job['submit'] + job['delay']
+        if job['cancelled'] is not None:
+            # Only pending or running jobs are cancelled
+            return 'CANCELLED', start if job['cancelled'] >= start else None, job['cancelled']
+        if now < start:
+            return 'PENDING', start, None
+        runtime = job['runtime']
+        timeout = job['time_limit'] is not None and runtime > job['time_limit']
+        if timeout:
+            runtime = job['time_limit']
+        end = start + runtime
+        if job['execute']:
+            exit_code = self._get_exit_code(job)
+            if exit_code is None:
+                return 'RUNNING', start, None
+            end = max(end, exit_code[1])
+            if now < end:
+                return 'RUNNING', start, None
+            if exit_code[0] != 0 and not timeout:
+                return 'FAILED', start, end
+        elif now < end:
+            return 'RUNNING', start, None
+        return ('TIMEOUT' if timeout else 'COMPLETED'), start, end
+
+    def _get_exit_code(self, job):
+        """
+        | Private. FakeScheduler._get_exit_code
+        | Exit code and end time of an executed script, None if still running
+        """
+        process = self.processes.get(job['id'])
+        if process is not None and process.poll() is not None:
+            del self.processes[job['id']]
+        exit_path = self._job_path(job['id']) + '.exit'
+        try:
+            with open(exit_path) as exit_file:
+                return int(exit_file.read().strip() or 1), os.path.getmtime(exit_path)
+        except (IOError, ValueError):
+            return None
+
+    # Commands
+    def sbatch(self, args):
+        """
+        | FakeScheduler.sbatch
+        | Submits a script. Supports --test-only and the options used in #SBATCH lines
+        """
+        test_only = '--test-only' in args
+        args = [arg for arg in args if arg not in ('--test-only', '--parsable')]
+        if not args:
+            return '', 'sbatch: error: no script given\n', 1
+        script_path = args[-1]
+        try:
+            with open(script_path) as script_file:
+                script = script_file.read()
+        except IOError as err:
+            return '', 'sbatch: error: {}\n'.format(err), 1
+        options = self._parse_options(script, args[:-1])
+        job_id = self._new_job_id()
+        submit = time.time()
+        if test_only:
+            return '', 'sbatch: Job {} to start at {} using 1 processors on nodes fake1 in partition {}\n'.format(
+                job_id, _fmt_time(submit + self.config['queue_delay']), options['partition']
+            ), 0
+        job = {
+            'id': job_id,
+            'name': options['name'] or os.path.basename(script_path),
+            'script': script_path,
+            'wdir': options['wdir'] or os.path.dirname(os.path.abspath(script_path)),
+            'stdout': options['stdout'] or 'slurm-{}.out'.format(job_id),
+            'stderr': options['stderr'] or options['stdout'] or 'slurm-{}.out'.format(job_id),
+            'partition': options['partition'],
+            'nodes': options['nodes'],
+            'user': getpass.getuser(),
+            'submit': submit,
+            'delay': self.config['queue_delay'],
+            'runtime': options['runtime'],
+            'time_limit': options['time_limit'],
+            'execute': self.config['execute'],
+            'cancelled': None,
+            'pid': None
+        }
+        if job['execute']:
+            job['pid'] = self._execute(job)
+        self._save_job(job)
+        return 'Submitted batch job {}\n'.format(job_id), '', 0
+
+    def _parse_options(self, script, args):
+        """
+        | Private. FakeScheduler._parse_options
+        | Job options from #SBATCH lines, overridden by command line arguments
+        """
+        options = {
+            'name': None, 'wdir': None, 'stdout': None, 'stderr': None,
+            'partition': self.config['partition'], 'nodes': 1,
+            'runtime': self.config['runtime'], 'time_limit': None
+        }
+        words = []
+        for line in script.split('\n'):
+            if line.startswith('#SBATCH'):
+                words += shlex.split(line[len('#SBATCH'):])
+            elif line.startswith(RUNTIME_TAG):
+                options['runtime'] = float(line[len(RUNTIME_TAG):])
+        words += args
+        i = 0
+        while i < len(words):
+            word = words[i]
+            if '=' in word and word.startswith('--'):
+                key, value = word.split('=', 1)
+            elif word in SBATCH_OPTIONS and i + 1 < len(words):
+                key, value = word, words[i + 1]
+                i += 1
+            else:
+                key, value = word, None
+            if key in SBATCH_OPTIONS and value is not None:
+                options[SBATCH_OPTIONS[key]] = value
+            i += 1
+        if options.get('time'):
+            options['time_limit'] = parse_time(options['time'])
+        options['nodes'] = int(options['nodes'])
+        return options
+
+    def _execute(self, job):
+        """
+        | Private. FakeScheduler._execute
+        | Starts the job script in its working dir, recording the exit code when done
+        """
+        wrapper = 'bash {script} > {out} 2> {err}; echo $? > {exit}'.format(
+            script=shlex.quote(job['script']),
+            out=shlex.quote(opj(job['wdir'], job['stdout'])),
+            err=shlex.quote(opj(job['wdir'], job['stderr'])),
+            exit=shlex.quote(self._job_path(job['id']) + '.exit')
+        )
+        env = dict(os.environ, SLURM_JOB_ID=str(job['id']))
+        process = subprocess.Popen(
+            ['bash', '-c', wrapper], cwd=job['wdir'], env=env,
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            start_new_session=True
+        )
+        with self.lock:
+            self.processes[job['id']] = process
+        return process.pid
+
+    def squeue(self, args):
+        """
+        | FakeScheduler.squeue
+        | Lists pending and running jobs. Supports -h, -j/--job, -u, --start and -o
+        """
+        parser = argparse.ArgumentParser(prog='squeue', add_help=False)
+        parser.add_argument('-h', '--noheader', action='store_true')
+        parser.add_argument('-j', '--job', '--jobs', dest='jobs')
+        parser.add_argument('-u', '--user', dest='user')
+        parser.add_argument('-a', '--all', action='store_true')
+        parser.add_argument('--start', action='store_true')
+        parser.add_argument('-o', '--format', dest='format')
+        try:
+            opts, unknown = parser.parse_known_args(args)
+        except SystemExit:
+            return '', 'squeue: error: invalid arguments\n', 1
+        fmt = opts.format or ('%i %P %j %u %t %S' if opts.start else SQUEUE_DEFAULT_FORMAT)
+        if opts.jobs:
+            job_ids = opts.jobs.split(',')
+        else:
+            job_ids = self.get_job_ids()
+        now = time.time()
+        lines = []
+        if not opts.noheader:
+            lines.append(fmt)
+        for job_id in job_ids:
+            job = self.load_job(job_id)
+            if job is None:
+                if opts.jobs:
+                    return '', 'slurm_load_jobs error: Invalid job id specified\n', 1
+                continue
+            if opts.user and job['user'] != opts.user:
+                continue
+            state, start, end = self.get_state(job, now)
+            if state not in STATE_CODES:
+                continue
+            if opts.start and state != 'PENDING':
+                continue
+            lines.append(_format_line(fmt, self._squeue_values(job, state, start, now)))
+        return ''.join(line + '\n' for line in lines), '', 0
+
+    def _squeue_values(self, job, state, start, now):
+        used = int(now - start) if state == 'RUNNING' else 0
+        return {
+            'id': job['id'],
+            'partition': job['partition'],
+            'name': job['name'],
+            'user': job['user'],
+            'state_code': STATE_CODES[state],
+            'state': state,
+            'time_used': '{}:{:02d}'.format(used // 60, used % 60),
+            'nodes': job['nodes'],
+            'reason': '(Priority)' if state == 'PENDING' else 'fake1',
+            'start': _fmt_time(start)
+        }
+
+    def scancel(self, args):
+        """
+        | FakeScheduler.scancel
+        | Cancels jobs given by id
+        """
+        for job_id in args:
+            if job_id.startswith('-'):
+                continue
+            job = self.load_job(job_id)
+            if job is None:
+                return '', 'scancel: error: Invalid job id {}\n'.format(job_id), 1
+            if self.get_state(job)[0] not in ('PENDING', 'RUNNING') or job['cancelled'] is not None:
+                continue
+            job['cancelled'] = time.time()
+            if job['pid']:
+                try:
+                    os.killpg(job['pid'], signal.SIGTERM)
+                except (ProcessLookupError, PermissionError):
+                    pass
+            self._save_job(job)
+        return '', '', 0
+
+    def sacct(self, args):
+        """
+        | FakeScheduler.sacct
+        | Accounting records. Supports -n, -X, -P, -j and -o (JobID, JobName, State, ElapsedRaw, Submit, Start, End)
+        """
+        parser = argparse.ArgumentParser(prog='sacct', add_help=False)
+        parser.add_argument('-n', '--noheader', action='store_true')
+        parser.add_argument('-X', '--allocations', action='store_true')
+        parser.add_argument('-P', '--parsable2', action='store_true')
+        parser.add_argument('-j', '--jobs', dest='jobs')
+        parser.add_argument('-o', '--format', dest='format', default='JobID,JobName,State,ElapsedRaw')
+        try:
+            opts, unknown = parser.parse_known_args(args)
+        except SystemExit:
+            return '', 'sacct: error: invalid arguments\n', 1
+        fields = opts.format.split(',')
+        sep = '|' if opts.parsable2 else ' '
+        job_ids = opts.jobs.split(',') if opts.jobs else self.get_job_ids()
+        now = time.time()
+        lines = [] if opts.noheader else [sep.join(fields)]
+        for job_id in job_ids:
+            job = self.load_job(job_id)
+            if job is None:
+                continue
+            state, start, end = self.get_state(job, now)
+            if state == 'CANCELLED':
+                state = 'CANCELLED by {}'.format(os.getuid())
+            values = {
+                'JobID': job['id'],
+                'JobName': job['name'],
+                'State': state,
+                'ElapsedRaw': int((end or now) - start) if start and start <= now else 0,
+                'Submit': _fmt_time(job['submit']),
+                'Start': _fmt_time(start) if start and start <= now else 'Unknown',
+                'End': _fmt_time(end) if end else 'Unknown'
+            }
+            lines.append(sep.join(str(values.get(field, '')) for field in fields))
+        return ''.join(line + '\n' for line in lines), '', 0
+
+
+class FakeSlurmCluster():
+    """
+    | biobb_remote fake_slurm.FakeSlurmCluster
+    | In-process SSH/SFTP server in front of a FakeScheduler. Simple invocations of the mock
+    | commands are served in-process, anything else runs in a local shell with the mock executables in PATH.
+
+    Args:
+        state_dir (str): Directory for scheduler state and mock executables
+        queue_delay (float) (Optional): (0) Seconds jobs remain pending
+        runtime (float) (Optional): (0) Default simulated runtime (seconds)
+        execute (bool) (Optional): (False) Run job scripts
+        in_process (bool) (Optional): (True) Serve simple mock command invocations without starting a process
+    """
+    def __init__(self, state_dir, queue_delay=0., runtime=0., execute=False, in_process=True):
+        from biobb_remote.fake_server import FakeSSHServer
+        self.scheduler = FakeScheduler(state_dir, queue_delay=queue_delay, runtime=runtime, execute=execute)
+        bin_dir = self.scheduler.install_commands()
+        env = dict(os.environ)
+        env['PATH'] = bin_dir + os.pathsep + env.get('PATH', '')
+        self.in_process = in_process
+        self.server = FakeSSHServer(command_handler=self._handle_command, env=env)
+
+    def _handle_command(self, command, env):
+        """
+        | Private. FakeSlurmCluster._handle_command
+        | Serves mock commands in-process, other commands through the shell
+        """
+        if self.in_process and not SHELL_CHARS.intersection(command):
+            words = command.split()
+            if words and words[0] in FAKE_COMMANDS:
+                return self.scheduler.run(words[0], words[1:])
+        from biobb_remote.fake_server import run_shell_command
+        return run_shell_command(command, env)
+
+    def get_credentials(self):
+        """
+        | FakeSlurmCluster.get_credentials
+        | SSHCredentials to connect to the fake cluster
+        """
+        return self.server.get_credentials()
+
+    def get_host_config(self, cores_per_node=48):
+        """
+        | FakeSlurmCluster.get_host_config
+        | Host configuration for the fake cluster, in the same format as conf/*.json files
+
+        Args:
+            cores_per_node (int) (Optional): (48) Cores per node
+        """
+        return {
+            'description': 'Fake SLURM cluster',
+            'qsettings': {
+                'serial': {'ntasks': 1, 'cpus-per-task': 1, 'time': '01:00:00'},
+                'debug': {'time': '00:10:00', 'qos': 'debug'},
+                'default': 'serial'
+            },
+            'modules': {},
+            'login_hosts': [self.server.get_credentials().host],
+            'cores_per_node': cores_per_node,
+            'gpus_per_node': 0,
+            'min_cores_per_gpu': 0
+        }
+
+    def start(self):
+        """
+        | FakeSlurmCluster.start
+        | Starts the SSH server
+        """
+        self.server.start()
+        return self
+
+    def stop(self):
+        """
+        | FakeSlurmCluster.stop
+        | Stops the SSH server
+        """
+        self.server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def run_throughput_benchmark(
+        job_counts=(1, 100, 10000),
+        work_dir=None,
+        execute=False,
+        output_files=1,
+        file_size=1024,
+        in_process=True,
+        verbose=True
+        ):
+    """
+    | fake_slurm.run_throughput_benchmark
+    | Measures Slurm submit, status and download throughput against a FakeSlurmCluster.
+    | All tasks share one SSH connection. Returns a list of result dicts, one per job count.
+
+    Args:
+        job_counts (list(int)) (Optional): ((1, 100, 10000)) Number of jobs for each run
+        work_dir (str) (Optional): (None) Directory for fake cluster and data, a temporary one is used if not set
+        execute (bool) (Optional): (False) Run job scripts, each writing output_files files of file_size bytes
+        output_files (int) (Optional): (1) Output files per job (if execute)
+        file_size (int) (Optional): (1024) Size of output files (bytes)
+        in_process (bool) (Optional): (True) Serve mock commands in-process instead of running the executables
+        verbose (bool) (Optional): (True) Print progress
+    """
+    import shutil
+    import tempfile
+    from biobb_remote.slurm import Slurm
+    from biobb_remote.ssh_session import SSHSession
+    from biobb_remote.task import FINISHED, CANCELLED
+
+    tmp_dir = None
+    if not work_dir:
+        work_dir = tmp_dir = tempfile.mkdtemp(prefix='biobb_fake_slurm_')
+    script = '#script\n' + ''.join(
+        'head -c {} /dev/zero > out_{}.dat\n'.format(file_size, i) for i in range(output_files)
+    )
+    results = []
+    try:
+        for num_jobs in job_counts:
+            run_dir = opj(work_dir, 'run_{}'.format(num_jobs))
+            with FakeSlurmCluster(opj(run_dir, 'slurm'), execute=execute, in_process=in_process) as cluster:
+                credentials = cluster.get_credentials()
+                host_config = cluster.get_host_config()
+                session = SSHSession(ssh_data=credentials)
+                result = {'jobs': num_jobs, 'execute': execute, 'in_process': in_process}
+
+                tasks = []
+                t0 = time.time()
+                for i in range(num_jobs):
+                    task = Slurm(host=credentials.host, userid=credentials.userid, look_for_keys=False)
+                    task.ssh_data = credentials
+                    task.host_config = host_config
+                    task.ssh_session = session
+                    task.prep_remote_workdir(opj(run_dir, 'remote'))
+                    _quiet(task.submit, queue_settings='serial', local_run_script=script)
+                    tasks.append(task)
+                result['submit_time'] = time.time() - t0
+
+                t0 = time.time()
+                checks = 0
+                pending = tasks
+                while pending:
+                    checks += len(pending)
+                    pending = [task for task in pending if task._check_job_status() not in (FINISHED, CANCELLED)]
+                    if pending:
+                        time.sleep(0.1)
+                result['status_time'] = time.time() - t0
+                result['status_checks'] = checks
+
+                t0 = time.time()
+                files = 0
+                size = 0
+                os.makedirs(opj(run_dir, 'local'))
+                for i, task in enumerate(tasks):
+                    _quiet(task.get_output_data, opj(run_dir, 'local', str(i)))
+                    bundle = task.task_data['output_data_bundle']
+                    files += bundle.get_num_files()
+                    size += bundle.get_total_size()
+                result['download_time'] = time.time() - t0
+                result['download_files'] = files
+                result['download_bytes'] = size
+
+                for key, count in (('submit', num_jobs), ('status', checks), ('download', num_jobs)):
+                    elapsed = result[key + '_time']
+                    result[key + '_rate'] = count / elapsed if elapsed else None
+                result['commands_run'] = cluster.server.commands_run
+                session.close()
+            shutil.rmtree(run_dir, ignore_errors=True)
+            if verbose:
+                print(
+                    "{jobs} jobs: submit {submit_rate:.1f} jobs/s, status {status_rate:.1f} checks/s, "
+                    "download {download_rate:.1f} jobs/s".format(**result)
+                )
+            results.append(result)
+    finally:
+        if tmp_dir:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.2):
+    """
+    | fake_slurm.compare_results
+    | Rates falling more than tolerance below the baseline, as a list of messages
+
+    Args:
+        results (list(dict)): Results from run_throughput_benchmark
+        baseline (list(dict)): Reference results
+        tolerance (float) (Optional): (0.2) Allowed relative slowdown
+    """
+    reference = {(res['jobs'], res['execute'], res['in_process']): res for res in baseline}
+    regressions = []
+    for res in results:
+        ref = reference.get((res['jobs'], res['execute'], res['in_process']))
+        if not ref:
+            continue
+        for key in ('submit_rate', 'status_rate', 'download_rate'):
+            if ref.get(key) and res.get(key) is not None and res[key] < ref[key] * (1. - tolerance):
+                regressions.append(
+                    '{} jobs: {} {:.1f} < {:.1f} (baseline)'.format(res['jobs'], key, res[key], ref[key])
+                )
+    return regressions
+
+
+def _quiet(func, *args, **kwargs):
+    """
+    | Private. fake_slurm._quiet
+    | Calls func without printing per-file and per-job messages
+    """
+    import io
+    import contextlib
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args, **kwargs)
+
+
+def _format_line(fmt, values):
+    """
+    | Private. fake_slurm._format_line
+    | Expands squeue-like %X fields
+    """
+    out = []
+    i = 0
+    while i < len(fmt):
+        if fmt[i] == '%' and i + 1 < len(fmt):
+            j = i + 1
+            while j < len(fmt) and (fmt[j].isdigit() or fmt[j] in '.-'):
+                j += 1
+            if j < len(fmt):
+                out.append(str(values.get(SQUEUE_FIELDS.get(fmt[j], ''), '')))
+                i = j + 1
+                continue
+        out.append(fmt[i])
+        i += 1
+    return ''.join(out)
+
+
+def _fmt_time(value):
+    if value is None:
+        return 'N/A'
+    return time.strftime(FAKE_TIME_FORMAT, time.localtime(value))
+
+
+def main():
+    """
+    | fake_slurm.main
+    | Entry point of the mock executables: python -m biobb_remote.fake_slurm state_dir command [args]
+    """
+    if len(sys.argv) < 3:
+        sys.exit('usage: fake_slurm state_dir command [args]')
+    scheduler = FakeScheduler.from_state_dir(sys.argv[1])
+    stdout, stderr, code = scheduler.run(sys.argv[2], sys.argv[3:])
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
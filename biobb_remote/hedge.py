@@ -0,0 +1,254 @@
+""" Module to race copies of a task on several queues or clusters """
+
+import sys
+import time
+import threading
+
+from biobb_remote.task import SUBMITTED, RUNNING, CLOSING, FINISHED, CANCELLED
+from biobb_remote.perf_history import format_secs
+
+
+class HedgedSubmission():
+    """
+    | biobb_remote hedge.HedgedSubmission
+    | Class to submit copies of the same task to several queue profiles or clusters.
+    | Inputs are staged to all targets before any submission. The first copy found running
+    | (or finished, if accounting reports it completed) wins, the others are cancelled.
+    | Copies ending with any other state are discarded. Time-to-start saved with respect to the first target
+    | (the single submission that would have been made otherwise) is reported.
+
+    Args:
+        local_data_path (str): Local directory with input data
+        remote_base_path (str) (Optional): ('') Default remote base path for targets
+    """
+    def __init__(self, local_data_path, remote_base_path=''):
+        self.local_data_path = local_data_path
+        self.remote_base_path = remote_base_path
+        self.targets = []
+        self.winner = None
+        self.report = {}
+
+    def add_target(self, task, queue_settings='default', remote_base_path='', label=None, **submit_args):
+        """
+        | HedgedSubmission.add_target
+        | Adds a copy of the task. The first target added is taken as the reference submission.
+
+        Args:
+            task (Task): Task object (e.g. Slurm) with credentials and host configuration set
+            queue_settings (str) (Optional): (default) Queue settings label for this copy
+            remote_base_path (str) (Optional): ('') Remote base path, defaults to the common one
+            label (str) (Optional): (None) Label for reports, defaults to host description and queue settings
+            submit_args: Additional arguments to Task.submit for this copy (e.g. launch_profile)
+        """
+        if not label:
+            label = '{}:{}'.format(task.host_config['description'], queue_settings)
+        submit_args['queue_settings'] = queue_settings
+        self.targets.append({
+            'label': label,
+            'task': task,
+            'remote_base_path': remote_base_path or self.remote_base_path,
+            'submit_args': submit_args,
+            'submit_time': None,
+            'start_time': None,
+            'start_estimate': None,
+            'failed': None
+        })
+        return task
+
+    def add_queue_targets(self, task, queue_settings_list, remote_base_path=''):
+        """
+        | HedgedSubmission.add_queue_targets
+        | Adds copies of a task for several queue settings profiles on the same host
+
+        Args:
+            task (Task): Task object (e.g. Slurm) with credentials and host configuration set
+            queue_settings_list (list(str)): Queue settings labels (as defined in host configuration)
+            remote_base_path (str) (Optional): ('') Remote base path, defaults to the common one
+        """
+        for queue_settings in queue_settings_list:
+            copy = task.__class__()
+            copy.ssh_data = task.ssh_data
+            copy.host_config = task.host_config
+            copy.debug = task.debug
+            self.add_target(copy, queue_settings, remote_base_path)
+
+    def stage(self):
+        """
+        | HedgedSubmission.stage
+        | Uploads input data to all targets in parallel
+        """
+        errors = []
+
+        def _send(target):
+            try:
+                target['task'].set_local_data_bundle(self.local_data_path)
+                target['task'].send_input_data(target['remote_base_path'])
+            except (Exception, SystemExit) as err:
+                errors.append('{}: {}'.format(target['label'], err))
+
+        threads = [threading.Thread(target=_send, args=(target,)) for target in self.targets]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            sys.exit('Error while staging inputs: ' + '; '.join(errors))
+
+    def run(self, poll_time=30, remove_losers=True, timeout=0, **submit_args):
+        """
+        | HedgedSubmission.run
+        | Stages inputs, submits all copies, and waits for the first to start. Returns the winning task.
+
+        Args:
+            poll_time (int) (Optional): (30) Polling interval (seconds)
+            remove_losers (bool) (Optional): (True) Remove remote working dirs of cancelled copies
+            timeout (int) (Optional): (0) Max time to wait for a start (seconds), copies are kept queued on timeout. 0: no limit
+            submit_args: Arguments to Task.submit common to all copies (e.g. local_run_script, modules, job_name)
+        """
+        if not self.targets:
+            sys.exit("Error: no targets defined")
+        self.stage()
+
+        for target in self.targets:
+            args = dict(submit_args)
+            args.update(target['submit_args'])
+            args['poll_time'] = 0
+            target['task'].submit(**args)
+            target['submit_time'] = time.time()
+
+        t0 = time.time()
+        while self.winner is None:
+            for target in self.targets:
+                if target['failed']:
+                    continue
+                status = target['task']._check_job_status()
+                if status == FINISHED and not self._completed(target):
+                    continue
+                if status in (RUNNING, CLOSING, FINISHED):
+                    target['start_time'] = time.time()
+                    self.winner = target
+                    break
+            else:
+                if all(
+                        target['failed'] or target['task'].task_data['status'] == CANCELLED
+                        for target in self.targets
+                ):
+                    print("All copies were cancelled or failed")
+                    return None
+                if timeout and time.time() - t0 > timeout:
+                    print("No copy started after {}s".format(timeout))
+                    return None
+                time.sleep(poll_time)
+
+        self._cancel_losers(remove_losers)
+        self._build_report()
+        self.print_report()
+        winner_task = self.winner['task']
+        winner_task.task_data['hedge'] = self.report
+        winner_task.modified = True
+        return winner_task
+
+    def _completed(self, target):
+        """
+        | Private. HedgedSubmission._completed
+        | Whether a copy found finished ended correctly, from accounting. Copies with other
+        | end states are marked as failed. Taken as completed if no accounting is available
+        """
+        state = target['task'].get_job_accounting().get('state')
+        # Accounting may lag behind the queue for a few seconds
+        if state and state not in ('COMPLETED', 'COMPLETING', 'RUNNING'):
+            print("Copy {} ended with state {}, discarded".format(target['label'], state))
+            target['failed'] = state
+            return False
+        return True
+
+    def _cancel_losers(self, remove_data):
+        """
+        | Private. HedgedSubmission._cancel_losers
+        | Records start estimates of pending copies and cancels them
+        """
+        for target in self.targets:
+            if target is self.winner:
+                continue
+            task = target['task']
+            if task.task_data['status'] == SUBMITTED and hasattr(task, 'get_start_estimate'):
+                try:
+                    target['start_estimate'] = task.get_start_estimate()
+                except (Exception, SystemExit):
+                    target['start_estimate'] = None
+            task.cancel(remove_data=remove_data)
+
+    def _build_report(self):
+        """
+        | Private. HedgedSubmission._build_report
+        | Time to start of each copy, and time saved against the reference (first) target.
+        | Cancelled copies use their queue start estimate, if available.
+        """
+        now = time.time()
+        copies = []
+        for target in self.targets:
+            if target is self.winner:
+                time_to_start = self._get_time_to_start(target)
+            elif target['start_estimate'] is not None:
+                time_to_start = now - target['submit_time'] + target['start_estimate']
+            else:
+                time_to_start = None
+            copies.append({
+                'label': target['label'],
+                'job_id': target['task'].task_data['remote_job_id'],
+                'winner': target is self.winner,
+                'failed': target['failed'],
+                'time_to_start': time_to_start,
+                # Lower bound when no estimate is available
+                'waited': now - target['submit_time']
+            })
+        winner = copies[self.targets.index(self.winner)]
+        reference = copies[0]
+        if reference['winner']:
+            saved = 0.
+        elif reference['time_to_start'] is not None:
+            saved = reference['time_to_start'] - winner['time_to_start']
+        else:
+            saved = None
+        self.report = {
+            'winner': winner['label'],
+            'time_to_start': winner['time_to_start'],
+            'saved': saved,
+            'saved_min': max(0., reference['waited'] - winner['time_to_start']),
+            'copies': copies
+        }
+
+    def _get_time_to_start(self, target):
+        """
+        | Private. HedgedSubmission._get_time_to_start
+        | Queue wait of the winning copy, from accounting if available, otherwise as observed by polling
+        """
+        data = target['task'].get_job_accounting()
+        if data and data.get('wait') is not None:
+            return data['wait']
+        return target['start_time'] - target['submit_time']
+
+    def print_report(self, file=sys.stdout):
+        """
+        | HedgedSubmission.print_report
+        | Prints time to start per copy and time saved
+
+        Args:
+            file (file handle) (Optional): (sys.stdout) Output stream
+        """
+        if not self.report:
+            print("No report available", file=file)
+            return
+        print('{:30s} {:>12s} {:>14s}'.format('Copy', 'Job', 'To start(s)'), file=file)
+        for copy in self.report['copies']:
+            print(
+                '{:30s} {:>12s} {:>14s}{}'.format(
+                    copy['label'], str(copy['job_id']), format_secs(copy['time_to_start']),
+                    ' *' if copy['winner'] else (' ' + copy['failed'] if copy['failed'] else '')
+                ),
+                file=file
+            )
+        if self.report['saved'] is not None:
+            print("Time to start saved: {:.0f}s".format(self.report['saved']), file=file)
+        else:
+            print("Time to start saved: at least {:.0f}s".format(self.report['saved_min']), file=file)
@@ -0,0 +1,227 @@
+""" Module to share identical input files among tasks through a remote content-addressable store """
+
+import os
+import sys
+import shlex
+import hashlib
+import threading
+
+from os.path import join as opj
+
+CACHE_DIR = '.biobb_cache'
+HASH_ALGORITHM = 'sha256'
+# Max bytes per remote command, well below the 128 KiB limit of a single argument (the command
+# reaches the remote shell as sh -c <command>)
+COMMAND_BYTES = 64 * 1024
+LOCK_FILE = '.lock'
+MISSING_MARK = 'BIOBB_MISSING'
+
+_HASH_CACHE = {}
+_HASH_CACHE_LOCK = threading.Lock()
+
+
+def file_hash(file_path, size=None, mtime=None):
+    """
+    | input_cache.file_hash
+    | Content hash of a local file. Hashes are remembered by path, size and mtime
+
+    Args:
+        file_path (str): Path to file
+        size (int) (Optional): (None) File size, read from the file if not set
+        mtime (float) (Optional): (None) File modification time, read from the file if not set
+    """
+    if size is None or mtime is None:
+        stats = os.stat(file_path)
+        size, mtime = stats.st_size, stats.st_mtime
+    key = (file_path, size, mtime)
+    with _HASH_CACHE_LOCK:
+        if key in _HASH_CACHE:
+            return _HASH_CACHE[key]
+    digest = hashlib.new(HASH_ALGORITHM)
+    try:
+        with open(file_path, 'rb') as data_file:
+            for block in iter(lambda: data_file.read(1024 * 1024), b''):
+                digest.update(block)
+    except OSError as err:
+        sys.exit(err)
+    with _HASH_CACHE_LOCK:
+        _HASH_CACHE[key] = digest.hexdigest()
+    return _HASH_CACHE[key]
+
+
+class RemoteInputCache():
+    """
+    | biobb_remote input_cache.RemoteInputCache
+    | Content-addressable store of input files under remote_base_path/.biobb_cache.
+    | Blobs are named by content hash, uploaded once, made read-only and hard-linked
+    | (or symlinked, across file systems) into task working dirs.
+    | Each task using a blob leaves a reference in refs/<hash>/<task_id>; blobs without
+    | references are removed when tasks release them. References are added under a shared
+    | lock and released under an exclusive one (flock on .biobb_cache/.lock, where available),
+    | so a blob is never removed between being found and being referenced.
+
+    Args:
+        ssh_session (SSHSession): Open session on the remote host
+        remote_base_path (str): Remote base path of tasks, the store is created within
+    """
+    def __init__(self, ssh_session, remote_base_path):
+        self.ssh_session = ssh_session
+        self.cache_path = opj(remote_base_path, CACHE_DIR)
+        self.blobs_path = opj(self.cache_path, 'blobs')
+        self.refs_path = opj(self.cache_path, 'refs')
+        self.lock_path = opj(self.cache_path, LOCK_FILE)
+
+    def _lock(self, shared):
+        # Shell lines taking the store lock on fd 9 until the command ends
+        return 'exec 9>>{}; command -v flock >/dev/null && flock {} 9'.format(
+            shlex.quote(self.lock_path), '-s' if shared else '-x'
+        )
+
+    def _run(self, command):
+        stdout, stderr = self.ssh_session.run_command(command)
+        if stderr:
+            sys.exit('Error in remote input cache: ' + stderr)
+        return stdout
+
+    def prepare(self):
+        """
+        | RemoteInputCache.prepare
+        | Creates the store directories
+        """
+        self._run('mkdir -p {} {}'.format(shlex.quote(self.blobs_path), shlex.quote(self.refs_path)))
+
+    def get_missing(self, hashes):
+        """
+        | RemoteInputCache.get_missing
+        | Hashes not yet in the store
+
+        Args:
+            hashes (list(str)): Content hashes
+        """
+        hashes = sorted(set(hashes))
+        missing = set()
+        for chunk in _chunks(hashes, COMMAND_BYTES):
+            stdout = self._run(
+                'cd {} && for h in {}; do [ -e "$h" ] || echo "$h"; done'.format(
+                    shlex.quote(self.blobs_path), ' '.join(chunk)
+                )
+            )
+            missing.update(stdout.split())
+        return missing
+
+    def upload(self, local_path, blob_hash, task_id):
+        """
+        | RemoteInputCache.upload
+        | Uploads a file to a temporary name, link_files moves it in place
+
+        Args:
+            local_path (str): Local file path
+            blob_hash (str): Content hash
+            task_id (str): Id of the uploading task
+        """
+        self.ssh_session.run_sftp('put', local_path, self._tmp_path(blob_hash, task_id))
+
+    def _tmp_path(self, blob_hash, task_id):
+        return opj(self.blobs_path, '{}.tmp.{}'.format(blob_hash, task_id))
+
+    def link_files(self, task_wdir, task_id, file_hashes, uploaded=()):
+        """
+        | RemoteInputCache.link_files
+        | Moves uploaded blobs into the store (keeping any copy uploaded concurrently by another task),
+        | adds references for task_id and links blobs into the task working dir.
+        | Returns the hashes whose blob is no longer in the store (removed by a concurrent release
+        | after get_missing), their files are not linked and must be uploaded again
+
+        Args:
+            task_wdir (str): Remote working dir of the task
+            task_id (str): Task id
+            file_hashes (dict): {file name: content hash}
+            uploaded (list(str)) (Optional): (()) Hashes uploaded by this task
+        """
+        files_by_hash = {}
+        for file_name, blob_hash in sorted(file_hashes.items()):
+            files_by_hash.setdefault(blob_hash, []).append(file_name)
+        # One block per blob, so that the blob is checked, referenced and linked in the same command
+        blocks = []
+        for blob_hash, file_names in sorted(files_by_hash.items()):
+            blob_path = shlex.quote(opj(self.blobs_path, blob_hash))
+            ref_dir = shlex.quote(opj(self.refs_path, blob_hash))
+            lines = []
+            if blob_hash in uploaded:
+                lines.append(
+                    'if [ -e {blob} ]; then rm -f {tmp}; else chmod a-w {tmp} && mv {tmp} {blob}; fi'.format(
+                        tmp=shlex.quote(self._tmp_path(blob_hash, task_id)), blob=blob_path
+                    )
+                )
+            lines.append('if [ -e {} ]; then'.format(blob_path))
+            lines.append('mkdir -p {0} && touch {0}/{1}'.format(ref_dir, task_id))
+            for file_name in file_names:
+                lines.append('ln -f {0} {1} 2>/dev/null || ln -sf {0} {1}'.format(
+                    blob_path, shlex.quote(opj(task_wdir, file_name))
+                ))
+            lines.append('else echo {} {}; fi'.format(MISSING_MARK, blob_hash))
+            blocks.append('\n'.join(lines))
+        missing = set()
+        for chunk in _chunks(blocks, COMMAND_BYTES):
+            stdout = self._run('\n'.join(['set -e', self._lock(shared=True)] + chunk))
+            missing.update(
+                line.split(' ', 1)[1] for line in stdout.splitlines() if line.startswith(MISSING_MARK + ' ')
+            )
+        return missing
+
+    def release(self, task_id, hashes=None):
+        """
+        | RemoteInputCache.release
+        | Drops the references of task_id and removes blobs no longer referenced
+
+        Args:
+            task_id (str): Task id
+            hashes (list(str)) (Optional): (None) Hashes used by the task, all references are searched if not set
+        """
+        if hashes is None:
+            self._run(
+                'cd {} 2>/dev/null || exit 0; {}; for r in */{}; do [ -e "$r" ] || continue; h=${{r%/*}}; '
+                'rm -f "$r"; rmdir "$h" 2>/dev/null && rm -f ../blobs/"$h"; done; true'.format(
+                    shlex.quote(self.refs_path), self._lock(shared=False), task_id
+                )
+            )
+            return
+        for chunk in _chunks(sorted(set(hashes)), COMMAND_BYTES):
+            self._run(
+                'cd {} 2>/dev/null || exit 0; {}; for h in {}; do rm -f "$h"/{}; '
+                'rmdir "$h" 2>/dev/null && rm -f ../blobs/"$h"; done; true'.format(
+                    shlex.quote(self.refs_path), self._lock(shared=False), ' '.join(chunk), task_id
+                )
+            )
+
+    def get_usage(self):
+        """
+        | RemoteInputCache.get_usage
+        | Number of blobs and their total size (bytes) in the store
+        """
+        stdout = self._run(
+            'cd {} 2>/dev/null && find . -maxdepth 1 -type f ! -name "*.tmp.*" -printf "%s\\n"; true'.format(
+                shlex.quote(self.blobs_path)
+            )
+        )
+        sizes = [int(size) for size in stdout.split()]
+        return {'blobs': len(sizes), 'bytes': sum(sizes)}
+
+
+def _chunks(items, max_bytes):
+    """
+    | Private. input_cache._chunks
+    | Splits items (command fragments) in groups of at most max_bytes, counting one separator each.
+    | Items longer than max_bytes make a group alone
+    """
+    chunk = []
+    size = 0
+    for item in items:
+        if chunk and size + len(item) + 1 > max_bytes:
+            yield chunk
+            chunk = []
+            size = 0
+        chunk.append(item)
+        size += len(item) + 1
+    if chunk:
+        yield chunk
@@ -0,0 +1,230 @@
+""" Module to save task data as an append-only journal of changes """
+
+import os
+import sys
+import json
+
+BUNDLE_KEYS = ['local_data_bundle', 'output_data_bundle']
+TRACE_KEY = 'trace'
+DEFAULT_COMPACT_EVERY = 200
+# Journal operations
+SNAPSHOT = 'snapshot'
+SET = 'set'
+DELETE = 'del'
+BUNDLE = 'bundle'
+BUNDLE_FILES = 'bundle_files'
+TRACE = 'trace'
+
+
+class TaskJournal():
+    """
+    | biobb_remote journal.TaskJournal
+    | Task file storing a full snapshot of task_data followed by one json line per saved change
+    | (changed keys, new bundle files, new trace spans). Saving a task appends only what changed
+    | since the last save, the file is rewritten as a single snapshot every compact_every changes.
+
+    Args:
+        path (str): Path to journal file
+        compact_every (int) (Optional): (200) Changes appended before the journal is compacted
+    """
+    def __init__(self, path, compact_every=DEFAULT_COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+        self.records = 0
+        self.state = None
+
+    def write(self, task):
+        """
+        | TaskJournal.write
+        | Appends the changes of task since the last write, or writes a full snapshot
+        | if nothing was written yet or compaction is due. Returns the number of records appended
+
+        Args:
+            task (Task): Task to save
+        """
+        if self.state is None or self.records >= self.compact_every or not os.path.exists(self.path):
+            self.compact(task)
+            return 1
+        records = self._get_changes(task)
+        if records:
+            try:
+                with open(self.path, 'a') as journal_file:
+                    journal_file.write(''.join(json.dumps(record) + '\n' for record in records))
+            except OSError as err:
+                sys.exit(err)
+            self.records += len(records)
+        self.state = _capture(task)
+        return len(records)
+
+    def compact(self, task):
+        """
+        | TaskJournal.compact
+        | Rewrites the journal as a single snapshot of task (atomically)
+
+        Args:
+            task (Task): Task to save
+        """
+        tmp_path = self.path + '.tmp'
+        try:
+            with open(tmp_path, 'w') as journal_file:
+                journal_file.write(json.dumps({'op': SNAPSHOT, 'data': task.export_task_data()}) + '\n')
+            os.replace(tmp_path, self.path)
+        except OSError as err:
+            sys.exit(err)
+        self.records = 0
+        self.state = _capture(task)
+
+    def replay(self):
+        """
+        | TaskJournal.replay
+        | Reads the journal, returns task data in Task.export_task_data format.
+        | A truncated last line (interrupted write) is ignored
+        """
+        data = None
+        self.records = 0
+        try:
+            with open(self.path) as journal_file:
+                lines = journal_file.readlines()
+        except OSError as err:
+            sys.exit(err)
+        for num, line in enumerate(lines):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                if num == len(lines) - 1:
+                    break
+                sys.exit("Error: corrupted task journal {}, line {}".format(self.path, num + 1))
+            if record['op'] == SNAPSHOT:
+                data = record['data']
+                self.records = 0
+                continue
+            if data is None:
+                sys.exit("Error: task journal {} does not start with a snapshot".format(self.path))
+            _apply(data, record)
+            self.records += 1
+        if data is None:
+            sys.exit("Error: empty task journal " + self.path)
+        return data
+
+    def sync(self, task):
+        """
+        | TaskJournal.sync
+        | Takes task as already saved (e.g. just after replay), later writes append changes from here
+
+        Args:
+            task (Task): Task loaded from this journal
+        """
+        self.state = _capture(task)
+
+    def _get_changes(self, task):
+        """
+        | Private. TaskJournal._get_changes
+        | Journal records for the differences between task and the last saved state
+        """
+        records = []
+        old = self.state
+        new_keys = set(task.task_data)
+        for key in old['keys'] - new_keys:
+            records.append({'op': DELETE, 'key': key})
+        for key, value in task.task_data.items():
+            if key in BUNDLE_KEYS and hasattr(value, 'version'):
+                records += _bundle_changes(key, value, old['bundles'].get(key))
+            elif key == TRACE_KEY and hasattr(value, 'spans'):
+                records += _trace_changes(value, old['trace'])
+            else:
+                value_json = _dump(value)
+                if old['values'].get(key) != value_json:
+                    records.append({'op': SET, 'key': key, 'value': json.loads(value_json)})
+        return records
+
+
+def _dump(value):
+    try:
+        return json.dumps(value, sort_keys=True)
+    except TypeError:
+        # Not serializable values are stored as in json mode (DataBundle/trace objects)
+        return json.dumps(value.to_json() if hasattr(value, 'to_json') else str(value), sort_keys=True)
+
+
+def _capture(task):
+    """
+    | Private. journal._capture
+    | Lightweight image of the saved task data, used to find changes.
+    | Bundles are tracked by number of files and version, so changes are found without serializing them
+    """
+    state = {'keys': set(task.task_data), 'values': {}, 'bundles': {}, 'trace': None}
+    for key, value in task.task_data.items():
+        if key in BUNDLE_KEYS and hasattr(value, 'version'):
+            state['bundles'][key] = (id(value), value.id, value.get_num_files(), value.version)
+        elif key == TRACE_KEY and hasattr(value, 'spans'):
+            state['trace'] = (id(value), len(value.spans), json.dumps(value.marks, sort_keys=True))
+        else:
+            state['values'][key] = _dump(value)
+    return state
+
+
+def _bundle_changes(key, bundle, old):
+    """
+    | Private. journal._bundle_changes
+    | Records for files appended since the last save, or the full bundle if it was replaced
+    | or stats of already saved files were updated
+    """
+    num_files = bundle.get_num_files()
+    if old is None or old[0] != id(bundle) or old[1] != bundle.id or num_files < old[2] \
+            or bundle.version - old[3] != num_files - old[2]:
+        return [{'op': BUNDLE, 'key': key, 'value': json.loads(bundle.to_json())}]
+    if num_files == old[2]:
+        return []
+    return [{'op': BUNDLE_FILES, 'key': key, 'rows': bundle.get_rows(old[2])}]
+
+
+def _trace_changes(trace, old):
+    """
+    | Private. journal._trace_changes
+    | Records for spans and marks added since the last save
+    """
+    marks = json.dumps(trace.marks, sort_keys=True)
+    if old is None or old[0] != id(trace) or old[1] > len(trace.spans):
+        return [{'op': SET, 'key': TRACE_KEY, 'value': trace.to_json()}]
+    if old[1] == len(trace.spans) and old[2] == marks:
+        return []
+    return [{'op': TRACE, 'spans': trace.spans[old[1]:], 'marks': trace.marks}]
+
+
+def _apply(data, record):
+    """
+    | Private. journal._apply
+    | Applies a journal record to task data (export_task_data format)
+    """
+    oper = record['op']
+    if oper == SET:
+        data[record['key']] = record['value']
+    elif oper == DELETE:
+        data.pop(record['key'], None)
+    elif oper == BUNDLE:
+        data[record['key']] = record['value']
+    elif oper == BUNDLE_FILES:
+        bundle = data[record['key']]
+        if isinstance(bundle, str):
+            bundle = data[record['key']] = json.loads(bundle)
+        _append_rows(bundle, record['rows'])
+    elif oper == TRACE:
+        data[TRACE_KEY]['spans'] += record['spans']
+        data[TRACE_KEY]['marks'] = record['marks']
+    else:
+        sys.exit("Error: unknown task journal operation " + str(oper))
+
+
+def _append_rows(bundle, rows):
+    """
+    | Private. journal._append_rows
+    | Appends files (DataBundle.get_rows output) to a bundle json dump
+    """
+    dir_index = {dir_path: dir_row for dir_row, dir_path in enumerate(bundle['dirs'])}
+    for dir_path in rows['dirs']:
+        if dir_path not in dir_index:
+            dir_index[dir_path] = len(bundle['dirs'])
+            bundle['dirs'].append(dir_path)
+        bundle['file_dirs'].append(dir_index[dir_path])
+    for column in ('names', 'sizes', 'mtimes', 'modes'):
+        bundle[column] += rows[column]
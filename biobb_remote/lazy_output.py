@@ -0,0 +1,465 @@
+""" Module to access task outputs lazily, downloading files on first use into a size-bounded local cache """
+
+import os
+import sys
+import json
+import stat
+import time
+import fnmatch
+import threading
+from collections import OrderedDict
+
+from os.path import join as opj
+
+DEFAULT_CACHE_PATH = opj(os.path.expanduser('~'), '.biobb_remote', 'output_cache')
+DEFAULT_MAX_BYTES = 10 * 1024 ** 3
+# Access order of cached files, least recently used first (atime is not reliable, e.g. on noatime mounts)
+INDEX_FILE = '.index.json'
+# Cache hits between index saves, the order is otherwise saved on add, clear and close
+INDEX_SAVE_EVERY = 100
+
+
+class OutputFileCache():
+    """
+    | biobb_remote lazy_output.OutputFileCache
+    | Local copies of remote output files, kept as cache_path/<task_id>/<file name>.
+    | Total size is bounded by max_bytes, least recently used files are evicted first. A file larger
+    | than max_bytes is only kept until the next download.
+    | Copies keep the remote mtime, so outdated copies are found by comparing size and mtime.
+    | The access order is kept in memory and saved in cache_path/.index.json on downloads, clear, close
+    | and every 100 hits. Existing copies are indexed on creation.
+
+    Args:
+        cache_path (str) (Optional): (~/.biobb_remote/output_cache) Local cache directory
+        max_bytes (int) (Optional): (10 GiB) Max total size of cached files
+    """
+    def __init__(self, cache_path=DEFAULT_CACHE_PATH, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_path = cache_path
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.oversized = None
+        self.unsaved_hits = 0
+        self._scan()
+
+    def _scan(self):
+        """
+        | Private. OutputFileCache._scan
+        | Indexes copies left by earlier sessions, in the saved access order.
+        | Copies missing in the saved index go first, by mtime
+        """
+        try:
+            os.makedirs(self.cache_path, exist_ok=True)
+        except OSError as err:
+            sys.exit(err)
+        found = {}
+        for task_entry in os.scandir(self.cache_path):
+            if not task_entry.is_dir():
+                continue
+            for file_entry in os.scandir(task_entry.path):
+                if file_entry.is_file() and not file_entry.name.endswith('.part'):
+                    stats = file_entry.stat()
+                    found[(task_entry.name, file_entry.name)] = (stats.st_mtime, stats.st_size)
+        order = []
+        try:
+            with open(opj(self.cache_path, INDEX_FILE)) as index_file:
+                order = [tuple(key) for key in json.load(index_file)]
+        except (OSError, ValueError, TypeError):
+            pass
+        indexed = set(order)
+        keys = sorted((key for key in found if key not in indexed), key=lambda key: found[key][0])
+        keys += [key for key in order if key in found]
+        with self.lock:
+            for key in keys:
+                self.entries[key] = found[key][1]
+                self.total_bytes += found[key][1]
+            self._evict()
+            self._save_index()
+
+    def _save_index(self):
+        """
+        | Private. OutputFileCache._save_index
+        | Saves the access order. Lock must be held
+        """
+        self.unsaved_hits = 0
+        index_path = opj(self.cache_path, INDEX_FILE)
+        try:
+            with open(index_path + '.tmp', 'w') as index_file:
+                json.dump([list(key) for key in self.entries], index_file)
+            os.replace(index_path + '.tmp', index_path)
+        except OSError as err:
+            print("Warning: output cache index not saved: {}".format(err))
+
+    def _evict(self, keep=None):
+        """
+        | Private. OutputFileCache._evict
+        | Removes least recently used copies while over max_bytes, except keep. Lock must be held
+        """
+        while self.total_bytes > self.max_bytes and self.entries:
+            key = next(iter(self.entries))
+            if key == keep:
+                break
+            self._remove(key)
+
+    def get_path(self, task_id, file_name):
+        """
+        | OutputFileCache.get_path
+        | Local path of the copy of a file (existing or not)
+
+        Args:
+            task_id (str): Task id
+            file_name (str): File name
+        """
+        return opj(self.cache_path, task_id, file_name)
+
+    def lookup(self, task_id, file_name, size=None, mtime=None):
+        """
+        | OutputFileCache.lookup
+        | Local path of a valid copy, None if not cached or outdated (size or mtime differ).
+        | The file becomes the most recently used
+
+        Args:
+            task_id (str): Task id
+            file_name (str): File name
+            size (int) (Optional): (None) Remote size
+            mtime (float) (Optional): (None) Remote mtime
+        """
+        key = (task_id, file_name)
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return None
+            local_path = self.get_path(task_id, file_name)
+            try:
+                stats = os.stat(local_path)
+            except OSError:
+                self._remove(key)
+                self.misses += 1
+                return None
+            if not _same_stats(stats, size, mtime):
+                self._remove(key)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.unsaved_hits += 1
+            if self.unsaved_hits >= INDEX_SAVE_EVERY:
+                self._save_index()
+            return local_path
+
+    def add(self, task_id, file_name, mtime=None):
+        """
+        | OutputFileCache.add
+        | Registers a file just downloaded to get_path(task_id, file_name), and evicts
+        | least recently used files if over max_bytes. A new file larger than max_bytes is kept
+        | for the caller, and evicted on the next call
+
+        Args:
+            task_id (str): Task id
+            file_name (str): File name
+            mtime (float) (Optional): (None) Remote mtime, set on the local copy
+        """
+        key = (task_id, file_name)
+        local_path = self.get_path(task_id, file_name)
+        if mtime is not None and mtime >= 0:
+            os.utime(local_path, (time.time(), mtime))
+        size = os.path.getsize(local_path)
+        with self.lock:
+            if self.oversized in self.entries and self.oversized != key:
+                self._remove(self.oversized)
+            self.oversized = None
+            if key in self.entries:
+                self.total_bytes -= self.entries[key]
+            self.entries[key] = size
+            self.entries.move_to_end(key)
+            self.total_bytes += size
+            self._evict(keep=key)
+            if size > self.max_bytes:
+                print("Warning: {} ({} bytes) exceeds the output cache size, kept until the next download".format(
+                    file_name, size
+                ))
+                self.oversized = key
+            self._save_index()
+        return local_path
+
+    def _remove(self, key):
+        """
+        | Private. OutputFileCache._remove
+        | Drops a copy. Lock must be held
+        """
+        self.total_bytes -= self.entries.pop(key)
+        try:
+            os.remove(self.get_path(*key))
+        except OSError:
+            pass
+
+    def clear(self, task_id=None):
+        """
+        | OutputFileCache.clear
+        | Removes cached copies, of a single task or all
+
+        Args:
+            task_id (str) (Optional): (None) Task id
+        """
+        with self.lock:
+            for key in list(self.entries):
+                if task_id is None or key[0] == task_id:
+                    self._remove(key)
+            self._save_index()
+
+    def close(self):
+        """
+        | OutputFileCache.close
+        | Saves the access order of recent hits
+        """
+        with self.lock:
+            if self.unsaved_hits:
+                self._save_index()
+
+    def get_usage(self):
+        """
+        | OutputFileCache.get_usage
+        | Number of files, total size, hits and misses
+        """
+        with self.lock:
+            return {
+                'files': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+class RemoteFile():
+    """
+    | biobb_remote lazy_output.RemoteFile
+    | Handle to an output file of a task, contents are downloaded on first access
+
+    Args:
+        bundle (LazyOutputBundle): Bundle the file belongs to
+        name (str): File name
+        stats (dict): Remote stats (st_size, st_mtime, ...)
+    """
+    def __init__(self, bundle, name, stats):
+        self.bundle = bundle
+        self.name = name
+        self.stats = stats
+
+    def __repr__(self):
+        return 'RemoteFile({!r}, size={}, cached={})'.format(self.name, self.size, self.is_cached())
+
+    @property
+    def size(self):
+        """ Remote size (bytes) """
+        return self.stats.get('st_size')
+
+    @property
+    def mtime(self):
+        """ Remote modification time """
+        return self.stats.get('st_mtime')
+
+    def is_cached(self):
+        """
+        | RemoteFile.is_cached
+        | Whether a valid local copy is available (does not count as access)
+        """
+        return self.bundle._is_cached(self)
+
+    def fetch(self):
+        """
+        | RemoteFile.fetch
+        | Local path of the file contents, downloaded if not cached
+        """
+        return self.bundle._fetch(self)
+
+    def open(self, mode='rb'):
+        """
+        | RemoteFile.open
+        | Opens the local copy for read
+
+        Args:
+            mode (str) (Optional): ('rb') Open mode, r | rb
+        """
+        if mode not in ('r', 'rb'):
+            sys.exit('Error: remote output files are read-only')
+        return open(self.fetch(), mode)
+
+    def read_bytes(self):
+        """
+        | RemoteFile.read_bytes
+        | File contents as bytes
+        """
+        with self.open('rb') as data_file:
+            return data_file.read()
+
+    def read_text(self):
+        """
+        | RemoteFile.read_text
+        | File contents as str
+        """
+        with self.open('r') as data_file:
+            return data_file.read()
+
+
+class LazyOutputBundle():
+    """
+    | biobb_remote lazy_output.LazyOutputBundle
+    | Output files of a task as RemoteFile handles. Listing the files takes a single request
+    | (output manifest if available, remote dir listing otherwise); contents are downloaded
+    | only when accessed, or prefetched by glob pattern. Obtained from Task.get_lazy_output
+
+    Args:
+        task (Task): Task owning the remote working dir
+        cache (OutputFileCache) (Optional): (None) Local cache, a default one is used if not set
+    """
+    def __init__(self, task, cache=None):
+        self.task = task
+        self.cache = cache or get_default_cache()
+        self.manifest = None
+        self.files = OrderedDict()
+        self.lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """
+        | LazyOutputBundle.refresh
+        | Re-reads the list of remote files
+        """
+        self.manifest = None
+        if self.task.task_data.get('output_manifest'):
+            self.manifest = self.task.get_output_manifest()
+        if self.manifest:
+            remote_files = self.manifest.files
+        else:
+            remote_files = self.task.get_remote_file_stats(refresh=True)
+        self.files = OrderedDict(
+            (name, RemoteFile(self, name, stats))
+            for name, stats in sorted(remote_files.items())
+            if not stat.S_ISDIR(stats.get('st_mode') or 0)
+        )
+
+    def __getitem__(self, file_name):
+        if file_name not in self.files:
+            raise KeyError('{} is not in the remote working dir'.format(file_name))
+        return self.files[file_name]
+
+    def __contains__(self, file_name):
+        return file_name in self.files
+
+    def __iter__(self):
+        return iter(self.files.values())
+
+    def __len__(self):
+        return len(self.files)
+
+    def get_file_names(self):
+        """
+        | LazyOutputBundle.get_file_names
+        | Names of remote files
+        """
+        return list(self.files)
+
+    def get_total_size(self):
+        """
+        | LazyOutputBundle.get_total_size
+        | Total remote size (bytes)
+        """
+        return sum(max(remote_file.size or 0, 0) for remote_file in self.files.values())
+
+    def glob(self, patterns):
+        """
+        | LazyOutputBundle.glob
+        | Handles of files matching any of the patterns
+
+        Args:
+            patterns (str | list(str)): Glob pattern(s) (e.g. *.edr)
+        """
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        return [
+            remote_file for name, remote_file in self.files.items()
+            if any(fnmatch.fnmatch(name, pattern) for pattern in patterns)
+        ]
+
+    def prefetch(self, patterns):
+        """
+        | LazyOutputBundle.prefetch
+        | Downloads files matching patterns not yet cached, returns their handles
+
+        Args:
+            patterns (str | list(str)): Glob pattern(s) (e.g. ['*.edr', '*.gro'])
+        """
+        remote_files = self.glob(patterns)
+        total = sum(max(remote_file.size or 0, 0) for remote_file in remote_files)
+        if total > self.cache.max_bytes:
+            print("Warning: prefetched files ({} bytes) exceed the output cache size, some will be evicted".format(total))
+        for remote_file in remote_files:
+            remote_file.fetch()
+        return remote_files
+
+    def _is_cached(self, remote_file):
+        key = (self.task.id, remote_file.name)
+        if key not in self.cache.entries:
+            return False
+        try:
+            stats = os.stat(self.cache.get_path(*key))
+        except OSError:
+            return False
+        return _same_stats(stats, remote_file.size, remote_file.mtime)
+
+    def _fetch(self, remote_file):
+        """
+        | Private. LazyOutputBundle._fetch
+        | Local path of a file, downloading it into the cache if needed.
+        | Files are downloaded to a temporary name, and checked against the output manifest if any
+        """
+        # One download at a time per bundle, the session sftp channel is shared
+        with self.lock:
+            local_path = self.cache.lookup(self.task.id, remote_file.name, remote_file.size, remote_file.mtime)
+            if local_path:
+                return local_path
+            local_path = self.cache.get_path(self.task.id, remote_file.name)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            part_path = local_path + '.part'
+            self.task._open_ssh_session()
+            remote_file_path = opj(self.task._remote_wdir(), remote_file.name)
+            with self.task._span('download_file', file=remote_file.name, bytes=remote_file.size, lazy=True):
+                self.task.ssh_session.run_sftp('get', remote_file_path, part_path)
+            print("getting_file: {} -> {}".format(remote_file_path, local_path))
+            if self.manifest and remote_file.name in self.manifest.files and \
+                    remote_file.name not in self.task._get_queue_log_names():
+                error = self.manifest.verify(remote_file.name, part_path)
+                if error:
+                    os.remove(part_path)
+                    sys.exit("Error: downloaded file does not match the output manifest\n" + error)
+            os.replace(part_path, local_path)
+            return self.cache.add(self.task.id, remote_file.name, remote_file.mtime)
+
+
+def _same_stats(stats, size=None, mtime=None):
+    # Local copy matches remote size and mtime (whole seconds), when known
+    if size is not None and size >= 0 and stats.st_size != size:
+        return False
+    if mtime is not None and mtime >= 0 and int(stats.st_mtime) != int(mtime):
+        return False
+    return True
+
+
+_DEFAULT_CACHE = None
+_DEFAULT_CACHE_LOCK = threading.Lock()
+
+
+def get_default_cache():
+    """
+    | lazy_output.get_default_cache
+    | Output cache shared by lazy bundles created without an explicit one
+    """
+    global _DEFAULT_CACHE
+    with _DEFAULT_CACHE_LOCK:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = OutputFileCache()
+        return _DEFAULT_CACHE
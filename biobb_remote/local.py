@@ -0,0 +1,636 @@
+""" Module to run tasks on the local host, without queue manager """
+
+import os
+import sys
+import time
+import types
+import shutil
+import signal
+import getpass
+import itertools
+import threading
+import subprocess
+
+from biobb_remote import metrics
+from biobb_remote.ssh_session import get_stats_dict
+from biobb_remote.task import Task, SUBMITTED, RUNNING, CANCELLED, FINISHED
+from biobb_remote.perf_history import parse_time
+from biobb_remote.queue_info import QueueSnapshot
+
+LOCAL_HOST = 'localhost'
+# Job states, named as in SLURM accounting
+PENDING = 'PENDING'
+JOB_RUNNING = 'RUNNING'
+COMPLETED = 'COMPLETED'
+FAILED = 'FAILED'
+TIMEOUT = 'TIMEOUT'
+JOB_CANCELLED = 'CANCELLED'
+DONE_STATES = (COMPLETED, FAILED, TIMEOUT, JOB_CANCELLED)
+# Thread limits exported to each job, from cpus-per-task
+THREAD_VARS = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+LOCAL_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Seconds between SIGTERM and SIGKILL when a job is cancelled or reaches its time limit
+KILL_GRACE = 30
+
+_DEFAULT_SCHEDULER = None
+_DEFAULT_SCHEDULER_LOCK = threading.Lock()
+# Job ids are unique across schedulers and processes: <process start time>-<pid>-<n>
+_JOB_ID_PREFIX = '{}-{}'.format(int(time.time()), os.getpid())
+_JOB_COUNTER = itertools.count(1)
+
+
+def get_available_cores():
+    """
+    | local.get_available_cores
+    | Cores this process is allowed to run on
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def get_local_host_config():
+    """
+    | local.get_local_host_config
+    | Host configuration for the local host, in the same format as conf/*.json files
+    """
+    cores = len(get_available_cores())
+    return {
+        'description': 'Local host',
+        'qsettings': {
+            'serial': {'ntasks': 1, 'cpus-per-task': 1},
+            'openMP_full_node': {'ntasks': 1, 'cpus-per-task': cores},
+            'debug': {},
+            'default': 'serial'
+        },
+        'modules': {},
+        'login_hosts': [LOCAL_HOST],
+        'cores_per_node': cores,
+        'gpus_per_node': 0,
+        'min_cores_per_gpu': 0
+    }
+
+
+def get_default_scheduler():
+    """
+    | local.get_default_scheduler
+    | Returns the scheduler shared by all local tasks not given an explicit one
+    """
+    global _DEFAULT_SCHEDULER
+    with _DEFAULT_SCHEDULER_LOCK:
+        if _DEFAULT_SCHEDULER is None:
+            _DEFAULT_SCHEDULER = LocalScheduler()
+    return _DEFAULT_SCHEDULER
+
+
+class LocalSession():
+    """
+    | biobb_remote local.LocalSession
+    | Local replacement of SSHSession. Commands run in a local shell, sftp operations are local file operations.
+    """
+    def run_command(self, command, forward_agent=False):
+        """
+        | LocalSession.run_command
+        | Runs a shell command, produces stdout, stderr tuple
+
+        Args:
+            command (str | list(str)): Command or list of commands to execute.
+            forward_agent (bool) (Optional): (False) Not used, the local agent is already available
+        """
+        if isinstance(command, list):
+            command = ' '.join(command)
+        proc = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        return proc.stdout.decode(), proc.stderr.decode()
+
+    def run_sftp(self, oper, input_file_path, output_file_path='', reuse_session=True):
+        """
+        | LocalSession.run_sftp
+        | Local equivalent of SSHSession.run_sftp (get, put, create, file, listdir, listdir_attr, lstat)
+        """
+        try:
+            if oper in ('get', 'put'):
+                shutil.copy2(input_file_path, output_file_path)
+            elif oper == 'create':
+                with open(output_file_path, 'w') as out_file:
+                    out_file.write(input_file_path)
+            elif oper == 'file':
+                with open(input_file_path, 'r') as in_file:
+                    return in_file.read()
+            elif oper == 'listdir':
+                return os.listdir(input_file_path)
+            elif oper == 'listdir_attr':
+                return [
+                    _sftp_attributes(os.lstat(entry.path), entry.name)
+                    for entry in os.scandir(input_file_path)
+                ]
+            elif oper == 'lstat':
+                return _sftp_attributes(os.lstat(input_file_path))
+            else:
+                print('Unknown sftp command', oper)
+                return True
+        except IOError as err:
+            sys.exit(err)
+        return False
+
+    def open_file(self, file_path, mode='rb'):
+        """
+        | LocalSession.open_file
+        | Opens a local file, as SSHSession.open_file
+        """
+        try:
+            return open(file_path, mode)
+        except IOError as err:
+            sys.exit(err)
+
+    def get_dir_stats(self, dir_path, refresh=False):
+        """
+        | LocalSession.get_dir_stats
+        | Stats of the files in dir_path, as SSHSession.get_dir_stats (not cached)
+        """
+        return {
+            attributes.filename: get_stats_dict(attributes)
+            for attributes in self.run_sftp('listdir_attr', dir_path)
+        }
+
+    def invalidate_metadata(self, path=None):
+        """
+        | LocalSession.invalidate_metadata
+        | Nothing cached
+        """
+
+    def is_active(self):
+        """
+        | LocalSession.is_active
+        | Always active
+        """
+        return True
+
+    def close(self):
+        """
+        | LocalSession.close
+        | Nothing to close
+        """
+
+
+class LocalJob():
+    """
+    | biobb_remote local.LocalJob
+    | Job run by LocalScheduler
+
+    Args:
+        job_id (str): Job id
+        script_path (str): Path to the queue script
+        settings (dict): Queue settings
+    """
+    def __init__(self, job_id, script_path, settings):
+        self.job_id = job_id
+        self.script_path = script_path
+        self.settings = settings
+        self.cpus_per_task = max(1, int(settings.get('cpus-per-task', 1)))
+        self.cpus = max(1, int(settings.get('ntasks', 1))) * self.cpus_per_task
+        if settings.get('time'):
+            self.time_limit = parse_time(settings['time'])
+        else:
+            self.time_limit = None
+        self.state = PENDING
+        self.cores = []
+        self.process = None
+        self.kill_timer = None
+        self.returncode = None
+        self.submit_time = time.time()
+        self.start_time = None
+        self.end_time = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        """
+        | LocalJob.to_dict
+        | Accounting data, in the format of Task.get_job_accounting
+        """
+        data = {
+            'state': self.state,
+            'submit': _fmt_time(self.submit_time),
+            'start': _fmt_time(self.start_time),
+            'end': _fmt_time(self.end_time),
+            'elapsed': None,
+            'wait': None
+        }
+        if self.start_time:
+            data['wait'] = self.start_time - self.submit_time
+            data['elapsed'] = int((self.end_time or time.time()) - self.start_time)
+        return data
+
+
+class LocalScheduler():
+    """
+    | biobb_remote local.LocalScheduler
+    | Runs queue scripts as local processes. Jobs wait until enough cores are free,
+    | and are pinned to their cores (where supported) with thread limits set from cpus-per-task.
+    | Job ids are <start time>-<pid>-<n>, so they are not reused by other schedulers or processes.
+
+    Args:
+        cores (list(int)) (Optional): (None) Cores available to jobs, defaults to all cores available to this process
+        kill_grace (float) (Optional): (30) Seconds between SIGTERM and SIGKILL when stopping a job
+    """
+    def __init__(self, cores=None, kill_grace=KILL_GRACE):
+        self.cores = list(cores or get_available_cores())
+        self.free_cores = list(self.cores)
+        self.kill_grace = kill_grace
+        self.jobs = {}
+        self.pending = []
+        self.lock = threading.Condition()
+
+    def submit(self, script_path, settings):
+        """
+        | LocalScheduler.submit
+        | Queues a script, returns the job id
+
+        Args:
+            script_path (str): Path to the queue script
+            settings (dict): Queue settings (ntasks, cpus-per-task, time, working_dir, stdout, stderr)
+        """
+        with self.lock:
+            job = LocalJob('{}-{}'.format(_JOB_ID_PREFIX, next(_JOB_COUNTER)), script_path, settings)
+            if job.cpus > len(self.cores):
+                sys.exit('Error: job requests {} cores, only {} available'.format(job.cpus, len(self.cores)))
+            self.jobs[job.job_id] = job
+            self.pending.append(job)
+            self._start_pending()
+        return job.job_id
+
+    def _start_pending(self):
+        """
+        | Private. LocalScheduler._start_pending
+        | Starts pending jobs in submission order while cores are available. Lock must be held
+        """
+        while self.pending and self.pending[0].cpus <= len(self.free_cores):
+            job = self.pending.pop(0)
+            job.cores = self.free_cores[:job.cpus]
+            self.free_cores = self.free_cores[job.cpus:]
+            job.state = JOB_RUNNING
+            job.start_time = time.time()
+            threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _run_job(self, job):
+        """
+        | Private. LocalScheduler._run_job
+        | Runs a job process until it ends, is cancelled or reaches its time limit
+        """
+        settings = job.settings
+        wdir = settings.get('working_dir', os.path.dirname(job.script_path))
+        env = dict(os.environ)
+        for var in THREAD_VARS:
+            env[var] = str(job.cpus_per_task)
+        env['BIOBB_JOB_ID'] = job.job_id
+        env['BIOBB_CORES'] = ','.join(str(core) for core in job.cores)
+        command = ['bash', job.script_path]
+        # No preexec_fn, it is not safe with other threads running. taskset pins the job
+        # before it starts, otherwise the process is pinned right after being created
+        set_affinity = False
+        if shutil.which('taskset'):
+            command = ['taskset', '-c', env['BIOBB_CORES']] + command
+        elif hasattr(os, 'sched_setaffinity'):
+            set_affinity = True
+        try:
+            with open(os.path.join(wdir, settings.get('stdout', 'job.out')), 'w') as out_file, \
+                    open(os.path.join(wdir, settings.get('stderr', 'job.err')), 'w') as err_file:
+                with self.lock:
+                    if job.state == JOB_CANCELLED:
+                        return
+                    job.process = subprocess.Popen(
+                        command,
+                        cwd=wdir,
+                        env=env,
+                        stdout=out_file,
+                        stderr=err_file,
+                        start_new_session=True
+                    )
+                    if set_affinity:
+                        try:
+                            os.sched_setaffinity(job.process.pid, set(job.cores))
+                        except OSError:
+                            pass
+                try:
+                    job.returncode = job.process.wait(timeout=job.time_limit)
+                except subprocess.TimeoutExpired:
+                    self._kill(job)
+                    job.returncode = job.process.wait()
+                    with self.lock:
+                        if job.state == JOB_RUNNING:
+                            job.state = TIMEOUT
+        except OSError as err:
+            print("Error running local job {}: {}".format(job.job_id, err))
+            job.returncode = -1
+        finally:
+            with self.lock:
+                if job.kill_timer is not None:
+                    job.kill_timer.cancel()
+                if job.state == JOB_RUNNING:
+                    job.state = COMPLETED if job.returncode == 0 else FAILED
+                self._finish(job)
+
+    def _finish(self, job):
+        """
+        | Private. LocalScheduler._finish
+        | Releases job cores and wakes up waiters. Lock must be held
+        """
+        if job.end_time is None:
+            job.end_time = time.time()
+            self.free_cores = sorted(self.free_cores + job.cores)
+            job.done.set()
+            self._start_pending()
+            self.lock.notify_all()
+
+    def _kill(self, job):
+        """
+        | Private. LocalScheduler._kill
+        | Terminates the job process group, killed after kill_grace seconds if still alive.
+        | The timer is cancelled when the job process ends
+        """
+        _signal_group(job.process.pid, signal.SIGTERM)
+        if job.kill_timer is None:
+            job.kill_timer = threading.Timer(self.kill_grace, self._force_kill, args=(job,))
+            job.kill_timer.daemon = True
+            job.kill_timer.start()
+
+    def _force_kill(self, job):
+        """
+        | Private. LocalScheduler._force_kill
+        | Kills the job process group, if the job process is still running
+        """
+        if job.process.poll() is None:
+            _signal_group(job.process.pid, signal.SIGKILL)
+
+    def cancel(self, job_id):
+        """
+        | LocalScheduler.cancel
+        | Cancels a pending or running job
+
+        Args:
+            job_id (str): Job id
+        """
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job.state in DONE_STATES:
+                return
+            if job.state == PENDING:
+                self.pending.remove(job)
+                job.state = JOB_CANCELLED
+                job.end_time = time.time()
+                job.done.set()
+                self.lock.notify_all()
+                return
+            job.state = JOB_CANCELLED
+            if job.process is not None:
+                self._kill(job)
+
+    def get_job(self, job_id):
+        """
+        | LocalScheduler.get_job
+        | Returns the LocalJob, None if unknown
+
+        Args:
+            job_id (str): Job id
+        """
+        return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        """
+        | LocalScheduler.wait
+        | Waits for a job to end, returns True if ended
+
+        Args:
+            job_id (str): Job id
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        job = self.jobs.get(job_id)
+        if job is None:
+            return True
+        return job.done.wait(timeout)
+
+    def get_load(self):
+        """
+        | LocalScheduler.get_load
+        | Busy cores, total cores, running and pending jobs
+        """
+        with self.lock:
+            running = sum(1 for job in self.jobs.values() if job.state == JOB_RUNNING)
+            return {
+                'busy_cores': len(self.cores) - len(self.free_cores),
+                'total_cores': len(self.cores),
+                'running_jobs': running,
+                'pending_jobs': len(self.pending)
+            }
+
+
+class LocalTask(Task):
+    """
+    | biobb_remote local.LocalTask
+    | Task Class running the generated queue script on the local host.
+    | "Remote" paths are local paths, and jobs are run by a LocalScheduler.
+    | Extends biobb_remote.task.Task
+
+    Args:
+        host_config (dict) (Optional): (None) Host configuration, defaults to get_local_host_config()
+        scheduler (LocalScheduler) (Optional): (None) Scheduler to run jobs, defaults to the shared one
+    """
+    def __init__(self, host_config=None, scheduler=None):
+        Task.__init__(self, LOCAL_HOST, getpass.getuser(), look_for_keys=False)
+        self.host_config = host_config or get_local_host_config()
+        self.scheduler = scheduler or get_default_scheduler()
+        self.ssh_session = LocalSession()
+
+    def set_credentials(self, credentials):
+        """
+        | LocalTask.set_credentials
+        | Credentials are not used for local tasks
+        """
+        print("Warning: credentials not used for local tasks")
+
+    def _open_ssh_session(self):
+        """
+        | Private. LocalTask._open_ssh_session
+        | Local session, no connection required
+        """
+        if not isinstance(self.ssh_session, LocalSession):
+            self.ssh_session = LocalSession()
+        return False
+
+    def get_queue_info(self):
+        """
+        | LocalTask.get_queue_info
+        | Returns local cores and jobs usage
+        """
+        load = self.scheduler.get_load()
+        return '{busy_cores}/{total_cores} cores busy, {running_jobs} running, {pending_jobs} pending'.format(**load)
+
+    def _build_queue_snapshot(self):
+        """
+        | Private. LocalTask._build_queue_snapshot
+        | Snapshot with a single 'local' partition, counting cores as nodes
+        """
+        load = self.scheduler.get_load()
+        snapshot = QueueSnapshot(self.host_config['description'])
+        part = snapshot.add_partition('local')
+        part['allocated_nodes'] = load['busy_cores']
+        part['idle_nodes'] = load['total_cores'] - load['busy_cores']
+        part['total_nodes'] = load['total_cores']
+        part['running_jobs'] = load['running_jobs']
+        part['pending_jobs'] = load['pending_jobs']
+        snapshot.user_jobs = {'running': load['running_jobs'], 'pending': load['pending_jobs']}
+        return snapshot
+
+    def get_queue_snapshot(self, ttl=0, refresh=True):
+        """
+        | LocalTask.get_queue_snapshot
+        | Local load is always current, snapshots are not cached
+        """
+        return self._build_queue_snapshot()
+
+    def _get_queue_settings_string_array(self):
+        """
+        | Private. LocalTask._get_queue_settings_string_array
+        | Queue settings as comments, for reference
+        """
+        return [
+            '# {}: {}'.format(key, value) for key, value in self.task_data['queue_settings'].items()
+        ]
+
+    def _get_launcher_prefix(self, settings, gpu_map):
+        """
+        | Private. LocalTask._get_launcher_prefix
+        | mpirun for multi-task runs, processes are already pinned to the job cores
+        """
+        if settings['ntasks'] > 1:
+            return 'mpirun -np {}'.format(settings['ntasks'])
+        return ''
+
+    def _submit_queue_script(self, remote_run_script):
+        """
+        | Private. LocalTask._submit_queue_script
+        | Sends the script to the local scheduler
+        """
+        if int(self.task_data['queue_settings'].get('nodes', 1)) > 1:
+            print("Warning: local tasks run on a single node")
+        job_id = self.scheduler.submit(remote_run_script, self.task_data['queue_settings'])
+        return job_id, ''
+
+    def _get_submitted_job_id(self, submit_output):
+        """
+        | Private. LocalTask._get_submitted_job_id
+        | Job id as returned by the scheduler
+        """
+        return submit_output
+
+    @metrics.instrument(metrics.TASK_STAGE, 'cancel')
+    def cancel(self, remove_data=False):
+        """
+        | LocalTask.cancel
+        | Cancels pending or running task
+
+        Args:
+            remove_data (bool) (Optional): (False) Removes working directory
+        """
+        if self.task_data['status'] in [SUBMITTED, RUNNING]:
+            self.scheduler.cancel(self.task_data['remote_job_id'])
+            print("Job {} cancelled".format(self.task_data['remote_job_id']))
+            if remove_data:
+                self.clean_remote()
+            self.task_data['status'] = CANCELLED
+            self.modified = True
+        else:
+            print("Job {} not running".format(self.task_data['remote_job_id']))
+
+    def check_queue(self):
+        """
+        | LocalTask.check_queue
+        | Returns local jobs usage
+        """
+        return self.get_queue_info()
+
+    @metrics.instrument(metrics.TASK_STAGE, 'status')
+    def _check_job_status(self):
+        """
+        | Private. LocalTask._check_job_status
+        | Reads job status from the scheduler, no command is run
+        """
+        old_status = self.task_data['status']
+        if self.task_data['status'] is not CANCELLED:
+            job = self.scheduler.get_job(self.task_data['remote_job_id'])
+            if job is None or job.state in DONE_STATES:
+                # Jobs from other sessions are not known, they are over
+                self.task_data['status'] = FINISHED
+            elif job.state == JOB_RUNNING:
+                self.task_data['status'] = RUNNING
+            else:
+                self.task_data['status'] = SUBMITTED
+        self.modified = old_status != self.task_data['status']
+        if self.perf_history and self.modified and self.task_data['status'] == FINISHED:
+            self.perf_history.record_task(self)
+        self._trace_job_status()
+        return self.task_data['status']
+
+    def check_job(self, update=True, save_file_path=None, poll_time=0, save_mode=None):
+        """
+        | LocalTask.check_job
+        | Prints current job status. Polling returns as soon as the job ends.
+
+        Args:
+            update (bool) (Optional): (True) Update status before printing it.
+            save_file_path (str) (Optional): (None) Local task log file to update progress.
+            poll_time (int) (Optional): (0) Wait until job finished, printing status every poll_time (seconds).
+            save_mode (str) (Optional): (None) Format of save_file_path (json | pickle | journal), see Task.check_job
+        """
+        if poll_time and self.task_data['status'] is not CANCELLED:
+            current_time = 0
+            while not self.wait(timeout=poll_time):
+                current_time += poll_time
+                self._check_job_status()
+                self._print_job_status(prefix=current_time)
+        Task.check_job(self, update=update, save_file_path=save_file_path, save_mode=save_mode)
+
+    def wait(self, timeout=None):
+        """
+        | LocalTask.wait
+        | Waits for the job to end, returns True if ended
+
+        Args:
+            timeout (float) (Optional): (None) Max time to wait (seconds)
+        """
+        return self.scheduler.wait(self.task_data['remote_job_id'], timeout)
+
+    def _get_job_accounting(self, job_id):
+        """
+        | Private. LocalTask._get_job_accounting
+        | Accounting data kept by the scheduler
+        """
+        job = self.scheduler.get_job(job_id)
+        if job is None:
+            return {}
+        return job.to_dict()
+
+
+def _signal_group(pgid, signum):
+    try:
+        os.killpg(pgid, signum)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _fmt_time(value):
+    if value is None:
+        return ''
+    return time.strftime(LOCAL_TIME_FORMAT, time.localtime(value))
+
+
+def _sftp_attributes(stats, file_name=None):
+    # Same attributes as paramiko's SFTPAttributes
+    return types.SimpleNamespace(
+        filename=file_name,
+        st_size=stats.st_size,
+        st_uid=stats.st_uid,
+        st_gid=stats.st_gid,
+        st_mode=stats.st_mode,
+        st_atime=int(stats.st_atime),
+        st_mtime=int(stats.st_mtime)
+    )
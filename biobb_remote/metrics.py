@@ -0,0 +1,319 @@
+""" Module to collect and export performance metrics of remote operations """
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+
+METRICS_ENV_VAR = 'BIOBB_REMOTE_METRICS'
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1., 2.5, 5., 10., 30., 60.)
+METRIC_PREFIX = 'biobb_remote_'
+# Instrumented operations
+SSH_CONNECT = 'ssh_connect'
+SSH_COMMAND = 'ssh_command'
+SFTP = 'sftp'
+TASK_STAGE = 'task_stage'
+METRIC_HELP = {
+    SSH_CONNECT: 'SSH connection and handshake',
+    SSH_COMMAND: 'Remote shell commands, by command name',
+    SFTP: 'SFTP operations, by operation',
+    TASK_STAGE: 'Task lifecycle stages, by stage'
+}
+LABEL_NAMES = {SSH_CONNECT: 'host', TASK_STAGE: 'stage'}
+# Command prefixes skipped when naming a shell command
+_COMMAND_PREFIXES = ('cd', 'echo', 'export', 'source', 'module')
+
+
+class _Series():
+    """
+    | Private. metrics._Series
+    | Count, latency histogram, bytes and errors of one metric and label set
+    """
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.total_time = 0.
+        self.bytes = 0
+        self.errors = 0
+
+    def observe(self, seconds, nbytes=0, error=False):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+                break
+        self.count += 1
+        self.total_time += seconds
+        self.bytes += nbytes
+        if error:
+            self.errors += 1
+
+    def to_json(self):
+        cumulative = 0
+        buckets = {}
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            cumulative += bucket_count
+            buckets[str(bound)] = cumulative
+        return {
+            'count': self.count,
+            'sum': self.total_time,
+            'mean': self.total_time / self.count if self.count else 0.,
+            'bytes': self.bytes,
+            'errors': self.errors,
+            'buckets': buckets
+        }
+
+
+class MetricsRegistry():
+    """
+    | biobb_remote metrics.MetricsRegistry
+    | Thread-safe store of operation metrics, exported as Prometheus text or json
+
+    Args:
+        buckets (tuple(float)) (Optional): (DEFAULT_BUCKETS) Latency histogram upper bounds (seconds)
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.series = {}
+        self.start_time = time.time()
+        self.lock = threading.Lock()
+
+    def observe(self, metric, label, seconds, nbytes=0, error=False):
+        """
+        | MetricsRegistry.observe
+        | Records one operation
+
+        Args:
+            metric (str): Metric name (SSH_CONNECT, SSH_COMMAND, SFTP, TASK_STAGE)
+            label (str): Operation name (command, sftp operation or stage)
+            seconds (float): Operation time
+            nbytes (int) (Optional): (0) Bytes transferred
+            error (bool) (Optional): (False) Operation failed
+        """
+        with self.lock:
+            key = (metric, label)
+            if key not in self.series:
+                self.series[key] = _Series(self.buckets)
+            self.series[key].observe(seconds, nbytes, error)
+
+    def reset(self):
+        """
+        | MetricsRegistry.reset
+        | Removes all recorded data
+        """
+        with self.lock:
+            self.series = {}
+            self.start_time = time.time()
+
+    def snapshot(self):
+        """
+        | MetricsRegistry.snapshot
+        | Current metrics as dict {metric: {label: {count, sum, mean, bytes, errors, buckets}}}
+        """
+        with self.lock:
+            metrics = {}
+            for (metric, label), series in sorted(self.series.items()):
+                metrics.setdefault(metric, {})[label] = series.to_json()
+        return {
+            'start_time': self.start_time,
+            'time': time.time(),
+            'pid': os.getpid(),
+            'metrics': metrics
+        }
+
+    def to_prometheus(self):
+        """
+        | MetricsRegistry.to_prometheus
+        | Current metrics in Prometheus text exposition format
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for metric, labels in snapshot['metrics'].items():
+            name = METRIC_PREFIX + metric
+            label_name = LABEL_NAMES.get(metric, 'operation')
+            lines.append('# HELP {}_seconds {}'.format(name, METRIC_HELP.get(metric, metric)))
+            lines.append('# TYPE {}_seconds histogram'.format(name))
+            for label, data in labels.items():
+                label_str = '{}="{}"'.format(label_name, _escape(label))
+                for bound, bucket_count in data['buckets'].items():
+                    lines.append('{}_seconds_bucket{{{},le="{}"}} {}'.format(name, label_str, bound, bucket_count))
+                lines.append('{}_seconds_bucket{{{},le="+Inf"}} {}'.format(name, label_str, data['count']))
+                lines.append('{}_seconds_sum{{{}}} {}'.format(name, label_str, data['sum']))
+                lines.append('{}_seconds_count{{{}}} {}'.format(name, label_str, data['count']))
+            for suffix, key in (('bytes_total', 'bytes'), ('errors_total', 'errors')):
+                lines.append('# TYPE {}_{} counter'.format(name, suffix))
+                for label, data in labels.items():
+                    lines.append('{}_{}{{{}="{}"}} {}'.format(name, suffix, label_name, _escape(label), data[key]))
+        return '\n'.join(lines) + '\n'
+
+    def save_prometheus(self, output_path):
+        """
+        | MetricsRegistry.save_prometheus
+        | Writes metrics as a Prometheus textfile (node_exporter textfile collector).
+        | File is replaced atomically, so it is never read half-written
+
+        Args:
+            output_path (str): Path to file, should end in .prom
+        """
+        _atomic_write(output_path, self.to_prometheus())
+
+    def save_json(self, output_path):
+        """
+        | MetricsRegistry.save_json
+        | Writes a json snapshot of metrics
+
+        Args:
+            output_path (str): Path to file
+        """
+        _atomic_write(output_path, json.dumps(self.snapshot(), indent=3))
+
+
+_REGISTRY = MetricsRegistry()
+_ENABLED = bool(os.environ.get(METRICS_ENV_VAR))
+
+
+def enable(registry=None):
+    """
+    | metrics.enable
+    | Starts collecting metrics. Also enabled at import when BIOBB_REMOTE_METRICS is set
+
+    Args:
+        registry (MetricsRegistry) (Optional): (None) Registry to use, defaults to the current one
+    """
+    global _ENABLED, _REGISTRY
+    if registry is not None:
+        _REGISTRY = registry
+    _ENABLED = True
+
+
+def disable():
+    """
+    | metrics.disable
+    | Stops collecting metrics, recorded data are kept
+    """
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled():
+    """
+    | metrics.is_enabled
+    | Whether metrics are being collected
+    """
+    return _ENABLED
+
+
+def get_registry():
+    """
+    | metrics.get_registry
+    | Current metrics registry
+    """
+    return _REGISTRY
+
+
+def observe(metric, label, seconds, nbytes=0, error=False):
+    """
+    | metrics.observe
+    | Records one operation in the current registry, if enabled. See MetricsRegistry.observe
+    """
+    if _ENABLED:
+        _REGISTRY.observe(metric, label, seconds, nbytes, error)
+
+
+def instrument(metric, label=None, get_label=None, get_bytes=None):
+    """
+    | metrics.instrument
+    | Decorator timing every call of a function. Exceptions (and sys.exit) are counted as errors.
+    | When metrics are disabled the function is called directly
+
+    Args:
+        metric (str): Metric name
+        label (str) (Optional): (None) Fixed label, defaults to the function name
+        get_label (function) (Optional): (None) Computes the label from the call arguments
+        get_bytes (function) (Optional): (None) Computes transferred bytes from (result, call arguments)
+    """
+    def decorator(func):
+        fixed_label = label or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _ENABLED:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                _REGISTRY.observe(
+                    metric,
+                    get_label(*args, **kwargs) if get_label else fixed_label,
+                    time.perf_counter() - start,
+                    error=True
+                )
+                raise
+            elapsed = time.perf_counter() - start
+            nbytes = 0
+            if get_bytes:
+                try:
+                    nbytes = get_bytes(result, *args, **kwargs)
+                except (OSError, TypeError, ValueError):
+                    pass
+            _REGISTRY.observe(
+                metric,
+                get_label(*args, **kwargs) if get_label else fixed_label,
+                elapsed,
+                nbytes
+            )
+            return result
+        return wrapper
+    return decorator
+
+
+def command_name(command):
+    """
+    | metrics.command_name
+    | Short name of a shell command line (main program), used as label
+
+    Args:
+        command (str | list(str)): Command line
+    """
+    if isinstance(command, list):
+        command = ' '.join(command)
+    for segment in command.replace('&&', ';').replace('\n', ';').split(';'):
+        words = segment.split()
+        if words and words[0] not in _COMMAND_PREFIXES:
+            return os.path.basename(words[0])
+    return 'shell'
+
+
+def save(output_path):
+    """
+    | metrics.save
+    | Saves current metrics, as Prometheus text if output_path ends in .prom, json otherwise
+
+    Args:
+        output_path (str): Path to file
+    """
+    if output_path.endswith('.prom'):
+        _REGISTRY.save_prometheus(output_path)
+    else:
+        _REGISTRY.save_json(output_path)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _atomic_write(output_path, text):
+    """
+    | Private. metrics._atomic_write
+    | Writes to a temporary file and renames it
+    """
+    tmp_path = '{}.{}.tmp'.format(output_path, os.getpid())
+    try:
+        with open(tmp_path, 'w') as output_file:
+            output_file.write(text)
+        os.replace(tmp_path, output_path)
+    except OSError as err:
+        sys.exit(err)
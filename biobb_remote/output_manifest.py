@@ -0,0 +1,119 @@
+""" Module to list job outputs in a manifest written by the queue script itself """
+
+import os
+import sys
+import shlex
+import stat
+import hashlib
+
+MANIFEST_FILE = '.biobb_manifest.tsv'
+MANIFEST_HEADER = '#biobb_manifest 1'
+MANIFEST_END = '#end'
+# Checksum algorithms, with the remote command computing them
+CHECKSUM_COMMANDS = {
+    'md5': 'md5sum',
+    'sha1': 'sha1sum',
+    'sha256': 'sha256sum'
+}
+
+
+def get_epilogue_lines(remote_wdir, checksum=None):
+    """
+    | output_manifest.get_epilogue_lines
+    | Queue script lines defining biobb_write_manifest, a function writing the manifest of the files
+    | in remote_wdir (one line per file: size, mtime, mode, checksum, name).
+    | The manifest is written to a temporary file and moved in place, so it is either complete or missing
+
+    Args:
+        remote_wdir (str): Remote working dir
+        checksum (str) (Optional): (None) Checksum algorithm (md5 | sha1 | sha256), no checksums if not set
+    """
+    if checksum and checksum not in CHECKSUM_COMMANDS:
+        sys.exit('Error: checksum {} not supported, use one of {}'.format(checksum, ', '.join(CHECKSUM_COMMANDS)))
+    find = "find . -maxdepth 1 -type f ! -name '{}*'".format(os.path.splitext(MANIFEST_FILE)[0])
+    if checksum:
+        list_lines = [
+            "        " + find + " -printf '%s\\t%T@\\t%m\\t%f\\n' | while IFS=$'\\t' read -r size mtime mode name; do",
+            "            printf '%s\\t%s\\t%s\\t%s\\t%s\\n' \"$size\" \"$mtime\" \"$mode\" "
+            "\"$({} -- \"$name\" | cut -d' ' -f1)\" \"$name\"".format(CHECKSUM_COMMANDS[checksum]),
+            "        done"
+        ]
+    else:
+        list_lines = ["        " + find + " -printf '%s\\t%T@\\t%m\\t-\\t%f\\n'"]
+    return [
+        '# Output manifest',
+        'biobb_write_manifest() {',
+        '    (',
+        '        cd {} || exit 1'.format(shlex.quote(remote_wdir)),
+        '        {',
+        "        echo '{} {}'".format(MANIFEST_HEADER, checksum or '-')
+    ] + list_lines + [
+        "        echo '{}'".format(MANIFEST_END),
+        '        }} > {0}.tmp && mv -f {0}.tmp {0}'.format(MANIFEST_FILE),
+        '    )',
+        '}',
+        'rm -f {}/{}'.format(shlex.quote(remote_wdir), MANIFEST_FILE)
+    ]
+
+
+class OutputManifest():
+    """
+    | biobb_remote output_manifest.OutputManifest
+    | Output files of a finished job, as listed by the queue script epilogue
+
+    Args:
+        checksum (str) (Optional): (None) Checksum algorithm used, None if no checksums
+        files (dict) (Optional): (None) {file name: stats dict (st_size, st_mtime, st_mode, checksum)}
+    """
+    def __init__(self, checksum=None, files=None):
+        self.checksum = checksum
+        self.files = files or {}
+
+    @classmethod
+    def parse(cls, text):
+        """
+        | OutputManifest.parse
+        | Manifest from the file contents, None if empty or incomplete
+
+        Args:
+            text (str): Manifest file contents
+        """
+        lines = text.splitlines()
+        if len(lines) < 2 or not lines[0].startswith(MANIFEST_HEADER) or lines[-1] != MANIFEST_END:
+            return None
+        checksum = lines[0][len(MANIFEST_HEADER):].strip()
+        manifest = cls(None if checksum in ('', '-') else checksum)
+        for line in lines[1:-1]:
+            try:
+                size, mtime, mode, file_checksum, file_name = line.split('\t', 4)
+                manifest.files[file_name] = {
+                    'st_size': int(size),
+                    'st_mtime': float(mtime),
+                    'st_mode': stat.S_IFREG | int(mode, 8),
+                    'checksum': None if file_checksum == '-' else file_checksum
+                }
+            except ValueError:
+                return None
+        return manifest
+
+    def verify(self, file_name, local_path):
+        """
+        | OutputManifest.verify
+        | Checks a downloaded file against the manifest, returns an error message or '' if correct
+
+        Args:
+            file_name (str): File name in the manifest
+            local_path (str): Path to downloaded file
+        """
+        entry = self.files[file_name]
+        size = os.path.getsize(local_path)
+        if size != entry['st_size']:
+            return '{}: size {}, expected {}'.format(file_name, size, entry['st_size'])
+        if self.checksum and entry['checksum']:
+            digest = hashlib.new(self.checksum)
+            with open(local_path, 'rb') as data_file:
+                for block in iter(lambda: data_file.read(1024 * 1024), b''):
+                    digest.update(block)
+            if digest.hexdigest() != entry['checksum']:
+                return '{}: {} checksum does not match'.format(file_name, self.checksum)
+        return ''
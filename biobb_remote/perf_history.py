@@ -0,0 +1,426 @@
+""" Module to keep a local history of task performance and predict resource usage """
+
+import os
+import sys
+import json
+import math
+import time
+
+DEFAULT_HISTORY_PATH = os.path.join(os.path.expanduser('~'), '.biobb_remote', 'perf_history.json')
+SETTINGS_KEYS = ['nodes', 'ntasks', 'cpus-per-task', 'ntasks-per-node', 'gres']
+# Walltime margins (factors applied to predicted time)
+DEFAULT_TIME_MARGIN = 1.5
+MIN_TIME_MARGIN = 1.1
+MIN_RUNS_FOR_MARGIN = 3
+TIMEOUT_PENALTY = 1.5
+MIN_WALL_TIME = 600
+
+
+def parse_time(time_str):
+    """
+    | perf_history.parse_time
+    | Converts a queue time limit (minutes, MM:SS, HH:MM:SS, D-HH, D-HH:MM, D-HH:MM:SS) to seconds
+
+    Args:
+        time_str (str | int): Time limit
+    """
+    time_str = str(time_str)
+    days = 0
+    if '-' in time_str:
+        days, time_str = time_str.split('-')
+        fields = [int(v) for v in time_str.split(':')]
+        fields += [0] * (3 - len(fields))
+        hours, mins, secs = fields
+    else:
+        fields = [int(v) for v in time_str.split(':')]
+        if len(fields) == 1:
+            hours, mins, secs = 0, fields[0], 0
+        elif len(fields) == 2:
+            hours, mins, secs = 0, fields[0], fields[1]
+        else:
+            hours, mins, secs = fields
+    return ((int(days) * 24 + hours) * 60 + mins) * 60 + secs
+
+
+def format_time(seconds):
+    """
+    | perf_history.format_time
+    | Converts seconds to a D-HH:MM:SS time limit, rounded up to minutes
+
+    Args:
+        seconds (float): Time in seconds
+    """
+    mins = int(-(-seconds // 60))
+    days, mins = divmod(mins, 24 * 60)
+    hours, mins = divmod(mins, 60)
+    return '{}-{:02d}:{:02d}:00'.format(days, hours, mins)
+
+
+def format_secs(seconds):
+    """
+    | perf_history.format_secs
+    | Seconds rounded for report tables, '-' if not known
+
+    Args:
+        seconds (float): Time in seconds, or None
+    """
+    if seconds is None:
+        return '-'
+    return '{:.0f}'.format(seconds)
+
+
+def settings_key(settings):
+    """
+    | perf_history.settings_key
+    | Hashable key identifying a resource configuration
+
+    Args:
+        settings (dict): Queue settings
+    """
+    return tuple(str(settings.get(k, '')) for k in SETTINGS_KEYS)
+
+
+def settings_cores(settings):
+    """
+    | perf_history.settings_cores
+    | Number of cores allocated by a configuration
+
+    Args:
+        settings (dict): Queue settings
+    """
+    return int(settings.get('ntasks', 1)) * int(settings.get('cpus-per-task', 1))
+
+
+def settings_gpus(settings):
+    """
+    | perf_history.settings_gpus
+    | Number of GPUs per node requested by a configuration
+
+    Args:
+        settings (dict): Queue settings
+    """
+    if settings.get('gres', '').startswith('gpu'):
+        return int(settings['gres'].split(':')[-1])
+    return 0
+
+
+class PerformanceHistory():
+    """
+    | biobb_remote perf_history.PerformanceHistory
+    | Local store of finished runs: (host, script fingerprint, input size, settings) -> (wall time, efficiency).
+    | Used to predict wall times and choose resource configurations.
+
+    Args:
+        history_path (str) (Optional): (~/.biobb_remote/perf_history.json) Path to history file
+    """
+    def __init__(self, history_path=DEFAULT_HISTORY_PATH):
+        self.history_path = history_path
+        self.records = []
+        if os.path.exists(history_path):
+            self.load()
+
+    def load(self):
+        """
+        | PerformanceHistory.load
+        | Loads records from history file
+        """
+        try:
+            with open(self.history_path, 'r') as history_file:
+                self.records = json.load(history_file)['records']
+        except (IOError, ValueError, KeyError) as err:
+            sys.exit("Error loading performance history: {}".format(err))
+
+    def save(self):
+        """
+        | PerformanceHistory.save
+        | Writes records to history file (atomic replace)
+        """
+        dir_path = os.path.dirname(self.history_path)
+        if dir_path and not os.path.exists(dir_path):
+            os.makedirs(dir_path)
+        tmp_path = self.history_path + '.tmp'
+        with open(tmp_path, 'w') as history_file:
+            json.dump({'records': self.records}, history_file, indent=1)
+        os.replace(tmp_path, self.history_path)
+
+    def add_record(
+            self,
+            host,
+            fingerprint,
+            input_size,
+            settings,
+            wall_time,
+            predicted_time=None,
+            state='COMPLETED',
+            job_id='',
+            requested_time=None
+            ):
+        """
+        | PerformanceHistory.add_record
+        | Adds a run to the history
+
+        Args:
+            host (str): Host identifier (host configuration description)
+            fingerprint (str): Run script fingerprint
+            input_size (int): Total input size in bytes
+            settings (dict): Queue settings used
+            wall_time (float): Elapsed time (seconds)
+            predicted_time (float) (Optional): (None) Wall time predicted before the run
+            state (str) (Optional): (COMPLETED) Final job state
+            job_id (str) (Optional): ('') Job id
+            requested_time (int) (Optional): (None) Time limit requested (seconds)
+        """
+        record = {
+            'host': host,
+            'fingerprint': fingerprint,
+            'input_size': input_size,
+            'settings': {k: settings[k] for k in SETTINGS_KEYS if k in settings},
+            'cores': settings_cores(settings),
+            'wall_time': wall_time,
+            'core_hours': wall_time * settings_cores(settings) / 3600.,
+            'predicted_time': predicted_time,
+            'requested_time': requested_time,
+            'state': state,
+            'job_id': job_id,
+            'timestamp': time.time()
+        }
+        self.records.append(record)
+        return record
+
+    def record_task(self, task, wall_time=None, save=True, fingerprint=None, input_size=None):
+        """
+        | PerformanceHistory.record_task
+        | Adds a finished task. Wall time is taken from queue accounting if not given.
+
+        Args:
+            task (Task): Finished task
+            wall_time (float) (Optional): (None) Elapsed time (seconds)
+            save (bool) (Optional): (True) Save history file after adding
+            fingerprint (str) (Optional): (None) Run script fingerprint, defaults to task's run script
+            input_size (int) (Optional): (None) Input size in bytes, defaults to task's input bundle
+        """
+        state = 'COMPLETED'
+        if wall_time is None:
+            accounting = task.get_job_accounting()
+            if not accounting or accounting.get('elapsed') is None:
+                print("Warning: wall time not available for task", task.id)
+                return None
+            wall_time = accounting['elapsed']
+            state = accounting['state']
+        record = self.add_record(
+            task.host_config['description'],
+            fingerprint or task.get_script_fingerprint(),
+            task.get_input_size() if input_size is None else input_size,
+            task.task_data['queue_settings'],
+            wall_time,
+            predicted_time=task.task_data.get('predicted_wall_time'),
+            state=state,
+            job_id=task.task_data.get('remote_job_id', ''),
+            requested_time=task.task_data.get('requested_wall_time')
+        )
+        if save:
+            self.save()
+        return record
+
+    def get_records(self, host=None, fingerprint=None, completed_only=True):
+        """
+        | PerformanceHistory.get_records
+        | Records matching host and fingerprint
+
+        Args:
+            host (str) (Optional): (None) Host identifier
+            fingerprint (str) (Optional): (None) Run script fingerprint
+            completed_only (bool) (Optional): (True) Skip runs not completed
+        """
+        return [
+            rec for rec in self.records
+            if (host is None or rec['host'] == host)
+            and (fingerprint is None or rec['fingerprint'] == fingerprint)
+            and (not completed_only or rec['state'] == 'COMPLETED')
+        ]
+
+    def predict(self, host, fingerprint, input_size, settings):
+        """
+        | PerformanceHistory.predict
+        | Predicted wall time (seconds) for a configuration, None if no similar runs recorded.
+        | Recorded times are scaled linearly with input size, closest sizes weight more.
+
+        Args:
+            host (str): Host identifier
+            fingerprint (str): Run script fingerprint
+            input_size (int): Total input size in bytes
+            settings (dict): Queue settings
+        """
+        key = settings_key(settings)
+        records = [
+            rec for rec in self.get_records(host, fingerprint)
+            if settings_key(rec['settings']) == key
+        ]
+        if not records:
+            return None
+        sum_w = 0.
+        sum_t = 0.
+        for rec in records:
+            if rec['input_size'] and input_size:
+                ratio = float(input_size) / rec['input_size']
+            else:
+                ratio = 1.
+            weight = 1. / (1. + abs(ratio - 1.))
+            sum_w += weight
+            sum_t += weight * rec['wall_time'] * ratio
+        return sum_t / sum_w
+
+    def recommend(self, host, fingerprint, input_size, min_gpus=0, max_wall_time=0):
+        """
+        | PerformanceHistory.recommend
+        | Recorded configuration with the best predicted throughput per core-hour, None if no runs recorded.
+
+        Args:
+            host (str): Host identifier
+            fingerprint (str): Run script fingerprint
+            input_size (int): Total input size in bytes
+            min_gpus (int) (Optional): (0) Only configurations with at least these GPUs per node
+            max_wall_time (float) (Optional): (0) Only configurations predicted to end within this time (seconds), 0 for no limit
+        """
+        candidates = {}
+        for rec in self.get_records(host, fingerprint):
+            if settings_gpus(rec['settings']) >= min_gpus:
+                candidates[settings_key(rec['settings'])] = rec['settings']
+        best = None
+        for settings in candidates.values():
+            predicted = self.predict(host, fingerprint, input_size, settings)
+            if not predicted or (max_wall_time and predicted > max_wall_time):
+                continue
+            # Runs per core-hour
+            throughput = 3600. / (predicted * settings_cores(settings))
+            if best is None or throughput > best['throughput']:
+                best = {
+                    'fingerprint': fingerprint,
+                    'settings': settings,
+                    'predicted_time': predicted,
+                    'throughput': throughput
+                }
+        return best
+
+    def get_time_margin(self, host, fingerprint):
+        """
+        | PerformanceHistory.get_time_margin
+        | Safety factor to apply to predicted wall times. Tuned from the actual/predicted ratios
+        | of recorded runs (95th percentile), increased for each run that hit the time limit.
+
+        Args:
+            host (str): Host identifier
+            fingerprint (str): Run script fingerprint
+        """
+        ratios = []
+        timeouts = 0
+        for rec in self.get_records(host, fingerprint, completed_only=False):
+            if not rec.get('predicted_time'):
+                continue
+            if rec['state'] == 'TIMEOUT':
+                timeouts += 1
+                ratios.append(rec['wall_time'] / rec['predicted_time'] * TIMEOUT_PENALTY)
+            elif rec['state'] == 'COMPLETED':
+                ratios.append(rec['wall_time'] / rec['predicted_time'])
+        if len(ratios) < MIN_RUNS_FOR_MARGIN:
+            return DEFAULT_TIME_MARGIN * TIMEOUT_PENALTY ** min(timeouts, 2)
+        ratios.sort()
+        return max(MIN_TIME_MARGIN, ratios[int(math.ceil(0.95 * (len(ratios) - 1)))] * MIN_TIME_MARGIN)
+
+    def predict_time_limit(self, host, fingerprint, input_size, settings, max_time=None):
+        """
+        | PerformanceHistory.predict_time_limit
+        | Time limit (seconds) to request: predicted wall time with safety margin.
+        | Returns (None, None) if no similar runs are recorded.
+
+        Args:
+            host (str): Host identifier
+            fingerprint (str): Run script fingerprint
+            input_size (int): Total input size in bytes
+            settings (dict): Queue settings
+            max_time (int) (Optional): (None) Upper bound (seconds), usually the queue profile limit
+        """
+        predicted = self.predict(host, fingerprint, input_size, settings)
+        if predicted is None:
+            return None, None
+        limit = max(MIN_WALL_TIME, predicted * self.get_time_margin(host, fingerprint))
+        if max_time:
+            limit = min(limit, max_time)
+        return predicted, limit
+
+    def get_timeout_rate(self, host=None, fingerprint=None):
+        """
+        | PerformanceHistory.get_timeout_rate
+        | Fraction of runs with a predicted time limit that ended in TIMEOUT
+
+        Args:
+            host (str) (Optional): (None) Host identifier
+            fingerprint (str) (Optional): (None) Run script fingerprint
+        """
+        recs = [
+            rec for rec in self.get_records(host, fingerprint, completed_only=False)
+            if rec.get('predicted_time')
+        ]
+        if not recs:
+            return 0.
+        return len([rec for rec in recs if rec['state'] == 'TIMEOUT']) / len(recs)
+
+    def get_efficiency_table(self, host, fingerprint):
+        """
+        | PerformanceHistory.get_efficiency_table
+        | Mean wall time and parallel efficiency per recorded configuration,
+        | relative to the configuration with fewer cores
+
+        Args:
+            host (str): Host identifier
+            fingerprint (str): Run script fingerprint
+        """
+        groups = {}
+        for rec in self.get_records(host, fingerprint):
+            groups.setdefault(settings_key(rec['settings']), []).append(rec)
+        table = []
+        for recs in groups.values():
+            table.append({
+                'settings': recs[0]['settings'],
+                'cores': recs[0]['cores'],
+                'runs': len(recs),
+                'wall_time': sum(rec['wall_time'] for rec in recs) / len(recs)
+            })
+        table.sort(key=lambda row: row['cores'])
+        if table:
+            ref = table[0]
+            for row in table:
+                row['efficiency'] = ref['wall_time'] * ref['cores'] / (row['wall_time'] * row['cores'])
+        return table
+
+    def prediction_error(self, host=None, fingerprint=None):
+        """
+        | PerformanceHistory.prediction_error
+        | Mean absolute relative error of the predictions recorded along with the runs
+
+        Args:
+            host (str) (Optional): (None) Host identifier
+            fingerprint (str) (Optional): (None) Run script fingerprint
+        """
+        errors = [
+            abs(rec['wall_time'] - rec['predicted_time']) / rec['wall_time']
+            for rec in self.get_records(host, fingerprint)
+            if rec.get('predicted_time') and rec['wall_time']
+        ]
+        if not errors:
+            return {'count': 0, 'mean_error': None}
+        return {'count': len(errors), 'mean_error': sum(errors) / len(errors)}
+
+    def get_error_summary(self, host=None, fingerprint=None):
+        """
+        | PerformanceHistory.get_error_summary
+        | Readable prediction error
+
+        Args:
+            host (str) (Optional): (None) Host identifier
+            fingerprint (str) (Optional): (None) Run script fingerprint
+        """
+        error = self.prediction_error(host, fingerprint)
+        if not error['count']:
+            return 'not available'
+        return '{:.0%} over {} runs'.format(error['mean_error'], error['count'])
@@ -0,0 +1,399 @@
+""" Module to run campaigns of tasks overlapping data transfers and queue waits """
+
+import sys
+import time
+import queue
+import threading
+
+from biobb_remote.task import FINISHED, CANCELLED
+
+UPLOAD = 'upload'
+SUBMIT = 'submit'
+MONITOR = 'monitor'
+DOWNLOAD = 'download'
+STAGES = [UPLOAD, SUBMIT, MONITOR, DOWNLOAD]
+
+
+class StageStats():
+    """
+    | biobb_remote pipeline.StageStats
+    | Class to accumulate timings of a pipeline stage
+
+    Args:
+        name (str): Stage name
+    """
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.errors = 0
+        self.busy_time = 0.
+        self.min_time = None
+        self.max_time = 0.
+        self.first_start = None
+        self.last_end = None
+        self.lock = threading.Lock()
+
+    def add(self, start, end, error=False):
+        """
+        | StageStats.add
+        | Records a completed stage execution
+
+        Args:
+            start (float): Start time (as given by time.time)
+            end (float): End time (as given by time.time)
+            error (bool) (Optional): (False) Execution ended with error
+        """
+        elapsed = end - start
+        with self.lock:
+            if error:
+                self.errors += 1
+            else:
+                self.count += 1
+            self.busy_time += elapsed
+            if self.min_time is None or elapsed < self.min_time:
+                self.min_time = elapsed
+            self.max_time = max(self.max_time, elapsed)
+            if self.first_start is None or start < self.first_start:
+                self.first_start = start
+            if self.last_end is None or end > self.last_end:
+                self.last_end = end
+
+    def throughput(self):
+        """
+        | StageStats.throughput
+        | Completed tasks per minute since the stage started
+        """
+        if not self.count or self.first_start is None:
+            return 0.
+        span = max(self.last_end - self.first_start, 1e-6)
+        return self.count * 60. / span
+
+    def summary(self):
+        """
+        | StageStats.summary
+        | Returns a dict with the accumulated stats
+        """
+        with self.lock:
+            return {
+                'stage': self.name,
+                'done': self.count,
+                'errors': self.errors,
+                'mean_time': self.busy_time / max(self.count + self.errors, 1),
+                'min_time': self.min_time or 0.,
+                'max_time': self.max_time,
+                'tasks_per_min': self.throughput()
+            }
+
+
+class PipelineItem():
+    """
+    | biobb_remote pipeline.PipelineItem
+    | Class to keep a task and the parameters for each pipeline stage
+
+    Args:
+        task (Task): Task object, with credentials and host configuration already set
+        local_data_path (str): Local directory with input data
+        remote_base_path (str): Remote base path, task working dir is created within
+        submit_args (dict) (Optional): (None) Arguments passed to Task.submit
+        output_data_path (str) (Optional): ('') Local directory for output, defaults to input dir
+        output_args (dict) (Optional): (None) Additional arguments passed to Task.get_output_data
+    """
+    def __init__(
+            self,
+            task,
+            local_data_path,
+            remote_base_path,
+            submit_args=None,
+            output_data_path='',
+            output_args=None
+            ):
+        self.task = task
+        self.local_data_path = local_data_path
+        self.remote_base_path = remote_base_path
+        self.submit_args = submit_args or {}
+        self.output_data_path = output_data_path
+        self.output_args = output_args or {}
+        self.timings = {}
+        self.error = None
+
+    def is_failed(self):
+        """
+        | PipelineItem.is_failed
+        | Task did not go through all stages
+        """
+        return self.error is not None
+
+
+class TaskPipeline():
+    """
+    | biobb_remote pipeline.TaskPipeline
+    | Class to run a campaign of tasks. Upload, submission, monitoring and download
+    | stages work concurrently, each with a bounded number of workers.
+    | Queues between stages are bounded, so fast stages wait for slow ones (backpressure).
+
+    Args:
+        upload_workers (int) (Optional): (2) Number of concurrent uploads
+        submit_workers (int) (Optional): (1) Number of concurrent submissions
+        download_workers (int) (Optional): (2) Number of concurrent downloads
+        poll_time (int) (Optional): (30) Polling interval of the shared job monitor (seconds)
+        max_queued (int) (Optional): (4) Max number of tasks waiting between two stages
+        max_active_jobs (int) (Optional): (0) Max number of tasks submitted and not yet downloaded, 0 for no limit
+        report_time (int) (Optional): (0) Interval to print a live summary (seconds), 0 to disable
+    """
+    def __init__(
+            self,
+            upload_workers=2,
+            submit_workers=1,
+            download_workers=2,
+            poll_time=30,
+            max_queued=4,
+            max_active_jobs=0,
+            report_time=0
+            ):
+        self.workers = {
+            UPLOAD: max(1, upload_workers),
+            SUBMIT: max(1, submit_workers),
+            DOWNLOAD: max(1, download_workers)
+        }
+        self.poll_time = poll_time
+        self.max_queued = max_queued
+        self.max_active_jobs = max_active_jobs
+        self.report_time = report_time
+        self.items = []
+        self.stats = {stage: StageStats(stage) for stage in STAGES}
+        self.start_time = None
+        self.end_time = None
+        self._queues = {}
+        self._active_jobs = None
+        self._finished = threading.Event()
+
+    def add_task(
+            self,
+            task,
+            local_data_path,
+            remote_base_path,
+            submit_args=None,
+            output_data_path='',
+            output_args=None
+            ):
+        """
+        | TaskPipeline.add_task
+        | Adds a task to the campaign. See PipelineItem for arguments.
+        """
+        item = PipelineItem(
+            task, local_data_path, remote_base_path, submit_args, output_data_path, output_args
+        )
+        self.items.append(item)
+        return item
+
+    def run(self):
+        """
+        | TaskPipeline.run
+        | Runs all tasks through the pipeline, returns when all have been downloaded or failed.
+        """
+        self.start_time = time.time()
+        self._finished.clear()
+        self._queues = {stage: queue.Queue(maxsize=self.max_queued) for stage in STAGES}
+        if self.max_active_jobs:
+            self._active_jobs = threading.BoundedSemaphore(self.max_active_jobs)
+        else:
+            self._active_jobs = None
+
+        threads = {stage: [] for stage in STAGES}
+        for stage, worker in [
+                (UPLOAD, self._upload_worker),
+                (SUBMIT, self._submit_worker),
+                (DOWNLOAD, self._download_worker)]:
+            for i in range(self.workers[stage]):
+                threads[stage].append(
+                    threading.Thread(target=worker, name='{}_{}'.format(stage, i), daemon=True)
+                )
+        threads[MONITOR].append(
+            threading.Thread(target=self._monitor_worker, name=MONITOR, daemon=True)
+        )
+        for stage in STAGES:
+            for thr in threads[stage]:
+                thr.start()
+
+        if self.report_time:
+            reporter = threading.Thread(target=self._reporter, daemon=True)
+            reporter.start()
+
+        # Feeding the pipeline blocks when upload workers are busy and the queue is full
+        for item in self.items:
+            self._queues[UPLOAD].put(item)
+
+        # Shutdown stage by stage, each stage drains its input before the next one is told to stop
+        for stage in STAGES:
+            for thr in threads[stage]:
+                self._queues[stage].put(None)
+            for thr in threads[stage]:
+                thr.join()
+
+        self.end_time = time.time()
+        self._finished.set()
+        return self.items
+
+    def get_summary(self):
+        """
+        | TaskPipeline.get_summary
+        | Returns per-stage stats as a list of dicts
+        """
+        return [self.stats[stage].summary() for stage in STAGES]
+
+    def print_summary(self, file=sys.stdout):
+        """
+        | TaskPipeline.print_summary
+        | Prints per-stage stats
+
+        Args:
+            file (file handle) (Optional): (sys.stdout) Output stream
+        """
+        elapsed = (self.end_time or time.time()) - (self.start_time or time.time())
+        print(
+            "Pipeline: {} tasks, {} failed, elapsed {:.1f}s".format(
+                len(self.items), len([it for it in self.items if it.is_failed()]), elapsed
+            ),
+            file=file
+        )
+        print(
+            '{:10s} {:>6s} {:>6s} {:>10s} {:>10s} {:>10s} {:>10s}'.format(
+                'Stage', 'Done', 'Errors', 'Mean(s)', 'Min(s)', 'Max(s)', 'Tasks/min'
+            ),
+            file=file
+        )
+        for stage in self.get_summary():
+            print(
+                '{stage:10s} {done:6d} {errors:6d} {mean_time:10.2f} {min_time:10.2f} '
+                '{max_time:10.2f} {tasks_per_min:10.2f}'.format(**stage),
+                file=file
+            )
+
+    def _run_stage(self, stage, item, func):
+        """
+        | Private. TaskPipeline._run_stage
+        | Executes a stage function on an item recording timings and errors
+        """
+        start = time.time()
+        error = False
+        try:
+            func(item)
+        except (Exception, SystemExit) as err:
+            item.error = '{}: {}'.format(stage, err)
+            print("Warning: task {} failed at {} stage: {}".format(item.task.id, stage, err))
+            error = True
+        end = time.time()
+        item.timings[stage] = end - start
+        self.stats[stage].add(start, end, error)
+        return not error
+
+    def _upload(self, item):
+        item.task.set_local_data_bundle(item.local_data_path)
+        item.task.send_input_data(item.remote_base_path)
+
+    def _submit(self, item):
+        item.task.submit(**item.submit_args)
+
+    def _download(self, item):
+        item.task.get_output_data(item.output_data_path, **item.output_args)
+
+    def _upload_worker(self):
+        while True:
+            item = self._queues[UPLOAD].get()
+            if item is None:
+                return
+            if self._run_stage(UPLOAD, item, self._upload):
+                self._queues[SUBMIT].put(item)
+
+    def _submit_worker(self):
+        while True:
+            item = self._queues[SUBMIT].get()
+            if item is None:
+                return
+            if self._active_jobs:
+                self._active_jobs.acquire()
+            if self._run_stage(SUBMIT, item, self._submit):
+                item.monitor_start = time.time()
+                item.last_check = item.monitor_start
+                self._queues[MONITOR].put(item)
+            elif self._active_jobs:
+                self._active_jobs.release()
+
+    def _monitor_worker(self):
+        """
+        | Private. TaskPipeline._monitor_worker
+        | Single thread polling all submitted jobs, each one every poll_time seconds
+        """
+        active = []
+        closing = False
+        while not closing or active:
+            if active:
+                next_check = min(item.last_check for item in active) + self.poll_time
+                timeout = max(0., next_check - time.time())
+            else:
+                timeout = None
+            closing = self._collect_submitted(active, timeout) or closing
+            still_active = []
+            for item in active:
+                if time.time() - item.last_check < self.poll_time:
+                    still_active.append(item)
+                    continue
+                item.last_check = time.time()
+                try:
+                    status = item.task._check_job_status()
+                except (Exception, SystemExit) as err:
+                    item.error = '{}: {}'.format(MONITOR, err)
+                    self.stats[MONITOR].add(item.monitor_start, time.time(), True)
+                    if self._active_jobs:
+                        self._active_jobs.release()
+                    continue
+                if status in (FINISHED, CANCELLED):
+                    end = time.time()
+                    item.timings[MONITOR] = end - item.monitor_start
+                    self.stats[MONITOR].add(item.monitor_start, end, status == CANCELLED)
+                    if status == CANCELLED:
+                        item.error = '{}: job cancelled'.format(MONITOR)
+                        if self._active_jobs:
+                            self._active_jobs.release()
+                    else:
+                        self._queues[DOWNLOAD].put(item)
+                else:
+                    still_active.append(item)
+            active = still_active
+
+    def _collect_submitted(self, active, timeout):
+        """
+        | Private. TaskPipeline._collect_submitted
+        | Waits up to timeout for new submissions and adds them to active list.
+        | Returns True when the end of submissions mark is found.
+
+        Args:
+            active (list(PipelineItem)): List of monitored items
+            timeout (float): Max waiting time (seconds), None to wait indefinitely
+        """
+        closing = False
+        try:
+            item = self._queues[MONITOR].get(timeout=timeout)
+            while True:
+                if item is None:
+                    closing = True
+                else:
+                    item.last_check = time.time()
+                    active.append(item)
+                item = self._queues[MONITOR].get_nowait()
+        except queue.Empty:
+            pass
+        return closing
+
+    def _download_worker(self):
+        while True:
+            item = self._queues[DOWNLOAD].get()
+            if item is None:
+                return
+            self._run_stage(DOWNLOAD, item, self._download)
+            if self._active_jobs:
+                self._active_jobs.release()
+
+    def _reporter(self):
+        while not self._finished.wait(self.report_time):
+            self.print_summary()
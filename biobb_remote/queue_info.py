@@ -0,0 +1,315 @@
+""" Module to parse and cache remote cluster load information """
+
+import re
+import time
+import threading
+
+SECTION_MARK = '@@biobb_section'
+DEFAULT_SNAPSHOT_TTL = 60
+
+_SNAPSHOT_CACHE = {}
+_SNAPSHOT_LOCKS = {}
+_CACHE_LOCK = threading.Lock()
+
+
+class QueueSnapshot():
+    """
+    | biobb_remote queue_info.QueueSnapshot
+    | Structured view of the cluster load at a given time
+
+    Args:
+        host (str): Host identifier (host configuration description)
+        timestamp (float) (Optional): (None) Time of the snapshot, defaults to now
+    """
+    def __init__(self, host, timestamp=None):
+        self.host = host
+        self.timestamp = timestamp or time.time()
+        self.partitions = {}
+        self.user_jobs = {'running': 0, 'pending': 0}
+        self.user_limits = {}
+        self.queue_limits = {}
+        self.raw_queues = ''
+
+    def add_partition(self, name):
+        """
+        | QueueSnapshot.add_partition
+        | Adds (or returns) a partition entry
+
+        Args:
+            name (str): Partition name
+        """
+        if name not in self.partitions:
+            self.partitions[name] = {
+                'available': True,
+                'allocated_nodes': 0,
+                'idle_nodes': 0,
+                'other_nodes': 0,
+                'total_nodes': 0,
+                'running_jobs': 0,
+                'pending_jobs': 0,
+                'gpu': False
+            }
+        return self.partitions[name]
+
+    def age(self):
+        """
+        | QueueSnapshot.age
+        | Seconds since the snapshot was taken
+        """
+        return time.time() - self.timestamp
+
+    def get_idle_nodes(self, partition=None):
+        """
+        | QueueSnapshot.get_idle_nodes
+        | Idle nodes in a partition, or in all partitions
+
+        Args:
+            partition (str) (Optional): (None) Partition name
+        """
+        if partition:
+            return self.partitions.get(partition, {}).get('idle_nodes', 0)
+        return sum(part['idle_nodes'] for part in self.partitions.values())
+
+    def get_idle_gpu_nodes(self):
+        """
+        | QueueSnapshot.get_idle_gpu_nodes
+        | Idle nodes in available partitions with GPUs, None if no partition is known to have GPUs
+        """
+        parts = [part for part in self.partitions.values() if part['gpu']]
+        if not parts:
+            return None
+        return sum(part['idle_nodes'] for part in parts if part['available'])
+
+    def get_pending_jobs(self, partition=None):
+        """
+        | QueueSnapshot.get_pending_jobs
+        | Pending jobs in a partition, or in all partitions
+
+        Args:
+            partition (str) (Optional): (None) Partition name
+        """
+        if partition:
+            return self.partitions.get(partition, {}).get('pending_jobs', 0)
+        return sum(part['pending_jobs'] for part in self.partitions.values())
+
+    def get_load(self, partition=None):
+        """
+        | QueueSnapshot.get_load
+        | Fraction of allocated nodes plus pending jobs per node (>1 means congested)
+
+        Args:
+            partition (str) (Optional): (None) Partition name
+        """
+        if partition:
+            parts = [self.partitions[partition]] if partition in self.partitions else []
+        else:
+            parts = [part for part in self.partitions.values() if part['available']]
+        total = sum(part['total_nodes'] - part['other_nodes'] for part in parts)
+        if not total:
+            return None
+        allocated = sum(part['allocated_nodes'] for part in parts)
+        pending = sum(part['pending_jobs'] for part in parts)
+        return (allocated + pending) / float(total)
+
+    def to_dict(self):
+        """
+        | QueueSnapshot.to_dict
+        | Returns snapshot data as a dict
+        """
+        return {
+            'host': self.host,
+            'timestamp': self.timestamp,
+            'partitions': self.partitions,
+            'user_jobs': self.user_jobs,
+            'user_limits': self.user_limits,
+            'queue_limits': self.queue_limits
+        }
+
+
+def split_sections(output):
+    """
+    | queue_info.split_sections
+    | Splits the output of a batched command into sections labelled with SECTION_MARK lines
+
+    Args:
+        output (str): Command output
+    """
+    sections = {}
+    label = None
+    for line in output.split('\n'):
+        if line.startswith(SECTION_MARK):
+            label = line[len(SECTION_MARK):].strip()
+            sections[label] = []
+        elif label is not None:
+            sections[label].append(line)
+    return sections
+
+
+def parse_sinfo(snapshot, lines):
+    """
+    | queue_info.parse_sinfo
+    | Parses sinfo -h -o '%R|%a|%F|%G' (partition|availability|allocated/idle/other/total|generic resources).
+    | The generic resources field is optional, partitions listing gpu resources are marked as gpu
+
+    Args:
+        snapshot (QueueSnapshot): Snapshot to fill
+        lines (list(str)): sinfo output lines
+    """
+    for line in lines:
+        fields = line.strip().split('|')
+        if len(fields) not in (3, 4):
+            continue
+        try:
+            alloc, idle, other, total = [int(v) for v in fields[2].split('/')]
+        except ValueError:
+            continue
+        part = snapshot.add_partition(fields[0].rstrip('*'))
+        part['available'] = part['available'] and fields[1] == 'up'
+        part['allocated_nodes'] += alloc
+        part['idle_nodes'] += idle
+        part['other_nodes'] += other
+        part['total_nodes'] += total
+        if len(fields) == 4 and 'gpu' in fields[3]:
+            part['gpu'] = True
+
+
+def parse_squeue_counts(snapshot, lines):
+    """
+    | queue_info.parse_squeue_counts
+    | Parses squeue -h -a -o '%P %T' | sort | uniq -c (count partition state)
+
+    Args:
+        snapshot (QueueSnapshot): Snapshot to fill
+        lines (list(str)): command output lines
+    """
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 3:
+            continue
+        count, partitions, state = fields
+        # Pending jobs may list several partitions
+        for name in partitions.split(','):
+            part = snapshot.add_partition(name)
+            if state == 'PENDING':
+                part['pending_jobs'] += int(count)
+            elif state == 'RUNNING':
+                part['running_jobs'] += int(count)
+
+
+def parse_user_jobs(snapshot, lines):
+    """
+    | queue_info.parse_user_jobs
+    | Parses squeue -h -u $USER -o '%T' | sort | uniq -c
+
+    Args:
+        snapshot (QueueSnapshot): Snapshot to fill
+        lines (list(str)): command output lines
+    """
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 2:
+            continue
+        if fields[1] == 'PENDING':
+            snapshot.user_jobs['pending'] += int(fields[0])
+        elif fields[1] == 'RUNNING':
+            snapshot.user_jobs['running'] += int(fields[0])
+
+
+def parse_qos_limits(snapshot, lines):
+    """
+    | queue_info.parse_qos_limits
+    | Parses sacctmgr -n -P show qos format=Name,MaxWall,MaxJobsPU,MaxSubmitPU,MaxTRESPU
+
+    Args:
+        snapshot (QueueSnapshot): Snapshot to fill
+        lines (list(str)): command output lines
+    """
+    for line in lines:
+        fields = line.strip().split('|')
+        if len(fields) != 5 or not fields[0]:
+            continue
+        snapshot.user_limits[fields[0]] = {
+            'max_wall': fields[1],
+            'max_jobs': int(fields[2]) if fields[2].isdigit() else None,
+            'max_submit': int(fields[3]) if fields[3].isdigit() else None,
+            'max_tres': fields[4]
+        }
+
+
+def parse_queue_limits(snapshot, lines):
+    """
+    | queue_info.parse_queue_limits
+    | Parses the table printed by the host queues_command (e.g. bsc_queues): a header line naming
+    | the columns (separated by two or more spaces, the first one is the queue or QOS name),
+    | an optional line of dashes, and one whitespace-separated row per queue.
+    | Wall time, running and submitted jobs columns are stored as max_wall, max_jobs and max_submit,
+    | other columns under their lower-case name
+
+    Args:
+        snapshot (QueueSnapshot): Snapshot to fill
+        lines (list(str)): command output lines
+    """
+    snapshot.raw_queues = '\n'.join(lines)
+    columns = None
+    for line in lines:
+        if not line.strip() or set(line.strip()) <= set('-=+ '):
+            continue
+        if columns is None:
+            header = [name for name in re.split(r'\s{2,}', line.strip()) if name]
+            if len(header) > 1 and re.match(r'(queue|qos|partition)', header[0], re.IGNORECASE):
+                columns = [_limit_key(name) for name in header]
+            continue
+        fields = line.split()
+        if len(fields) != len(columns):
+            continue
+        snapshot.queue_limits[fields[0]] = {
+            key: int(value) if value.isdigit() else value
+            for key, value in zip(columns[1:], fields[1:])
+        }
+
+
+def _limit_key(column_name):
+    """
+    | Private. queue_info._limit_key
+    | Limit name for a queues_command column header
+    """
+    name = column_name.lower()
+    if 'wall' in name or 'time' in name:
+        return 'max_wall'
+    if 'submit' in name:
+        return 'max_submit'
+    if 'job' in name:
+        return 'max_jobs'
+    return re.sub(r'[^a-z0-9]+', '_', name).strip('_')
+
+
+def get_cached_snapshot(key, build, ttl=DEFAULT_SNAPSHOT_TTL, refresh=False):
+    """
+    | queue_info.get_cached_snapshot
+    | Returns the snapshot cached under key if younger than ttl, otherwise builds a new one.
+    | Concurrent callers for the same key wait for a single build.
+
+    Args:
+        key (tuple): Cache key (e.g. host and user)
+        build (function): Function returning a new QueueSnapshot
+        ttl (float) (Optional): (60) Max age of cached snapshot (seconds)
+        refresh (bool) (Optional): (False) Force a new snapshot
+    """
+    with _CACHE_LOCK:
+        lock = _SNAPSHOT_LOCKS.setdefault(key, threading.Lock())
+    with lock:
+        snapshot = _SNAPSHOT_CACHE.get(key)
+        if refresh or snapshot is None or snapshot.age() > ttl:
+            snapshot = build()
+            if snapshot is not None:
+                _SNAPSHOT_CACHE[key] = snapshot
+        return snapshot
+
+
+def clear_cache():
+    """
+    | queue_info.clear_cache
+    | Drops all cached snapshots
+    """
+    with _CACHE_LOCK:
+        _SNAPSHOT_CACHE.clear()
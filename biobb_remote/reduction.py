@@ -0,0 +1,187 @@
+""" Module to reduce trajectories on the remote host before downloading them """
+
+import os
+import re
+import sys
+import shlex
+import fnmatch
+
+DEFAULT_PATTERNS = ['*.xtc', '*.trr']
+DEFAULT_SUFFIX = '_reduced'
+DEFAULT_MODULE_SET = 'gromacs'
+DEFAULT_GMX = 'gmx'
+REDUCED_MARK = 'BIOBB_REDUCED'
+FAILED_MARK = 'BIOBB_REDUCE_FAILED'
+
+
+class TrajectoryReduction():
+    """
+    | biobb_remote reduction.TrajectoryReduction
+    | Reduction of trajectory files with gmx trjconv, run on the remote login node with the modules of the
+    | host configuration: frame stride, atom selection (index group) and format conversion.
+    | Reduced files are named <name><suffix>[_s<stride>][_<group>].<format>, so each combination of settings
+    | has its own file, and are not rebuilt while newer than the original.
+
+    Args:
+        stride (int) (Optional): (1) Keep one frame every stride frames
+        group (str) (Optional): (None) Index group to keep (e.g. Protein), requires structure
+        output_format (str) (Optional): (None) Output format (xtc, trr, pdb, gro), defaults to the original one
+        structure (str) (Optional): (None) Structure/run input file in the working dir (e.g. md.tpr) used for the selection. Defaults to the first .tpr file if group is set
+        patterns (list(str)) (Optional): (['*.xtc', '*.trr']) Glob patterns of trajectory files to reduce
+        module_set (str) (Optional): (gromacs) Module set to load, from the host configuration. None to use the default environment
+        gmx (str) (Optional): (gmx) GROMACS executable (e.g. gmx_mpi)
+        suffix (str) (Optional): (_reduced) Suffix of reduced file names
+    """
+    def __init__(
+            self,
+            stride=1,
+            group=None,
+            output_format=None,
+            structure=None,
+            patterns=None,
+            module_set=DEFAULT_MODULE_SET,
+            gmx=DEFAULT_GMX,
+            suffix=DEFAULT_SUFFIX
+            ):
+        if int(stride) < 1:
+            sys.exit('Error: reduction stride must be >= 1')
+        self.stride = int(stride)
+        self.group = group
+        self.output_format = output_format.lstrip('.') if output_format else None
+        self.structure = structure
+        self.patterns = patterns or DEFAULT_PATTERNS
+        self.module_set = module_set
+        self.gmx = gmx
+        self.suffix = suffix
+
+    def to_json(self):
+        """
+        | TrajectoryReduction.to_json
+        | Settings as a json-serializable dict
+        """
+        return dict(vars(self))
+
+    def get_output_name(self, file_name):
+        """
+        | TrajectoryReduction.get_output_name
+        | Name of the reduced file, tagged with stride and group
+
+        Args:
+            file_name (str): Original file name
+        """
+        base, ext = os.path.splitext(file_name)
+        tag = self.suffix
+        if self.stride > 1:
+            tag += '_s{}'.format(self.stride)
+        if self.group:
+            tag += '_' + re.sub(r'[^A-Za-z0-9.-]+', '-', self.group)
+        return base + tag + '.' + (self.output_format or ext.lstrip('.'))
+
+    def is_reduced(self, file_name):
+        """
+        | TrajectoryReduction.is_reduced
+        | Whether file_name is a reduced file, with any settings
+
+        Args:
+            file_name (str): File name
+        """
+        base = os.path.splitext(file_name)[0]
+        return base.endswith(self.suffix) or (self.suffix + '_') in base
+
+    def select_files(self, file_names):
+        """
+        | TrajectoryReduction.select_files
+        | Trajectory files to reduce among file_names, reduced files excluded
+
+        Args:
+            file_names (list(str)): Files in the working dir
+        """
+        return [
+            file_name for file_name in sorted(file_names)
+            if not self.is_reduced(file_name)
+            and any(fnmatch.fnmatch(file_name, pattern) for pattern in self.patterns)
+        ]
+
+    def get_structure(self, file_names):
+        """
+        | TrajectoryReduction.get_structure
+        | Structure file to use, None if not needed
+
+        Args:
+            file_names (list(str)): Files in the working dir
+        """
+        if self.structure:
+            if self.structure not in file_names:
+                sys.exit('Error: reduction structure {} is not in the remote working dir'.format(self.structure))
+            return self.structure
+        if not self.group:
+            return None
+        tpr_files = sorted(file_name for file_name in file_names if file_name.endswith('.tpr'))
+        if not tpr_files:
+            sys.exit('Error: atom selection requires a structure file (.tpr) in the remote working dir')
+        return tpr_files[0]
+
+    def get_script(self, remote_wdir, file_names, modules, structure=None):
+        """
+        | TrajectoryReduction.get_script
+        | Shell script reducing file_names, printing one line per file with the original size,
+        | the reduced size and mtime, and the original name
+
+        Args:
+            remote_wdir (str): Remote working dir
+            file_names (list(str)): Trajectory files to reduce
+            modules (list(str)): Modules to load
+            structure (str) (Optional): (None) Structure file for the selection
+        """
+        lines = ['cd {} || exit 1'.format(shlex.quote(remote_wdir))]
+        lines += ['module load ' + mod for mod in modules]
+        lines.append('BIOBB_LOG=$(mktemp)')
+        for file_name in file_names:
+            output_name = self.get_output_name(file_name)
+            command = '{} -quiet trjconv -f {} -o {}'.format(self.gmx, shlex.quote(file_name), shlex.quote(output_name))
+            if self.stride > 1:
+                command += ' -skip {}'.format(self.stride)
+            if structure:
+                # trjconv asks for the output group when a structure is given
+                command = 'echo {} | {} -s {}'.format(shlex.quote(self.group or 'System'), command, shlex.quote(structure))
+            lines.append(
+                'if [ {out} -nt {src} ] || {{ {cmd}; }} > "$BIOBB_LOG" 2>&1; then '
+                "printf '{mark} %s %s %s\\n' \"$(stat -c %s -- {src})\" \"$(stat -c '%s %Y' -- {out})\" {src}; "
+                "else echo {fail} {src}; tail -n 5 \"$BIOBB_LOG\" >&2; rm -f {out}; fi".format(
+                    src=shlex.quote(file_name),
+                    out=shlex.quote(output_name),
+                    cmd=command,
+                    mark=REDUCED_MARK,
+                    fail=FAILED_MARK
+                )
+            )
+        lines.append('rm -f "$BIOBB_LOG"')
+        return '\n'.join(lines)
+
+    def parse_output(self, stdout):
+        """
+        | TrajectoryReduction.parse_output
+        | Results from get_script output as {original: {'file', 'original_bytes', 'reduced_bytes', 'mtime'}},
+        | and the list of files that could not be reduced
+
+        Args:
+            stdout (str): Script output
+        """
+        results = {}
+        failed = []
+        for line in stdout.splitlines():
+            if line.startswith(REDUCED_MARK + ' '):
+                try:
+                    original_bytes, reduced_bytes, mtime, file_name = line[len(REDUCED_MARK) + 1:].split(' ', 3)
+                    results[file_name] = {
+                        'file': self.get_output_name(file_name),
+                        'original_bytes': int(original_bytes),
+                        'reduced_bytes': int(reduced_bytes),
+                        'mtime': float(mtime)
+                    }
+                except ValueError:
+                    # Missing stats (e.g. file removed meanwhile)
+                    failed.append(line[len(REDUCED_MARK) + 1:].strip())
+            elif line.startswith(FAILED_MARK + ' '):
+                failed.append(line[len(FAILED_MARK) + 1:])
+        return results, failed
@@ -0,0 +1,332 @@
+""" Module to keep the data of many tasks in a SQLite database """
+
+import sys
+import json
+import time
+import sqlite3
+import importlib
+import threading
+
+from biobb_remote.task import Task, JOB_STATUS, UNKNOWN
+
+DEFAULT_TIMEOUT = 30  # seconds waiting for locks held by other writers
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS tasks (
+        id TEXT PRIMARY KEY,
+        campaign TEXT,
+        host TEXT,
+        job_id TEXT,
+        status INTEGER,
+        task_class TEXT,
+        updated REAL,
+        data TEXT
+    )''',
+    'CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status)',
+    'CREATE INDEX IF NOT EXISTS tasks_host_status ON tasks (host, status)',
+    'CREATE INDEX IF NOT EXISTS tasks_job_id ON tasks (job_id)',
+    'CREATE INDEX IF NOT EXISTS tasks_campaign_status ON tasks (campaign, status)'
+]
+SUMMARY_FIELDS = ['id', 'campaign', 'host', 'job_id', 'status', 'task_class', 'updated']
+
+
+class TaskRegistry():
+    """
+    | biobb_remote registry.TaskRegistry
+    | Stores task_data of many tasks in a SQLite database, indexed by status, host, job id and campaign.
+    | Writes are transactional, several processes may share the database file.
+    | Task.save and Task.load_data_from_file remain available to export/import single tasks.
+
+    Args:
+        db_path (str): Path to the database file (created if not present)
+        timeout (float) (Optional): (30) Seconds to wait for other writers
+    """
+    def __init__(self, db_path, timeout=DEFAULT_TIMEOUT):
+        self.db_path = db_path
+        self.timeout = timeout
+        self.local = threading.local()
+        with self._transaction() as conn:
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+    def _get_connection(self):
+        """
+        | Private. TaskRegistry._get_connection
+        | One connection per thread, in autocommit mode (transactions are explicit)
+        """
+        if not hasattr(self.local, 'conn'):
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+            except sqlite3.Error as err:
+                sys.exit("Error opening task registry {}: {}".format(self.db_path, err))
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return self.local.conn
+
+    def _transaction(self):
+        """
+        | Private. TaskRegistry._transaction
+        | Write transaction, the database is locked from the start so read-modify-write is safe
+        """
+        return _Transaction(self._get_connection())
+
+    def _task_row(self, task, campaign):
+        data = task.export_task_data()
+        return (
+            task.id,
+            campaign,
+            task.ssh_data.host if task.ssh_data else None,
+            data.get('remote_job_id'),
+            data.get('status', UNKNOWN),
+            type(task).__module__ + '.' + type(task).__name__,
+            time.time(),
+            json.dumps(data)
+        )
+
+    def save_task(self, task, campaign=None):
+        """
+        | TaskRegistry.save_task
+        | Inserts or updates a task
+
+        Args:
+            task (Task): Task to store
+            campaign (str) (Optional): (None) Campaign label, kept from earlier saves if not set
+        """
+        self.save_tasks([task], campaign)
+
+    def save_tasks(self, tasks, campaign=None):
+        """
+        | TaskRegistry.save_tasks
+        | Inserts or updates several tasks in a single transaction
+
+        Args:
+            tasks (list(Task)): Tasks to store
+            campaign (str) (Optional): (None) Campaign label, kept from earlier saves if not set
+        """
+        rows = [self._task_row(task, campaign) for task in tasks]
+        with self._transaction() as conn:
+            conn.executemany(
+                '''INSERT INTO tasks (id, campaign, host, job_id, status, task_class, updated, data)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET
+                    campaign = COALESCE(excluded.campaign, tasks.campaign),
+                    host = excluded.host,
+                    job_id = excluded.job_id,
+                    status = excluded.status,
+                    task_class = excluded.task_class,
+                    updated = excluded.updated,
+                    data = excluded.data''',
+                rows
+            )
+        for task in tasks:
+            task.modified = False
+
+    def update_status(self, statuses):
+        """
+        | TaskRegistry.update_status
+        | Bulk update of task status in a single transaction, task data are kept consistent
+
+        Args:
+            statuses (dict | list(Task)): {task_id: status}, or tasks whose current status is stored
+        """
+        if not isinstance(statuses, dict):
+            statuses = {task.id: task.task_data.get('status', UNKNOWN) for task in statuses}
+        if not statuses:
+            return 0
+        now = time.time()
+        rows = []
+        with self._transaction() as conn:
+            ids = list(statuses)
+            for i in range(0, len(ids), 500):
+                chunk = ids[i:i + 500]
+                for row in conn.execute(
+                        'SELECT id, status, data FROM tasks WHERE id IN ({})'.format(','.join('?' * len(chunk))),
+                        chunk
+                        ):
+                    if row['status'] == statuses[row['id']]:
+                        continue
+                    data = json.loads(row['data'])
+                    data['status'] = statuses[row['id']]
+                    rows.append((statuses[row['id']], now, json.dumps(data), row['id']))
+            conn.executemany('UPDATE tasks SET status = ?, updated = ?, data = ? WHERE id = ?', rows)
+        return len(rows)
+
+    def load_task(self, task_id, task_class=None):
+        """
+        | TaskRegistry.load_task
+        | Returns a stored task, None if not found
+
+        Args:
+            task_id (str): Task id
+            task_class (class) (Optional): (None) Task class to instantiate, defaults to the one stored
+        """
+        row = self._get_connection().execute(
+            'SELECT task_class, data FROM tasks WHERE id = ?', (task_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return _build_task(row, task_class)
+
+    def load_tasks(self, task_class=None, **filters):
+        """
+        | TaskRegistry.load_tasks
+        | Returns stored tasks matching filters (see find)
+
+        Args:
+            task_class (class) (Optional): (None) Task class to instantiate, defaults to the one stored
+            filters: status, host, job_id, campaign
+        """
+        where, params = _where(filters)
+        return [
+            _build_task(row, task_class)
+            for row in self._get_connection().execute(
+                'SELECT task_class, data FROM tasks' + where + ' ORDER BY updated', params
+            )
+        ]
+
+    def find(self, status=None, host=None, job_id=None, campaign=None):
+        """
+        | TaskRegistry.find
+        | Summary (id, campaign, host, job_id, status, task_class, updated) of matching tasks,
+        | read from indexed columns without loading task data
+
+        Args:
+            status (int | list(int)) (Optional): (None) Task status (task.SUBMITTED, task.RUNNING, ...)
+            host (str) (Optional): (None) Login host
+            job_id (str) (Optional): (None) Queue job id
+            campaign (str) (Optional): (None) Campaign label
+        """
+        where, params = _where({'status': status, 'host': host, 'job_id': job_id, 'campaign': campaign})
+        return [
+            dict(row)
+            for row in self._get_connection().execute(
+                'SELECT ' + ', '.join(SUMMARY_FIELDS) + ' FROM tasks' + where + ' ORDER BY updated', params
+            )
+        ]
+
+    def count_by_status(self, host=None, campaign=None):
+        """
+        | TaskRegistry.count_by_status
+        | Number of tasks per status name
+
+        Args:
+            host (str) (Optional): (None) Login host
+            campaign (str) (Optional): (None) Campaign label
+        """
+        where, params = _where({'host': host, 'campaign': campaign})
+        return {
+            JOB_STATUS.get(row['status'], str(row['status'])): row['num']
+            for row in self._get_connection().execute(
+                'SELECT status, COUNT(*) AS num FROM tasks' + where + ' GROUP BY status', params
+            )
+        }
+
+    def delete_task(self, task_id):
+        """
+        | TaskRegistry.delete_task
+        | Removes a task from the registry
+
+        Args:
+            task_id (str): Task id
+        """
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def import_file(self, file_path, mode='json', task_class=Task, campaign=None):
+        """
+        | TaskRegistry.import_file
+        | Adds a task saved with Task.save
+
+        Args:
+            file_path (str): Path to task file
+            mode (str) (Optional): (json) File format json | pickle
+            task_class (class) (Optional): (Task) Task class of the saved task
+            campaign (str) (Optional): (None) Campaign label
+        """
+        task = task_class()
+        task.load_data_from_file(file_path, mode)
+        self.save_task(task, campaign)
+        return task
+
+    def export_file(self, task_id, file_path, mode='json'):
+        """
+        | TaskRegistry.export_file
+        | Saves a stored task as Task.save does
+
+        Args:
+            task_id (str): Task id
+            file_path (str): Path to task file
+            mode (str) (Optional): (json) File format json | pickle
+        """
+        task = self.load_task(task_id)
+        if task is None:
+            sys.exit("Error: task {} not in registry".format(task_id))
+        task.modified = True
+        task.save(file_path, mode)
+
+    def close(self):
+        """
+        | TaskRegistry.close
+        | Closes the connection of the current thread
+        """
+        if hasattr(self.local, 'conn'):
+            self.local.conn.close()
+            del self.local.conn
+
+
+class _Transaction():
+    """
+    | Private. registry._Transaction
+    | BEGIN IMMEDIATE ... COMMIT, rolled back on errors
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute('BEGIN IMMEDIATE')
+        return self.conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+
+def _where(filters):
+    """
+    | Private. registry._where
+    | WHERE clause and parameters for the given column filters, lists match any value
+    """
+    clauses = []
+    params = []
+    for column, value in filters.items():
+        if column not in SUMMARY_FIELDS:
+            sys.exit("Error: unknown registry filter " + column)
+        if value is None:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            clauses.append('{} IN ({})'.format(column, ','.join('?' * len(value))))
+            params += list(value)
+        else:
+            clauses.append(column + ' = ?')
+            params.append(value)
+    if not clauses:
+        return '', params
+    return ' WHERE ' + ' AND '.join(clauses), params
+
+
+def _build_task(row, task_class=None):
+    """
+    | Private. registry._build_task
+    | Task object from a database row
+    """
+    if task_class is None:
+        module_name, class_name = row['task_class'].rsplit('.', 1)
+        task_class = getattr(importlib.import_module(module_name), class_name)
+    task = task_class()
+    task.import_task_data(json.loads(row['data']))
+    task.modified = False
+    return task
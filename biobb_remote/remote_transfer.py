@@ -0,0 +1,222 @@
+""" Module to copy task working dirs directly between remote hosts """
+
+import sys
+import shlex
+import stat
+import time
+import uuid
+import paramiko
+
+from os.path import join as opj
+
+from biobb_remote.ssh_credentials import SSHCredentials
+
+AGENT = 'agent'
+TEMP_KEY = 'temp_key'
+RELAY = 'relay'
+METHODS = [AGENT, TEMP_KEY, RELAY]
+DEFAULT_CONNECT_TIMEOUT = 20  # seconds
+RELAY_BLOCK_SIZE = 1024 * 1024
+# Files per remote command, keeps command lines short
+COMMAND_CHUNK = 500
+OK_MARK = 'BIOBB_TRANSFER_OK'
+KEY_TAG = 'biobb-transfer-'
+
+
+class RemoteTransfer():
+    """
+    | biobb_remote remote_transfer.RemoteTransfer
+    | Copies files from the remote working dir of a task to the remote working dir of another one,
+    | usually on a different host, without downloading them first.
+    | Methods are tried in order:
+    |   * agent: the source login node connects to the target host with the local ssh agent keys (agent forwarding)
+    |   * temp_key: a key pair created for the transfer is authorized on the target host and used from the
+    |     source login node, both sides are removed at the end
+    |   * relay: files are streamed through this client, source sftp reads go straight to target sftp writes
+    |     (nothing written to local disk)
+    | Direct methods need the source login node to reach the target host over ssh, the relay is the fallback.
+
+    Args:
+        source_task (Task): Task owning the files
+        target_task (Task): Task receiving the files, with its remote working dir set (see prep_remote_workdir)
+        methods (list(str)) (Optional): (None) Methods to try, in order. Defaults to agent, temp_key, relay
+        connect_timeout (int) (Optional): (20) Seconds allowed to the source login node to connect to the target host
+    """
+    def __init__(self, source_task, target_task, methods=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT):
+        self.source_task = source_task
+        self.target_task = target_task
+        self.methods = methods or METHODS
+        for method in self.methods:
+            if method not in METHODS:
+                sys.exit('Error: unknown transfer method {}, use one of {}'.format(method, ', '.join(METHODS)))
+        self.connect_timeout = connect_timeout
+
+    def copy(self, files_only=None):
+        """
+        | RemoteTransfer.copy
+        | Copies the files, returns a summary (method used, files, bytes, time)
+
+        Args:
+            files_only (list(str)) (Optional): (None) Only copy files in list, all files if not set
+        """
+        self.source_task._open_ssh_session()
+        self.target_task._open_ssh_session()
+        remote_files = {
+            name: stats for name, stats in self.source_task.get_remote_file_stats(refresh=True).items()
+            if not stat.S_ISDIR(stats.get('st_mode') or 0) and (not files_only or name in files_only)
+        }
+        if files_only:
+            for name in files_only:
+                if name not in remote_files:
+                    print("Warning: file {} is not in the remote working dir".format(name))
+        summary = {
+            'method': None,
+            'files': len(remote_files),
+            'bytes': sum(stats.get('st_size') or 0 for stats in remote_files.values()),
+            'time': 0.
+        }
+        if not remote_files:
+            return summary
+        start = time.time()
+        for method in self.methods:
+            print("Trying {} transfer of {} files ({} bytes)".format(method, summary['files'], summary['bytes']))
+            with self.target_task._span('transfer', method=method, files=summary['files'], bytes=summary['bytes']) as span:
+                if method == AGENT:
+                    done = self._copy_agent(sorted(remote_files))
+                elif method == TEMP_KEY:
+                    done = self._copy_temp_key(sorted(remote_files))
+                else:
+                    done = self._copy_relay(remote_files)
+                span.set_attribute('done', done)
+            if done:
+                summary['method'] = method
+                break
+        self.target_task.ssh_session.invalidate_metadata(self.target_task._remote_wdir())
+        if summary['method'] is None:
+            sys.exit('Error: remote transfer failed with all methods ({})'.format(', '.join(self.methods)))
+        summary['time'] = time.time() - start
+        print("Transferred {files} files ({bytes} bytes) with {method} in {time:.1f}s".format(**summary))
+        return summary
+
+    def _ssh_options(self, identity_file=None):
+        """
+        | Private. RemoteTransfer._ssh_options
+        | ssh command used on the source login node to reach the target host
+        """
+        target = self.target_task.ssh_data
+        options = [
+            'ssh', '-p', str(getattr(target, 'port', 22)),
+            '-o', 'BatchMode=yes',
+            '-o', 'ConnectTimeout={}'.format(int(self.connect_timeout)),
+            '-o', 'StrictHostKeyChecking=accept-new'
+        ]
+        if identity_file:
+            options += ['-o', 'IdentitiesOnly=yes', '-i', shlex.quote(identity_file)]
+        return ' '.join(options) + ' ' + shlex.quote('{}@{}'.format(target.userid, target.host))
+
+    def _run_direct(self, file_names, forward_agent=False, identity_file=None):
+        """
+        | Private. RemoteTransfer._run_direct
+        | Streams the files as a tar archive from the source login node to the target host.
+        | Returns False if the target host is not reachable, exits on errors once started
+        """
+        ssh_command = self._ssh_options(identity_file)
+        stdout, stderr = self.source_task.ssh_session.run_command(
+            '{} true && echo {}'.format(ssh_command, OK_MARK), forward_agent=forward_agent
+        )
+        if OK_MARK not in stdout:
+            print("Target host not reachable from source login node: " + stderr.strip())
+            return False
+        source_wdir = self.source_task._remote_wdir()
+        target_wdir = self.target_task._remote_wdir()
+        for i in range(0, len(file_names), COMMAND_CHUNK):
+            stdout, stderr = self.source_task.ssh_session.run_command(
+                'set -o pipefail; tar -C {} -cf - -- {} | {} {} && echo {}'.format(
+                    shlex.quote(source_wdir),
+                    ' '.join(shlex.quote(name) for name in file_names[i:i + COMMAND_CHUNK]),
+                    ssh_command,
+                    shlex.quote('tar -C {} -xpf -'.format(shlex.quote(target_wdir))),
+                    OK_MARK
+                ),
+                forward_agent=forward_agent
+            )
+            if OK_MARK not in stdout:
+                sys.exit('Error in remote transfer: ' + stderr)
+        return True
+
+    def _copy_agent(self, file_names):
+        """
+        | Private. RemoteTransfer._copy_agent
+        | Direct copy authenticated by the forwarded local ssh agent
+        """
+        try:
+            has_keys = bool(paramiko.Agent().get_keys())
+        except paramiko.SSHException:
+            has_keys = False
+        if not has_keys:
+            print("No local ssh agent keys available")
+            return False
+        return self._run_direct(file_names, forward_agent=True)
+
+    def _copy_temp_key(self, file_names):
+        """
+        | Private. RemoteTransfer._copy_temp_key
+        | Direct copy authenticated by a key pair created for this transfer.
+        | The public key is authorized on the target host (forwarding disabled), the private key is
+        | written with owner-only permissions on the source host. Both are removed when done
+        """
+        tag = KEY_TAG + uuid.uuid4().hex[:12]
+        credentials = SSHCredentials(generate_key=True)
+        public_key = 'no-agent-forwarding,no-port-forwarding,no-X11-forwarding,no-pty {} {} {}'.format(
+            credentials.key.get_name(), credentials.key.get_base64(), tag
+        )
+        source_session = self.source_task.ssh_session
+        target_session = self.target_task.ssh_session
+        stdout, stderr = target_session.run_command(
+            'umask 077 && mkdir -p ~/.ssh && echo {} >> ~/.ssh/authorized_keys && echo {}'.format(
+                shlex.quote(public_key), OK_MARK
+            )
+        )
+        if OK_MARK not in stdout:
+            print("Temporary key could not be authorized on target host: " + stderr.strip())
+            return False
+        key_path = None
+        try:
+            # Empty file with owner-only permissions, the key is then written through sftp
+            # (a key within the command line would be visible to other users of the login node)
+            stdout, stderr = source_session.run_command(
+                'umask 077 && mkdir -p ~/.ssh && cd ~/.ssh && : > {0} && echo "$PWD/{0}"'.format(tag)
+            )
+            if not stdout.strip().endswith(tag):
+                print("Temporary key could not be stored on source host: " + stderr.strip())
+                return False
+            key_path = stdout.strip().splitlines()[-1]
+            source_session.run_sftp('create', credentials.get_private_key(), key_path)
+            return self._run_direct(file_names, identity_file=key_path)
+        finally:
+            if key_path:
+                source_session.run_command('rm -f ' + shlex.quote(key_path))
+            target_session.run_command(
+                "sed -i '/ {}$/d' ~/.ssh/authorized_keys".format(tag)
+            )
+
+    def _copy_relay(self, remote_files):
+        """
+        | Private. RemoteTransfer._copy_relay
+        | Streams each file from the source sftp session to the target sftp session, keeping mode and mtime
+        """
+        source_session = self.source_task.ssh_session
+        target_session = self.target_task.ssh_session
+        source_wdir = self.source_task._remote_wdir()
+        target_wdir = self.target_task._remote_wdir()
+        for name, stats in sorted(remote_files.items()):
+            with self.target_task._span('relay_file', file=name, bytes=stats.get('st_size')):
+                with source_session.open_file(opj(source_wdir, name), 'rb') as source_file, \
+                        target_session.open_file(opj(target_wdir, name), 'wb') as target_file:
+                    for block in iter(lambda: source_file.read(RELAY_BLOCK_SIZE), b''):
+                        target_file.write(block)
+                    if hasattr(target_file, 'utime') and stats.get('st_mtime') is not None:
+                        target_file.chmod(stat.S_IMODE(stats.get('st_mode') or 0o644))
+                        target_file.utime((stats.get('st_atime') or stats['st_mtime'], stats['st_mtime']))
+            print("relaying_file: {} -> {}".format(opj(source_wdir, name), opj(target_wdir, name)))
+        return True
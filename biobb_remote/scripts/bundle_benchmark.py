@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+""" Memory and save/load time of DataBundle for large numbers of files """
+
+import os
+import json
+import time
+import pickle
+import argparse
+import tracemalloc
+from biobb_remote.task import DataBundle
+
+ARGPARSER = argparse.ArgumentParser(
+    description='DataBundle memory use and save/load times, against a per-file dict of os.stat_result'
+)
+ARGPARSER.add_argument(
+    '--files',
+    dest='file_counts',
+    help='Number of files in the bundle',
+    type=int,
+    nargs='+',
+    default=[1000, 100000]
+)
+ARGPARSER.add_argument(
+    '--dirs',
+    dest='num_dirs',
+    help='Number of distinct directories',
+    type=int,
+    default=10
+)
+ARGPARSER.add_argument(
+    '--output',
+    dest='output_path',
+    help='Save results as json'
+)
+
+
+def _file_list(num_files, num_dirs):
+    base_stats = os.stat(__file__)
+    return [
+        (
+            '/scratch/project/run_{:03d}/frame_{:07d}.xtc'.format(i % num_dirs, i),
+            (base_stats.st_mode, i, 0, 1, 0, 0, 1000 + i, 0, base_stats.st_mtime + i, 0)
+        )
+        for i in range(num_files)
+    ]
+
+
+def _measure(build, num_files, files):
+    """ Memory, build, save and load times of one representation """
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    bundle, dump, load = build(files)
+    build_time = time.perf_counter() - t0
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    t0 = time.perf_counter()
+    json_str = dump(bundle)
+    save_time = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    load(json_str)
+    load_time = time.perf_counter() - t0
+    return {
+        'files': num_files,
+        'memory_bytes': memory,
+        'bytes_per_file': memory / num_files,
+        'build_time': build_time,
+        'json_bytes': len(json_str),
+        'json_save_time': save_time,
+        'json_load_time': load_time,
+        'pickle_bytes': len(pickle.dumps(bundle))
+    }
+
+
+def _build_columnar(files):
+    bundle = DataBundle('bench')
+    # stat_result objects are created as add_file would get them from os.stat
+    for path, stats in files:
+        bundle.add_file(path, os.stat_result(stats))
+    return bundle, DataBundle.to_json, DataBundle.from_json
+
+
+def _build_dict(files):
+    # Former representation: {name: {'full_path': path, 'stats': os.stat_result}}
+    bundle = {}
+    for path, stats in files:
+        bundle[os.path.basename(path)] = {'full_path': path, 'stats': os.stat_result(stats)}
+
+    def load(json_str):
+        return {
+            name: {'full_path': file['full_path'], 'stats': os.stat_result(file['stats'])}
+            for name, file in json.loads(json_str)['files'].items()
+        }
+    return bundle, lambda files: json.dumps({'id': 'bench', 'files': files, 'remote': False}), load
+
+
+def main():
+    args = ARGPARSER.parse_args()
+    results = []
+    for num_files in args.file_counts:
+        files = _file_list(num_files, args.num_dirs)
+        for label, build in (('columnar', _build_columnar), ('dict_of_stats', _build_dict)):
+            result = _measure(build, num_files, files)
+            result['representation'] = label
+            results.append(result)
+            print(
+                '{representation:14s} files {files:8d}: {bytes_per_file:7.1f} bytes/file, '
+                'build {build_time:.3f}s, json {json_bytes:10d} bytes, save {json_save_time:.3f}s, '
+                'load {json_load_time:.3f}s, pickle {pickle_bytes:10d} bytes'.format(**result)
+            )
+    if args.output_path:
+        with open(args.output_path, 'w') as output_file:
+            json.dump(results, output_file, indent=3)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+""" Throughput benchmark of the Slurm interface against a local fake SLURM cluster """
+
+import sys
+import json
+import argparse
+from biobb_remote.fake_slurm import run_throughput_benchmark, compare_results
+
+ARGPARSER = argparse.ArgumentParser(
+    description='Slurm submit/status/download throughput benchmark on a local fake SLURM cluster'
+)
+ARGPARSER.add_argument(
+    '--jobs',
+    dest='job_counts',
+    help='Number of jobs for each run',
+    type=int,
+    nargs='+',
+    default=[1, 100, 10000]
+)
+ARGPARSER.add_argument(
+    '--work_dir',
+    dest='work_dir',
+    help='Directory for fake cluster data (default: temporary)'
+)
+ARGPARSER.add_argument(
+    '--execute',
+    dest='execute',
+    action='store_true',
+    help='Run job scripts, producing output files to download'
+)
+ARGPARSER.add_argument(
+    '--output_files',
+    dest='output_files',
+    help='Output files per job (with --execute)',
+    type=int,
+    default=1
+)
+ARGPARSER.add_argument(
+    '--file_size',
+    dest='file_size',
+    help='Output file size in bytes (with --execute)',
+    type=int,
+    default=1024
+)
+ARGPARSER.add_argument(
+    '--use_executables',
+    dest='use_executables',
+    action='store_true',
+    help='Run the mock sbatch/squeue/scancel/sacct executables instead of serving them in-process'
+)
+ARGPARSER.add_argument(
+    '--output',
+    dest='output_path',
+    help='Save results as json'
+)
+ARGPARSER.add_argument(
+    '--baseline',
+    dest='baseline_path',
+    help='Json results to compare with, exits with error on regressions'
+)
+ARGPARSER.add_argument(
+    '--tolerance',
+    dest='tolerance',
+    help='Allowed relative slowdown against baseline',
+    type=float,
+    default=0.2
+)
+
+
+def main():
+    args = ARGPARSER.parse_args()
+    results = run_throughput_benchmark(
+        job_counts=args.job_counts,
+        work_dir=args.work_dir,
+        execute=args.execute,
+        output_files=args.output_files,
+        file_size=args.file_size,
+        in_process=not args.use_executables
+    )
+    if args.output_path:
+        with open(args.output_path, 'w') as output_file:
+            json.dump(results, output_file, indent=3)
+    if args.baseline_path:
+        with open(args.baseline_path) as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print('\n'.join(regressions), file=sys.stderr)
+            sys.exit("Performance regressions found")
+        print("No regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
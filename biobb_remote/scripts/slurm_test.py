@@ -57,11 +57,18 @@ ARGPARSER.add_argument(
     help='Overwrite data in output local directory'
 )
 
+ARGPARSER.add_argument(
+    '--use_scratch',
+    dest='use_scratch',
+    action='store_true',
+    help='Run on node-local scratch as defined in host configuration (submit)'
+)
+
 ARGPARSER.add_argument(
     '--task_file_type',
     dest='task_file_type',
     default='json',
-    help='Format for task data file (json, pickle). Default:json'
+    help='Format for task data file (json, pickle, journal). Default:json'
 )
 
 ARGPARSER.add_argument(
@@ -88,7 +95,7 @@ class Slurm_test():
 
         if self.args.command not in ('queue', 'submit'):
             try:
-                slurm_task.load_data_from_file(self.args.task_file_path)
+                slurm_task.load_data_from_file(self.args.task_file_path, self.args.task_file_type)
                 print("Task data loaded from", self.args.task_file_path)
             except IOError:
                 print("Task data not loaded")
@@ -97,7 +104,12 @@ class Slurm_test():
             slurm_task.set_local_data_bundle(self.args.local_data_path)
             if 'input_data_loaded' not in slurm_task.task_data:
                 slurm_task.send_input_data(self.args.remote_path)
-            slurm_task.submit(self.args.queue_settings, self.args.modules, self.args.local_run_script)
+            slurm_task.submit(
+                queue_settings=self.args.queue_settings,
+                modules=self.args.modules,
+                local_run_script=self.args.local_run_script,
+                use_scratch=self.args.use_scratch
+            )
             print("job id", slurm_task.task_data['remote_job_id'])
 
         elif self.args.command == 'cancel':
@@ -136,7 +148,7 @@ class Slurm_test():
             if not self.args.task_file_path:
                 self.args.task_file_path = slurm_task.id + ".task"
             try:
-                slurm_task.save(self.args.task_file_path)
+                slurm_task.save(self.args.task_file_path, self.args.task_file_type)
                 print("Task data saved on", self.args.task_file_path)
             except IOError as e:
                 sys.exit(e)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+""" Transfer throughput benchmark against a local SFTP server with emulated latency and bandwidth """
+
+import argparse
+from biobb_remote.transfer_benchmark import TransferBenchmark, STRATEGIES
+
+ARGPARSER = argparse.ArgumentParser(
+    description='Upload/download throughput of biobb_remote transfer strategies on a local SFTP server'
+)
+ARGPARSER.add_argument(
+    '--files',
+    dest='file_counts',
+    help='Number of files per transfer',
+    type=int,
+    nargs='+',
+    default=[1, 10, 100]
+)
+ARGPARSER.add_argument(
+    '--sizes',
+    dest='file_sizes',
+    help='File sizes (bytes)',
+    type=int,
+    nargs='+',
+    default=[1024, 1048576]
+)
+ARGPARSER.add_argument(
+    '--latencies',
+    dest='latencies',
+    help='One-way link latencies (seconds)',
+    type=float,
+    nargs='+',
+    default=[0., 0.01]
+)
+ARGPARSER.add_argument(
+    '--bandwidths',
+    dest='bandwidths',
+    help='Link bandwidths (bytes/s), 0 for no limit',
+    type=float,
+    nargs='+',
+    default=[0.]
+)
+ARGPARSER.add_argument(
+    '--strategies',
+    dest='strategies',
+    help='Transfer strategies to run',
+    nargs='+',
+    choices=list(STRATEGIES)
+)
+ARGPARSER.add_argument(
+    '--workers',
+    dest='parallel_workers',
+    help='Parallel tasks for upload_parallel',
+    type=int,
+    default=4
+)
+ARGPARSER.add_argument(
+    '--work_dir',
+    dest='work_dir',
+    help='Directory for test data (default: temporary)'
+)
+ARGPARSER.add_argument(
+    '--output',
+    dest='output_path',
+    help='Save results as json'
+)
+
+
+def main():
+    args = ARGPARSER.parse_args()
+    benchmark = TransferBenchmark(
+        file_counts=args.file_counts,
+        file_sizes=args.file_sizes,
+        latencies=args.latencies,
+        bandwidths=args.bandwidths,
+        strategies=args.strategies,
+        parallel_workers=args.parallel_workers,
+        work_dir=args.work_dir
+    )
+    benchmark.run()
+    for item in benchmark.get_summary():
+        print(
+            "{strategy:16s} lat {latency:.3f}s bw {bandwidth:.0f}: overhead {per_file_overhead:.4f} s/file, stream {mbs}".format(
+                mbs='{:.2f} MB/s'.format(item['stream_mb_per_s']) if item['stream_mb_per_s'] else '-',
+                **item
+            )
+        )
+    if args.output_path:
+        benchmark.save(args.output_path)
+
+
+if __name__ == "__main__":
+    main()
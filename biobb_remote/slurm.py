@@ -1,15 +1,31 @@
 """ Module to define characteristics of SLURM queue manager"""
 
+import re
 import sys
+import datetime
 
 from biobb_remote.task import Task
+from biobb_remote.perf_history import parse_time, format_secs
+from biobb_remote.queue_info import (
+    QueueSnapshot, SECTION_MARK, split_sections, parse_sinfo, parse_squeue_counts, parse_user_jobs, parse_qos_limits,
+    parse_queue_limits
+)
 
 SLURM_COMMANDS = {
     'submit' : 'sbatch',
     'queue' : 'squeue',
-    'cancel': 'scancel'
+    'cancel': 'scancel',
+    'accounting': 'sacct',
+    'info': 'sinfo',
+    'admin': 'sacctmgr'
 }
 
+SACCT_FIELDS = ['JobID', 'State', 'ElapsedRaw', 'Submit', 'Start', 'End']
+
+SLURM_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+TEST_ONLY_START = re.compile(r'to start at (\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d)')
+PLAN_MARK = '@@biobb_plan'
+
 SLURM_CODES = {
     'queue': '-p ', # SLURM queue name.
     'working_dir': '-D ', #Working directory.
@@ -22,7 +38,8 @@ SLURM_CODES = {
     'ntasks': '--ntasks=', # Number of requested MPI processes.
     'cpus-per-task': '--cpus-per-task=', # Number of OpenMP threads per MPI process.
     'ntasks-per-node': '--ntasks-per-node=', #Number of tasks in --ntasks per node.
-    'nodes': '--nodes=' # Number of nodes
+    'nodes': '--nodes=', # Number of nodes
+    'signal': '--signal=' # Signal sent before the time limit (e.g. B:USR1@300)
 }
 
 class Slurm(Task):
@@ -59,6 +76,73 @@ class Slurm(Task):
 
         return scr_lines
 
+    def _get_stage_out_signal_settings(self, signal_time):
+        """
+        | Private: Slurm._get_stage_out_signal_settings
+        | Asks SLURM to send USR1 to the batch shell signal_time seconds before the time limit
+        
+        Args:
+            signal_time (int): Seconds before the time limit
+        """
+        return {'signal': 'B:USR1@{}'.format(int(signal_time))}
+
+    def _get_launcher_prefix(self, settings, gpu_map):
+        """
+        | Private: Slurm._get_launcher_prefix
+        | srun prefix binding each task to its cores, and local ranks to GPUs
+        
+        Args:
+            settings (dict): Queue settings
+            gpu_map (list(int)): GPU to use for each local rank. Empty if no GPUs
+        """
+        if self.host_config.get('threads_per_core', 1) > 1:
+            cpu_bind = 'threads'
+        else:
+            cpu_bind = 'cores'
+        launcher = [
+            'srun',
+            '--cpus-per-task={}'.format(settings['cpus-per-task']),
+            '--cpu-bind=' + cpu_bind
+        ]
+        if gpu_map:
+            launcher.append('--gpu-bind=map_gpu:' + ','.join(str(gpu) for gpu in gpu_map))
+        return ' '.join(launcher)
+
+    def _get_job_accounting(self, job_id):
+        """
+        | Private: Slurm._get_job_accounting
+        | Reads job allocation record from sacct
+        
+        Args:
+            job_id (str): Job id
+        """
+        stdout, stderr = self.ssh_session.run_command(
+            '{} -n -X -P -j {} -o {}'.format(self.commands['accounting'], job_id, ','.join(SACCT_FIELDS))
+        )
+        for line in stdout.split('\n'):
+            fields = line.strip().split('|')
+            if len(fields) != len(SACCT_FIELDS) or fields[0] != str(job_id):
+                continue
+            data = {
+                'state': fields[1].split(' ')[0],
+                'submit': fields[3],
+                'start': fields[4],
+                'end': fields[5]
+            }
+            try:
+                data['elapsed'] = int(fields[2])
+            except ValueError:
+                data['elapsed'] = None
+            try:
+                data['wait'] = (
+                    datetime.datetime.strptime(data['start'], SLURM_TIME_FORMAT)
+                    - datetime.datetime.strptime(data['submit'], SLURM_TIME_FORMAT)
+                ).total_seconds()
+            except ValueError:
+                data['wait'] = None
+            return data
+        return {}
+
     def _get_submitted_job_id(self, submit_output):
         """
         | Private: Slurm._get_submitted_job_id
@@ -69,3 +153,222 @@ class Slurm(Task):
         """
         wds = submit_output.split(' ')
         return wds[3].strip('\n')
+
+    def _get_queue_settings_options(self, settings):
+        """
+        | Private: Slurm._get_queue_settings_options
+        | Command line options equivalent to queue settings
+        
+        Args:
+            settings (dict): Queue settings
+        """
+        return ' '.join(
+            SLURM_CODES[k] + str(v) for k, v in settings.items() if k in SLURM_CODES
+        )
+
+    def _get_remote_now(self, stdout_line):
+        """
+        | Private: Slurm._get_remote_now
+        | Parses remote date, used as reference for SLURM times (given in remote local time)
+        """
+        return datetime.datetime.strptime(stdout_line.strip(), SLURM_TIME_FORMAT)
+
+    def plan_queue_settings(self, candidates=None, history=None, local_run_script='', runtimes=None, verbose=True):
+        """
+        | Slurm.plan_queue_settings
+        | Estimates start time and completion for several queue settings profiles using
+        | sbatch --test-only (one remote command for all). Returns the profiles sorted by expected completion.
+        | Runtime is taken from runtimes, predicted from history, or the profile time limit, in this order.
+        
+        Args:
+            candidates (list(str)) (Optional): (None) Queue settings labels. Defaults to all labels in host configuration except debug
+            history (PerformanceHistory) (Optional): (None) Performance history to predict runtimes
+            local_run_script (str) (Optional): ('') Run script to identify history records. Defaults to task's one
+            runtimes (dict) (Optional): (None) Known runtime (seconds) per label
+            verbose (bool) (Optional): (True) Print the plan
+        """
+        if not candidates:
+            candidates = [
+                label for label in self.host_config['qsettings'] if label not in ('default', 'debug')
+            ]
+
+        start_delays, outputs = self._test_only_start_delays(
+            {label: self.host_config['qsettings'][label] for label in candidates}
+        )
+
+        plan = []
+        for label in candidates:
+            settings = self.host_config['qsettings'][label]
+            start_delay = start_delays[label]
+            runtime = self._get_expected_runtime(label, settings, history, local_run_script, runtimes)
+            if start_delay is not None and runtime is not None:
+                completion = start_delay + runtime
+            else:
+                completion = None
+            plan.append({
+                'label': label,
+                'start_delay': start_delay,
+                'runtime': runtime,
+                'completion': completion,
+                'output': outputs.get(label, '').strip()
+            })
+        plan.sort(key=lambda p: (p['completion'] is None, p['completion']))
+
+        if verbose:
+            print('{:20s} {:>12s} {:>12s} {:>12s}'.format('Queue settings', 'Start(s)', 'Runtime(s)', 'End(s)'))
+            for p in plan:
+                print('{:20s} {:>12s} {:>12s} {:>12s}'.format(
+                    p['label'], format_secs(p['start_delay']), format_secs(p['runtime']), format_secs(p['completion'])
+                ))
+        return plan
+
+    def _test_only_start_delays(self, settings_by_label):
+        """
+        | Private: Slurm._test_only_start_delays
+        | Runs sbatch --test-only for several settings in one remote command.
+        | Returns the estimated start delays (seconds, None if not schedulable) and the outputs, by label.
+        
+        Args:
+            settings_by_label (dict): Queue settings by label
+        """
+        cmd = ['date +' + SLURM_TIME_FORMAT]
+        for label, settings in settings_by_label.items():
+            cmd.append('echo {} {}'.format(PLAN_MARK, label))
+            cmd.append('{} --test-only {} --wrap=true 2>&1'.format(
+                self.commands['submit'],
+                self._get_queue_settings_options(settings)
+            ))
+        self._open_ssh_session()
+        stdout, stderr = self.ssh_session.run_command(';'.join(cmd))
+
+        lines = stdout.split('\n')
+        try:
+            now = self._get_remote_now(lines[0])
+        except ValueError:
+            sys.exit('Error: unexpected output while planning: ' + stdout + stderr)
+        outputs = {label: '' for label in settings_by_label}
+        label = None
+        for line in lines[1:]:
+            if line.startswith(PLAN_MARK):
+                label = line.split()[1]
+            elif label:
+                outputs[label] += line + '\n'
+
+        start_delays = {}
+        for label in settings_by_label:
+            match = TEST_ONLY_START.search(outputs[label])
+            if match:
+                start = datetime.datetime.strptime(match.group(1), SLURM_TIME_FORMAT)
+                start_delays[label] = max(0., (start - now).total_seconds())
+            else:
+                start_delays[label] = None
+        return start_delays, outputs
+
+    def estimate_start_delay(self, settings):
+        """
+        | Slurm.estimate_start_delay
+        | Seconds until a job with the given queue settings would start (sbatch --test-only), None if not schedulable
+        
+        Args:
+            settings (dict): Queue settings
+        """
+        start_delays, outputs = self._test_only_start_delays({'custom': settings})
+        return start_delays['custom']
+
+    def _get_expected_runtime(self, label, settings, history, local_run_script, runtimes):
+        """
+        | Private: Slurm._get_expected_runtime
+        | Runtime for a queue settings profile (seconds), None if unknown
+        """
+        if runtimes and label in runtimes:
+            return runtimes[label]
+        if history:
+            predicted = history.predict(
+                self.host_config['description'],
+                self.get_script_fingerprint(local_run_script),
+                self.get_input_size(),
+                settings
+            )
+            if predicted is not None:
+                return predicted
+        if 'time' in settings:
+            return parse_time(settings['time'])
+        return None
+
+    def submit_earliest(self, candidates=None, history=None, runtimes=None, **submit_args):
+        """
+        | Slurm.submit_earliest
+        | Submits with the queue settings profile giving the earliest expected completion (see plan_queue_settings).
+        | Other arguments as in Task.submit
+        
+        Args:
+            candidates (list(str)) (Optional): (None) Queue settings labels. Defaults to all labels in host configuration except debug
+            history (PerformanceHistory) (Optional): (None) Performance history to predict runtimes and time limit
+            runtimes (dict) (Optional): (None) Known runtime (seconds) per label
+        """
+        plan = self.plan_queue_settings(
+            candidates, history, submit_args.get('local_run_script', ''), runtimes
+        )
+        feasible = [p for p in plan if p['completion'] is not None]
+        if not feasible:
+            sys.exit('Error: none of the queue settings can be scheduled')
+        best = feasible[0]
+        print('Using queue settings {}, expected completion in {:.0f}s'.format(best['label'], best['completion']))
+        self.task_data['queue_plan'] = [
+            {k: v for k, v in p.items() if k != 'output'} for p in plan
+        ]
+        submit_args['queue_settings'] = best['label']
+        self.submit(history=history, **submit_args)
+        return best
+
+    def _build_queue_snapshot(self):
+        """
+        | Private: Slurm._build_queue_snapshot
+        | Builds a QueueSnapshot from sinfo, squeue, sacctmgr and queues_command, in one remote command
+        """
+        sections = [
+            ('sinfo', "{} -h -o '%R|%a|%F|%G'".format(self.commands['info'])),
+            ('jobs', "{} -h -a -o '%P %T' | sort | uniq -c".format(self.commands['queue'])),
+            ('user_jobs', "{} -h -u $USER -o '%T' | sort | uniq -c".format(self.commands['queue'])),
+            ('qos', '{} -n -P show qos format=Name,MaxWall,MaxJobsPU,MaxSubmitPU,MaxTRESPU'.format(
+                self.commands['admin']
+            ))
+        ]
+        if self.host_config.get('queues_command'):
+            sections.append(('queues', ';'.join(self.host_config['queues_command'])))
+        cmd = []
+        for label, section_cmd in sections:
+            cmd.append('echo {} {}'.format(SECTION_MARK, label))
+            cmd.append(section_cmd)
+        self._open_ssh_session()
+        stdout, stderr = self.ssh_session.run_command(';'.join(cmd))
+
+        output = split_sections(stdout)
+        snapshot = QueueSnapshot(self.host_config['description'])
+        parse_sinfo(snapshot, output.get('sinfo', []))
+        parse_squeue_counts(snapshot, output.get('jobs', []))
+        parse_user_jobs(snapshot, output.get('user_jobs', []))
+        parse_qos_limits(snapshot, output.get('qos', []))
+        parse_queue_limits(snapshot, output.get('queues', []))
+        return snapshot
+
+    def get_start_estimate(self):
+        """
+        | Slurm.get_start_estimate
+        | Seconds until the pending job is expected to start (squeue --start), None if unknown or not pending
+        """
+        self._open_ssh_session()
+        stdout, stderr = self.ssh_session.run_command(
+            'date +{};{} -h --start -j {} -o %S'.format(
+                SLURM_TIME_FORMAT, self.commands['queue'], self.task_data['remote_job_id']
+            )
+        )
+        lines = stdout.split()
+        if len(lines) < 2:
+            return None
+        try:
+            now = self._get_remote_now(lines[0])
+            start = datetime.datetime.strptime(lines[1], SLURM_TIME_FORMAT)
+        except ValueError:
+            return None
+        return max(0., (start - now).total_seconds())
@@ -21,10 +21,12 @@ class SSHCredentials:
         userid (str) (Optional): Target user id.
         generate_key (bool) (Optional): (False) Generate a pub/private key pair.
         look_for_keys (bool) (Optional): (True) Look for keys in user's .ssh directory if no key provided.
+        port (int) (Optional): (22) SSH port on target host.
     """
-    def __init__(self, host='', userid='', generate_key=False, look_for_keys=True):
+    def __init__(self, host='', userid='', generate_key=False, look_for_keys=True, port=22):
         self.host = host
         self.userid = userid
+        self.port = port
         self.key = None
         self.user_ssh = None
         self.sftp = None
@@ -50,6 +52,7 @@ class SSHCredentials:
         self.host = data['host']
         self.userid = data['userid']
         self.look_for_keys = data['look_for_keys']
+        self.port = data.get('port', 22)
         self.key = RSAKey.from_private_key(StringIO(data['data'].getvalue()), passwd)
 
     def load_from_private_key_file(self, private_path, passwd=None):
@@ -121,7 +124,8 @@ class SSHCredentials:
                     'userid': self.userid,
                     'host': self.host,
                     'data': private,
-                    'look_for_keys': self.look_for_keys
+                    'look_for_keys': self.look_for_keys,
+                    'port': self.port
                 }, keys_file)
         if public_key_path:
             with open(public_key_path, 'w') as pubkey_file:
@@ -194,6 +198,7 @@ class SSHCredentials:
         try:
             self.user_ssh.connect(
                 self.host,
+                port=self.port,
                 username=self.userid,
             )
         except AuthenticationException as err:
@@ -5,10 +5,110 @@ __date__ = "$08-March-2019 17:32:38$"
 import sys
 import os
 import stat
+import time
 import pickle
+import threading
 import paramiko
 from io import StringIO
 from paramiko import SSHClient, AutoAddPolicy, AuthenticationException, SSHException, RSAKey
+from biobb_remote import metrics
+
+DEFAULT_METADATA_TTL = 10  # seconds
+STAT_FIELDS = ['st_size', 'st_uid', 'st_gid', 'st_mode', 'st_atime', 'st_mtime']
+
+
+class RemoteMetadataCache():
+    """
+    | biobb_remote ssh_session.RemoteMetadataCache
+    | Remote directory listings with file attributes, kept for ttl seconds.
+    | Updated after our own uploads, invalidated after other writes or explicitly.
+
+    Args:
+        ttl (float) (Optional): (10) Seconds a listing is valid, 0 disables the cache
+    """
+    def __init__(self, ttl=DEFAULT_METADATA_TTL):
+        self.ttl = ttl
+        self.dirs = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dir_path):
+        """
+        | RemoteMetadataCache.get
+        | Cached listing {file name: stats dict} of dir_path, None if missing or expired
+
+        Args:
+            dir_path (str): Remote directory
+        """
+        dir_path = dir_path.rstrip('/')
+        with self.lock:
+            entry = self.dirs.get(dir_path)
+            if entry is None or time.time() - entry[0] > self.ttl:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, dir_path, files):
+        """
+        | RemoteMetadataCache.set
+        | Stores a listing
+
+        Args:
+            dir_path (str): Remote directory
+            files (dict): {file name: stats dict}
+        """
+        if self.ttl <= 0:
+            return
+        with self.lock:
+            self.dirs[dir_path.rstrip('/')] = (time.time(), dict(files))
+
+    def update_file(self, file_path, stats):
+        """
+        | RemoteMetadataCache.update_file
+        | Updates a file in a cached listing, after writing it
+
+        Args:
+            file_path (str): Remote file path
+            stats (dict): File stats, None if not known (the listing is dropped)
+        """
+        dir_path, file_name = os.path.split(file_path.rstrip('/'))
+        with self.lock:
+            if dir_path not in self.dirs:
+                return
+            if stats is None:
+                del self.dirs[dir_path]
+            else:
+                self.dirs[dir_path][1][file_name] = stats
+
+    def invalidate(self, path=None):
+        """
+        | RemoteMetadataCache.invalidate
+        | Drops listings of path and its subdirectories, or all listings
+
+        Args:
+            path (str) (Optional): (None) Remote path
+        """
+        with self.lock:
+            if path is None:
+                self.dirs = {}
+                return
+            path = path.rstrip('/')
+            for dir_path in list(self.dirs):
+                if dir_path == path or dir_path.startswith(path + '/'):
+                    del self.dirs[dir_path]
+
+
+def get_stats_dict(attributes):
+    """
+    | ssh_session.get_stats_dict
+    | Plain dict with the stat fields of a SFTPAttributes (or os.stat_result) object
+
+    Args:
+        attributes (SFTPAttributes): File attributes
+    """
+    return {field: getattr(attributes, field, None) for field in STAT_FIELDS}
 
 
 class SSHSession:
@@ -22,9 +122,13 @@ class SSHSession:
         private_path (str) (Optional): (None) Path to private key file.
         passwd (str) (Optional): (None) Password to decrypt credentials.
         debug (bool) (Optional): (False) Prints (very) verbose debug information on ssh transactions.
+        metadata_ttl (float) (Optional): (10) Seconds remote directory listings are cached (see get_dir_stats), 0 to disable
     """
     
-    def __init__(self, ssh_data=None, credentials_path=None, private_path=None, passwd=None, debug=False):
+    def __init__(
+            self, ssh_data=None, credentials_path=None, private_path=None, passwd=None, debug=False,
+            metadata_ttl=DEFAULT_METADATA_TTL
+            ):
         if ssh_data is None:
             self.ssh_data = SSHCredentials(credentials_path is None)
             if credentials_path:
@@ -37,35 +141,63 @@ class SSHSession:
         self.ssh = SSHClient()
         self.ssh.set_missing_host_key_policy(AutoAddPolicy())
         self.sftp = None
+        self.metadata = RemoteMetadataCache(metadata_ttl)
        
         if debug:
             paramiko.common.logging.basicConfig(level=paramiko.common.DEBUG)
        
+        start = time.perf_counter()
         try:
             self.ssh.connect(
                 self.ssh_data.host,
+                port=getattr(self.ssh_data, 'port', 22),
                 username=self.ssh_data.userid,
                 pkey=self.ssh_data.key,
                 look_for_keys=self.ssh_data.look_for_keys
             )
         except AuthenticationException as err:
+            metrics.observe(metrics.SSH_CONNECT, self.ssh_data.host, time.perf_counter() - start, error=True)
             sys.exit(err)
         except SSHException as err:
+            metrics.observe(metrics.SSH_CONNECT, self.ssh_data.host, time.perf_counter() - start, error=True)
             sys.exit(err)
+        metrics.observe(metrics.SSH_CONNECT, self.ssh_data.host, time.perf_counter() - start)
 
-    def run_command(self, command):
+    @metrics.instrument(
+        metrics.SSH_COMMAND,
+        get_label=lambda self, command, *args, **kwargs: metrics.command_name(command),
+        get_bytes=lambda result, *args, **kwargs: len(result[0]) + len(result[1])
+    )
+    def run_command(self, command, forward_agent=False):
         """ SSHSession.run_command
         Runs a shell command on remote, produces stdout, stderr tuple
             
         Args:
             command (str | list(str)): Command  or list of commands to execute on remote.
+            forward_agent (bool): (False) Forward the local ssh agent, so the command can open ssh connections with the user's keys
         """
         if isinstance(command, list):
             command = ' '.join(command)
+        if forward_agent:
+            channel = self.ssh.get_transport().open_session()
+            forwarder = paramiko.agent.AgentRequestHandler(channel)
+            try:
+                channel.exec_command(command)
+                stdout = channel.makefile('r')
+                stderr = channel.makefile_stderr('r')
+                return stdout.read().decode(), stderr.read().decode()
+            finally:
+                forwarder.close()
+                channel.close()
         if self.ssh:
             stdin, stdout, stderr = self.ssh.exec_command(command)
         return ''.join(stdout), ''.join(stderr)
 
+    @metrics.instrument(
+        metrics.SFTP,
+        get_label=lambda self, oper, *args, **kwargs: oper,
+        get_bytes=lambda result, self, oper, *args, **kwargs: _sftp_bytes(result, oper, *args, **kwargs)
+    )
     def run_sftp(self, oper, input_file_path, output_file_path='', reuse_session=True):
         """ SSHSession.run_sftp
         Opens a SFTP session on remote and execute some file operation
@@ -77,6 +209,8 @@ class SSHSession:
                 * **create** - creates a file in output_file_path (remote) from input_file_path string.
                 * **file** - opens a remote file in input_file_path for read). Returns a file handle.
                 * **listdir** - returns a list of files in remote input_file_path.
+                * **listdir_attr** - returns a list of SFTPAttributes (with filename) of files in remote input_file_path.
+                * **lstat** - returns SFTPAttributes of remote input_file_path.
 
             input_file_path (str): Input file path or input string
             output_file_path (str): ('') Output file path. Not required in some ops.
@@ -91,10 +225,14 @@ class SSHSession:
             if oper == 'get':
                 self.sftp.get(input_file_path, output_file_path)
             elif oper == 'put':
-                self.sftp.put(input_file_path, output_file_path)
+                # put returns the remote file attributes, no need to list again
+                self.metadata.update_file(
+                    output_file_path, get_stats_dict(self.sftp.put(input_file_path, output_file_path))
+                )
             elif oper == 'create':
                 with self.sftp.file(output_file_path, "w") as remote_fileh:
                     remote_fileh.write(input_file_path)
+                self.metadata.update_file(output_file_path, None)
 #            elif oper == 'open':
 #                return sftp.open(input_file_path)
             elif oper == 'file':
@@ -102,6 +240,8 @@ class SSHSession:
                     return remote_file.read().decode()
             elif oper == "listdir":
                 return self.sftp.listdir(input_file_path)
+            elif oper == 'listdir_attr':
+                return self.sftp.listdir_attr(input_file_path)
 #            elif oper == 'rmdir':
 #                return sftp.rmdir(input_file_path)
             elif oper == 'lstat':
@@ -114,6 +254,57 @@ class SSHSession:
             sys.exit(err)
         return False
     
+    def open_file(self, file_path, mode='rb'):
+        """ SSHSession.open_file
+        Opens a remote file, returns a file object. Reads are prefetched, writes pipelined.
+        
+        Args:
+            file_path (str): Remote file path
+            mode (str): ('rb') Open mode
+        """
+        if not self.sftp:
+            self.sftp = self.ssh.open_sftp()
+        try:
+            remote_file = self.sftp.open(file_path, mode)
+        except IOError as err:
+            sys.exit(err)
+        if 'r' in mode:
+            remote_file.prefetch()
+        else:
+            remote_file.set_pipelined(True)
+            self.metadata.update_file(file_path, None)
+        return remote_file
+
+    def get_dir_stats(self, dir_path, refresh=False):
+        """ SSHSession.get_dir_stats
+        Stats of the files in a remote directory as {file name: stats dict}, in a single sftp request.
+        Listings are cached for metadata_ttl seconds
+        
+        Args:
+            dir_path (str): Remote directory
+            refresh (bool): (False) Ignore cached listing
+        """
+        if not refresh:
+            files = self.metadata.get(dir_path)
+            if files is not None:
+                return files
+        files = {
+            attributes.filename: get_stats_dict(attributes)
+            for attributes in self.run_sftp('listdir_attr', dir_path)
+        }
+        self.metadata.set(dir_path, files)
+        return dict(files)
+
+    def invalidate_metadata(self, path=None):
+        """ SSHSession.invalidate_metadata
+        Drops cached listings of path and its subdirectories (all if path is None),
+        to be used after remote changes not made through run_sftp
+        
+        Args:
+            path (str): (None) Remote path
+        """
+        self.metadata.invalidate(path)
+
     def is_active(self):
         """ SSHSession.is_active
         Tests whether the defined session is active
@@ -127,4 +318,20 @@ class SSHSession:
         if self.ssh:
             self.ssh.close()
             self.ssh = None
-            
\ No newline at end of file
+            
+
+
+def _sftp_bytes(result, oper, input_file_path, output_file_path='', reuse_session=True):
+    """
+    | Private. ssh_session._sftp_bytes
+    | Bytes transferred by a run_sftp operation, for metrics
+    """
+    if oper == 'put':
+        return os.path.getsize(input_file_path)
+    if oper == 'get':
+        return os.path.getsize(output_file_path)
+    if oper == 'create':
+        return len(input_file_path)
+    if oper == 'file':
+        return len(result)
+    return 0
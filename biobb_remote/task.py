@@ -6,11 +6,22 @@ import uuid
 import pickle
 import json
 import time
+import hashlib
+from array import array
 
 from os.path import join as opj
 
+from biobb_remote import metrics
+from biobb_remote import tracing
+from biobb_remote.journal import TaskJournal
+from biobb_remote.input_cache import RemoteInputCache, file_hash
+from biobb_remote.lazy_output import LazyOutputBundle
+from biobb_remote.output_manifest import OutputManifest, MANIFEST_FILE, get_epilogue_lines
+from biobb_remote.remote_transfer import RemoteTransfer
 from biobb_remote.ssh_session import SSHSession
 from biobb_remote.ssh_credentials import SSHCredentials
+from biobb_remote.perf_history import parse_time, format_time
+from biobb_remote.queue_info import get_cached_snapshot, DEFAULT_SNAPSHOT_TTL
 
 UNKNOWN = 0
 SUBMITTED = 1
@@ -28,12 +39,23 @@ JOB_STATUS = {
 }
 BIOBB_COMMON_SETTINGS_IMPORT = 'from biobb_common.configuration import settings'
 BIOBB_COMMON_SETTINGS_CALL = "settings.ConfReader(config='{}').get_prop_dic()"
+# Node-local scratch staging, overriden by "scratch" in host configuration
+SCRATCH_DEFAULTS = {
+    'path': '$TMPDIR',
+    'copy_strategy': 'serial',
+    'copy_jobs': 4,
+    'signal_time': 300
+}
+# Attempts to link input cache blobs removed by concurrent releases
+INPUT_CACHE_RETRIES = 3
 
 
 class DataBundle():
     """ 
     | biobb_remote task.DataBundle
-    | Class to pack a files manifest
+    | Class to pack a files manifest.
+    | Files are stored in columns (name, interned directory, size, mtime, mode), so large bundles
+    | take little memory and serialize quickly. Lookups by file name are O(1).
     
     Args:
         bundle_id (str): Id for the data bundle
@@ -42,22 +64,49 @@ class DataBundle():
     """
     def __init__(self, bundle_id, remote=False):
         self.id = bundle_id
-        self.files = {}
         self.remote = remote
-
-    def add_file(self, file_path):
+        self.names = []
+        self.index = {}
+        self.dirs = []
+        self.dir_index = {}
+        self.file_dirs = array('L')
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.modes = array('L')
+        self.version = 0
+
+    def add_file(self, file_path, stats=None):
         """
         | DataBundle.add_file
-        | Adds a single file to the data bundle
+        | Adds a single file to the data bundle, or updates its stats if already included
     
         Args:
             file_path (str): Path to the file.
+            stats (os.stat_result | dict) (Optional): (None) File stats, read from the file for local bundles if not set
         """
-        if file_path not in self.files:
-            file_name = os.path.basename(file_path) 
-            self.files[file_name] = {"full_path": file_path, 'stats': None}
-        if not self.remote:
-            self.files[file_name]['stats'] = os.stat(file_path)
+        file_name = os.path.basename(file_path)
+        if stats is None and not self.remote:
+            stats = os.stat(file_path)
+        size, mtime, mode = _get_stats_values(stats)
+        row = self.index.get(file_name)
+        if row is None:
+            dir_path = file_path[:len(file_path) - len(file_name)]
+            dir_row = self.dir_index.get(dir_path)
+            if dir_row is None:
+                dir_row = self.dir_index[dir_path] = len(self.dirs)
+                self.dirs.append(dir_path)
+            self.index[file_name] = len(self.names)
+            self.names.append(file_name)
+            self.file_dirs.append(dir_row)
+            self.sizes.append(size)
+            self.mtimes.append(mtime)
+            self.modes.append(mode)
+            self.version += 1
+        elif stats is not None:
+            self.sizes[row] = size
+            self.mtimes[row] = mtime
+            self.modes[row] = mode
+            self.version += 1
 
     def add_dir(self, dir_path):
         """ 
@@ -68,16 +117,35 @@ class DataBundle():
             dir_path (str): Path to the directory
         """
         try:
-            self.files = list(
-                map(lambda x: opj(dir_path, x), os.listdir(dir_path)))
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        self.add_file(entry.path, None if self.remote else entry.stat())
         except IOError as err:
             sys.exit(err)
 
+    def has_file(self, file_name):
+        """
+        | DataBundle.has_file
+        | Checks whether a file is included
+
+        Args:
+            file_name (str): Name of the file.
+        """
+        return file_name in self.index
+
+    def get_num_files(self):
+        """
+        | DataBundle.get_num_files
+        | Number of included files
+        """
+        return len(self.names)
+
     def get_file_names(self):
         """ 
         | DataBundle.get_file_names
         | Provides a list of names of included files"""
-        return self.files.keys()
+        return self.names
 
     def get_full_path(self, file_name):
         """ 
@@ -87,24 +155,145 @@ class DataBundle():
         Args:
             file_name (str): Name of the file.
         """
-        return self.files[file_name]['file_path']
+        row = self.index[file_name]
+        return self.dirs[self.file_dirs[row]] + file_name
 
     def get_mtime(self, file_name):
         """
         | DataBundle.get_mtime
-        | Gives the modification time for a given file
+        | Gives the modification time for a given file, None if not known
         
         Args:
             file_name (str): Name of the file.
         """
-        return self.files[file_name]['stats'].st_mtime
+        mtime = self.mtimes[self.index[file_name]]
+        return None if mtime < 0 else mtime
+
+    def get_size(self, file_name):
+        """
+        | DataBundle.get_size
+        | Gives the size in bytes for a given file, None if not known
+        
+        Args:
+            file_name (str): Name of the file.
+        """
+        size = self.sizes[self.index[file_name]]
+        return None if size < 0 else size
+
+    def get_mode(self, file_name):
+        """
+        | DataBundle.get_mode
+        | Gives the file mode (type and permissions) for a given file
+        
+        Args:
+            file_name (str): Name of the file.
+        """
+        return self.modes[self.index[file_name]]
+
+    def get_total_size(self):
+        """
+        | DataBundle.get_total_size
+        | Gives the total size in bytes of the included files (with known size)
+        """
+        return sum(size for size in self.sizes if size > 0)
+
+    def get_rows(self, start=0):
+        """
+        | DataBundle.get_rows
+        | Json-serializable columns of files from position start, used to save appended files
+
+        Args:
+            start (int) (Optional): (0) First file position
+        """
+        return {
+            'names': self.names[start:],
+            'dirs': [self.dirs[dir_row] for dir_row in self.file_dirs[start:]],
+            'sizes': self.sizes[start:].tolist(),
+            'mtimes': self.mtimes[start:].tolist(),
+            'modes': self.modes[start:].tolist()
+        }
+
+    def add_rows(self, rows):
+        """
+        | DataBundle.add_rows
+        | Adds files from get_rows output
+
+        Args:
+            rows (dict): File columns
+        """
+        for name, dir_path, size, mtime, mode in zip(
+                rows['names'], rows['dirs'], rows['sizes'], rows['mtimes'], rows['modes']
+                ):
+            self.add_file(dir_path + name, {'st_size': size, 'st_mtime': mtime, 'st_mode': mode})
 
     def to_json(self):
         """ 
         | DataBundle.to_json
         | Generates a Json dump of the DataBundle
         """
-        return json.dumps(self.__dict__)
+        return json.dumps({
+            'id': self.id,
+            'remote': self.remote,
+            'dirs': self.dirs,
+            'names': self.names,
+            'file_dirs': self.file_dirs.tolist(),
+            'sizes': self.sizes.tolist(),
+            'mtimes': self.mtimes.tolist(),
+            'modes': self.modes.tolist()
+        })
+
+    @classmethod
+    def from_json(cls, json_str):
+        """
+        | DataBundle.from_json
+        | Rebuilds a DataBundle from its Json dump. Dumps of the former per-file format are also accepted
+
+        Args:
+            json_str (str | dict): Json dump, as generated by to_json, or its parsed dict
+        """
+        if isinstance(json_str, dict):
+            data = json_str
+        else:
+            data = json.loads(json_str)
+        bundle = cls(data['id'], remote=data.get('remote', False))
+        if 'files' in data:
+            for file_name, file in data['files'].items():
+                stats = file.get('stats')
+                if isinstance(stats, list):
+                    stats = os.stat_result(stats)
+                bundle.add_file(file.get('full_path') or file_name, stats or {})
+            return bundle
+        bundle.dirs = data['dirs']
+        bundle.dir_index = {dir_path: dir_row for dir_row, dir_path in enumerate(bundle.dirs)}
+        bundle.names = data['names']
+        bundle.index = {file_name: row for row, file_name in enumerate(bundle.names)}
+        bundle.file_dirs = array('L', data['file_dirs'])
+        bundle.sizes = array('q', data['sizes'])
+        bundle.mtimes = array('d', data['mtimes'])
+        bundle.modes = array('L', data['modes'])
+        return bundle
+
+
+def _get_stats_values(stats):
+    """
+    | Private. task._get_stats_values
+    | Size, mtime and mode from os.stat_result, paramiko SFTPAttributes or a stats dict. -1 when not known
+    """
+    if stats is None:
+        return -1, -1., 0
+    if isinstance(stats, dict):
+        size = stats.get('st_size')
+        mtime = stats.get('st_mtime')
+        mode = stats.get('st_mode')
+    else:
+        size = getattr(stats, 'st_size', None)
+        mtime = getattr(stats, 'st_mtime', None)
+        mode = getattr(stats, 'st_mode', None)
+    return (
+        -1 if size is None else size,
+        -1. if mtime is None else mtime,
+        mode or 0
+    )
 
 
 class Task():
@@ -131,6 +320,10 @@ class Task():
         self.debug = debug_ssh
         self.commands = {}
         self.modified = False
+        self.perf_history = None
+        self.journal = None
+        if tracing.is_enabled():
+            self.enable_tracing()
 
     def load_data_from_file(self, file_path, mode='json'):
         """ 
@@ -139,27 +332,19 @@ class Task():
         
         Args:
             file_path (str): Path to file
-            mode (str) (Optional): (json) File format. Accepted: Json | Pickle
+            mode (str) (Optional): (json) File format. Accepted: Json | Pickle | Journal
         """
         # TODO detect file type
         if mode == 'pickle':
             file = open(file_path, 'rb')
             self.task_data = pickle.load(file)
         elif mode == 'json':
-            file = open(file_path, 'r')
-            self.task_data = json.load(file)
-            if 'local_data_bundle' in self.task_data:
-                local_data_bundle = json.loads(
-                    self.task_data['local_data_bundle'])
-                self.task_data['local_data_bundle'] = DataBundle(
-                    local_data_bundle['id'])
-                self.task_data['local_data_bundle'].files = local_data_bundle['files']
-            if 'output_data_bundle' in self.task_data:
-                output_data_bundle = json.loads(
-                    self.task_data['output_data_bundle'])
-                self.task_data['output_data_bundle'] = DataBundle(
-                    output_data_bundle['id'])
-                self.task_data['output_data_bundle'].files = local_data_bundle['files']
+            with open(file_path, 'r') as file:
+                self.import_task_data(json.load(file))
+        elif mode == 'journal':
+            self.journal = TaskJournal(file_path)
+            self.import_task_data(self.journal.replay())
+            self.journal.sync(self)
         else:
             sys.exit("ERROR: file type ({}) not supported".format(mode))
         self.id = self.task_data['id']
@@ -172,21 +357,19 @@ class Task():
         
         Args:
             save_file_path (str): Path to file
-            mode (str) (Optional): (json) Format to use json|pickle.
+            mode (str) (Optional): (json) Format to use json|pickle|journal. Journal appends only changes since the last save (see journal.TaskJournal)
             verbose (bool) (Optional): (False) Print additional information on stdout
         """
         if self.modified:
             self.task_data['id'] = self.id
             if mode == 'json':
-                data = {'id': self.id}
-                for k in self.task_data:
-                    data[k] = self.task_data[k]
-                if 'local_data_bundle' in self.task_data:
-                    data['local_data_bundle'] = self.task_data['local_data_bundle'].to_json()
-                if 'output_data_bundle' in self.task_data:
-                    data['output_data_bundle'] = self.task_data['output_data_bundle'].to_json()
                 with open(save_file_path, 'w') as task_file:
-                    json.dump(data, task_file, indent=3)
+                    json.dump(self.export_task_data(), task_file, indent=3)
+
+            elif mode == 'journal':
+                if self.journal is None or self.journal.path != save_file_path:
+                    self.journal = TaskJournal(save_file_path)
+                self.journal.write(self)
 
             elif mode == "pickle":
                 with open(save_file_path, 'wb') as task_file:
@@ -199,6 +382,118 @@ class Task():
         if verbose:
             print("Task log saved on ", save_file_path)
 
+    def _get_save_mode(self, save_file_path, save_mode=None):
+        """
+        | Private. Task._get_save_mode
+        | Save mode for progress saves: save_mode if set, journal if save_file_path is the journal
+        | the task was loaded from or saved to, json otherwise
+        """
+        if save_mode:
+            return save_mode
+        if self.journal is not None and os.path.abspath(self.journal.path) == os.path.abspath(save_file_path):
+            return 'journal'
+        return 'json'
+
+    def export_task_data(self):
+        """
+        | Task.export_task_data
+        | Returns task data as a json-serializable dict (as saved by save in json mode)
+        """
+        self.task_data['id'] = self.id
+        data = {'id': self.id}
+        for k in self.task_data:
+            data[k] = self.task_data[k]
+        if 'local_data_bundle' in self.task_data:
+            data['local_data_bundle'] = self.task_data['local_data_bundle'].to_json()
+        if 'output_data_bundle' in self.task_data:
+            data['output_data_bundle'] = self.task_data['output_data_bundle'].to_json()
+        if 'trace' in self.task_data:
+            data['trace'] = self.task_data['trace'].to_json()
+        return data
+
+    def import_task_data(self, data):
+        """
+        | Task.import_task_data
+        | Sets task data from a dict generated by export_task_data
+
+        Args:
+            data (dict): Task data
+        """
+        self.task_data = dict(data)
+        for key in ('local_data_bundle', 'output_data_bundle'):
+            if key in self.task_data and not isinstance(self.task_data[key], DataBundle):
+                self.task_data[key] = DataBundle.from_json(self.task_data[key])
+        if 'trace' in self.task_data:
+            self.task_data['trace'] = tracing.TaskTrace.from_json(self.task_data['trace'])
+        self.id = self.task_data['id']
+
+# Tracing
+    def enable_tracing(self):
+        """
+        | Task.enable_tracing
+        | Starts recording trace spans for this task (see tracing.TaskTrace). Returns the trace
+        """
+        if 'trace' not in self.task_data:
+            self.task_data['trace'] = tracing.TaskTrace(self.id)
+        return self.task_data['trace']
+
+    def get_trace(self):
+        """
+        | Task.get_trace
+        | Returns the task trace, None if not traced
+        """
+        return self.task_data.get('trace')
+
+    def save_trace(self, output_path, trace_format=tracing.CHROME):
+        """
+        | Task.save_trace
+        | Saves the task trace as Chrome trace or OTLP json
+
+        Args:
+            output_path (str): Path to file
+            trace_format (str) (Optional): (chrome) Format, chrome | otlp
+        """
+        if self.get_trace() is None:
+            sys.exit("Error: task is not traced, use enable_tracing first")
+        self.get_trace().save(output_path, trace_format)
+
+    def _span(self, name, **attributes):
+        """
+        | Private. Task._span
+        | Trace span context manager, does nothing if the task is not traced
+        """
+        return tracing.span(self.task_data.get('trace'), name, **attributes)
+
+    def _trace_job_status(self):
+        """
+        | Private. Task._trace_job_status
+        | Records job status changes in the trace. Once finished, adds queue wait and run spans,
+        | from accounting data when available, otherwise from the times status changes were seen
+        """
+        trace = self.get_trace()
+        if trace is None or not self.modified:
+            return
+        trace.mark(JOB_STATUS[self.task_data['status']])
+        if self.task_data['status'] != FINISHED:
+            return
+        accounting = self.get_job_accounting()
+        submit_time = tracing.parse_accounting_time(accounting.get('submit')) \
+            or trace.marks.get(JOB_STATUS[SUBMITTED])
+        start_time = tracing.parse_accounting_time(accounting.get('start')) \
+            or trace.marks.get(JOB_STATUS[RUNNING])
+        end_time = tracing.parse_accounting_time(accounting.get('end')) \
+            or trace.marks.get(JOB_STATUS[FINISHED])
+        attributes = {
+            'job_id': self.task_data.get('remote_job_id', ''),
+            'host': self.ssh_data.host or ''
+        }
+        if accounting.get('state'):
+            attributes['state'] = accounting['state']
+        if submit_time and start_time:
+            trace.add_span('queue_wait', submit_time, start_time, **attributes)
+        if start_time and end_time:
+            trace.add_span('run', start_time, end_time, **attributes)
+
 # Credential management
     def set_credentials(self, credentials):
         """ 
@@ -258,6 +553,31 @@ class Task():
             data = ''
         return data[0]
 
+    def get_queue_snapshot(self, ttl=DEFAULT_SNAPSHOT_TTL, refresh=False):
+        """
+        | Task.get_queue_snapshot
+        | Returns a structured cluster load snapshot (nodes and pending jobs per partition, user limits).
+        | Snapshots are cached and shared by all tasks on the same host and user.
+        
+        Args:
+            ttl (float) (Optional): (60) Max age of a cached snapshot (seconds)
+            refresh (bool) (Optional): (False) Force a new snapshot
+        """
+        return get_cached_snapshot(
+            (self.host_config['description'], self.ssh_data.userid),
+            self._build_queue_snapshot,
+            ttl=ttl,
+            refresh=refresh
+        )
+
+    def _build_queue_snapshot(self):
+        """
+        | Private. Task._build_queue_snapshot
+        | Builds a new QueueSnapshot
+        | Developed in inherited queue classes
+        """
+        return None
+
 # Job settings
     def _set_modules(self, module_set):
         """
@@ -340,17 +660,50 @@ class Task():
 
         self.host_config['qsettings']['custom'] = qset
 
-    def prep_auto_settings(self, total_cores=0, nodes=0, cpus_per_task=1,  num_gpus=0):
+    def prep_auto_settings(
+            self,
+            total_cores=0,
+            nodes=0,
+            cpus_per_task=1,
+            num_gpus=0,
+            history=None,
+            local_run_script='',
+            max_wall_time=0
+            ):
         """
         | Task.prep_auto_settings
         | Prepare queue settings for balancing MPI/OMP/GPU.
+        | If a performance history is given, and it contains runs of the same script on this host,
+        | the recorded configuration with the best predicted throughput per core-hour is returned instead.
         
         Args:
             total_cores (int) (Optional): (0) Aproximated number of cores to use
             nodes (int) (Optional): (0) Number of complete nodes to use (overrides total_cores)
             cpus_per_task (int) (Optional): (1) OMP processes per MPI task to allocate
             num_gpus (int) (Optional): (0) Num of GPUs per node to allocate
+            history (PerformanceHistory) (Optional): (None) Performance history to consult
+            local_run_script (str) (Optional): ('') Run script (path or '#script' string) to identify history records. Defaults to task's one
+            max_wall_time (int) (Optional): (0) Only use recorded configurations predicted to end within this time (seconds)
         """
+        if history:
+            best = history.recommend(
+                self.host_config['description'],
+                self.get_script_fingerprint(local_run_script),
+                self.get_input_size(),
+                min_gpus=num_gpus,
+                max_wall_time=max_wall_time
+            )
+            if best:
+                print(
+                    "Using recorded configuration, predicted wall time {:.0f}s, prediction error {}".format(
+                        best['predicted_time'],
+                        history.get_error_summary(self.host_config['description'], best['fingerprint'])
+                    )
+                )
+                self.task_data['predicted_wall_time'] = best['predicted_time']
+                self.modified = True
+                return dict(best['settings'])
+
         if nodes:
             total_cores = nodes * self.host_config['cores_per_node']
 
@@ -395,7 +748,98 @@ class Task():
 
         return settings
 
+    def prep_launch_profile(self, total_cores=0, nodes=0, cpus_per_task=1, num_gpus=0):
+        """
+        | Task.prep_launch_profile
+        | Prepare a complete launch profile: queue settings (as in prep_auto_settings), 
+        | threading/binding environment, and launcher prefix for parallel runs.
+        | Use in submit as launch_profile, the launcher is available in the script as $BIOBB_LAUNCHER.
+        
+        Args:
+            total_cores (int) (Optional): (0) Aproximated number of cores to use
+            nodes (int) (Optional): (0) Number of complete nodes to use (overrides total_cores)
+            cpus_per_task (int) (Optional): (1) OMP processes per MPI task to allocate
+            num_gpus (int) (Optional): (0) Num of GPUs per node to allocate
+        """
+        settings = self.prep_auto_settings(total_cores, nodes, cpus_per_task, num_gpus)
+
+        if self.host_config.get('threads_per_core', 1) > 1:
+            # cores_per_node counts hardware threads, bind OMP threads to them
+            omp_places = 'threads'
+        else:
+            omp_places = 'cores'
+
+        env = {
+            'OMP_NUM_THREADS': settings['cpus-per-task'],
+            'OMP_PLACES': omp_places,
+            'OMP_PROC_BIND': 'close'
+        }
+
+        gpu_map = []
+        if 'gres' in settings:
+            gpus = int(settings['gres'].split(':')[-1])
+            ranks = settings['ntasks-per-node']
+            # Local rank i uses GPU i * gpus / ranks, spreading ranks evenly over GPUs
+            gpu_map = [int(i * gpus / ranks) for i in range(ranks)]
+
+        return {
+            'settings': settings,
+            'env': env,
+            'launcher': self._get_launcher_prefix(settings, gpu_map)
+        }
+
+    def _get_launcher_prefix(self, settings, gpu_map):
+        """
+        | Private. Task._get_launcher_prefix
+        | Command prefix to launch parallel runs with proper CPU/GPU binding
+        | Developed in inherited queue classes
+        
+        Args:
+            settings (dict): Queue settings
+            gpu_map (list(int)): GPU to use for each local rank. Empty if no GPUs
+        """
+        return ''
+
+    def _get_launch_profile_lines(self, launch_profile):
+        """
+        | Private. Task._get_launch_profile_lines
+        | Script lines setting launch profile environment
+        
+        Args:
+            launch_profile (dict): Launch profile as obtained from prep_launch_profile
+        """
+        scr_lines = ['# Launch profile']
+        for k, v in launch_profile['env'].items():
+            scr_lines.append('export {}={}'.format(k, v))
+        scr_lines.append('BIOBB_LAUNCHER="{}"'.format(launch_profile['launcher']))
+        return scr_lines
+
+    def get_script_fingerprint(self, local_run_script=''):
+        """
+        | Task.get_script_fingerprint
+        | Hash identifying the run script contents
+        
+        Args:
+            local_run_script (str) (Optional): ('') Path to local script or script string (leading '#script' tag). Defaults to task's one
+        """
+        if not local_run_script:
+            local_run_script = self.task_data.get('local_run_script', '')
+        if local_run_script.find('#script') == -1 and os.path.isfile(local_run_script):
+            with open(local_run_script, 'r') as scr_file:
+                local_run_script = scr_file.read()
+        return hashlib.sha1(local_run_script.encode()).hexdigest()
+
+    def get_input_size(self):
+        """
+        | Task.get_input_size
+        | Total size in bytes of the input data bundle, 0 if not set
+        """
+        if self.task_data.get('local_data_bundle'):
+            return self.task_data['local_data_bundle'].get_total_size()
+        return 0
+
 # Job submission
+    @metrics.instrument(metrics.TASK_STAGE, 'local_scan')
     def set_local_data_bundle(self, local_data_path, add_files=True):
         """
         | Task.set_local_data_bundle
@@ -425,7 +869,8 @@ class Task():
             sys.exit('Error while creating remote working directory: ' + stderr)
 
 
-    def send_input_data(self, remote_base_path, create_dir=True, overwrite=True, new_only=True):
+    @metrics.instrument(metrics.TASK_STAGE, 'upload')
+    def send_input_data(self, remote_base_path, create_dir=True, overwrite=True, new_only=True, use_cache=False):
         """ 
         | Task.send_input_data
         | Uploads data to remote working dir
@@ -435,6 +880,7 @@ class Task():
             create_dir (bool) (Optional): (True) Creates remote working dir
             overwrite (bool) (Optional): (True) Allows overwrite files with the same name if any
             new_only (bool) (Optional): (True) Overwrite only with newer files
+            use_cache (bool) (Optional): (False) Share identical files with other tasks through the remote input cache (see input_cache.RemoteInputCache). Cached files are read-only
         """
         self._open_ssh_session()
         
@@ -453,20 +899,106 @@ class Task():
         #remote_files = self.ssh_session.run_sftp('listdir', self._remote_wdir())
         remote_files = self.get_remote_file_stats()
 
-        for file_name in self.task_data['local_data_bundle'].files:            
-            file = self.task_data['local_data_bundle'].files[file_name]
-            exists = file_name in remote_files
-            if exists:
-                is_new = file['stats'].st_mtime > remote_files[file_name]['st_mtime']
+        with self._span('upload', host=self.ssh_data.host or '') as upload_span:
+            bundle = self.task_data['local_data_bundle']
+            file_names = []
+            for file_name in bundle.get_file_names():
+                exists = file_name in remote_files
+                if exists:
+                    is_new = bundle.get_mtime(file_name) > remote_files[file_name]['st_mtime']
+                else:
+                    is_new = True
+                if not exists or (overwrite and (not new_only or is_new)):
+                    file_names.append(file_name)
+            if use_cache:
+                sent_files, sent_bytes = self._send_cached_files(file_names)
             else:
-                is_new = True
-            if not exists or (overwrite and (not new_only or is_new)):
-                remote_file_path = opj(self._remote_wdir(), file_name)
-                self.ssh_session.run_sftp('put', file['full_path'], remote_file_path)
-                print("sending_file: {} -> {}".format(file['full_path'], remote_file_path))
+                sent_files = sent_bytes = 0
+                for file_name in file_names:
+                    full_path = bundle.get_full_path(file_name)
+                    remote_file_path = opj(self._remote_wdir(), file_name)
+                    with self._span('upload_file', file=file_name, bytes=bundle.get_size(file_name)):
+                        self.ssh_session.run_sftp('put', full_path, remote_file_path)
+                    print("sending_file: {} -> {}".format(full_path, remote_file_path))
+                    sent_files += 1
+                    sent_bytes += bundle.get_size(file_name)
+            upload_span.set_attribute('files', sent_files)
+            upload_span.set_attribute('bytes', sent_bytes)
         self.task_data['input_data_loaded'] = True
         self.modified = True
 
+    def copy_to_task(self, target_task, remote_base_path=None, files_only=None, methods=None):
+        """
+        | Task.copy_to_task
+        | Copies files of the remote working dir to the working dir of another task (e.g. on another host),
+        | directly between login nodes when possible, streamed through this client otherwise (see remote_transfer.RemoteTransfer).
+        | Files become the input data of target_task. Returns a summary of the transfer
+
+        Args:
+            target_task (Task): Task receiving the files, with credentials set
+            remote_base_path (str) (Optional): (None) Remote base directory on the target host, the working dir is created within. Uses the current one if not set
+            files_only (list(str)) (Optional): (None) Only copy files in list, all files if not set
+            methods (list(str)) (Optional): (None) Transfer methods to try in order (agent, temp_key, relay)
+        """
+        target_task._open_ssh_session()
+        if remote_base_path:
+            target_task.prep_remote_workdir(remote_base_path)
+        elif not target_task.task_data.get('remote_base_path'):
+            sys.exit('Error: remote base path for target task not available')
+        summary = RemoteTransfer(self, target_task, methods).copy(files_only)
+        target_task.task_data['input_data_loaded'] = True
+        target_task.modified = True
+        return summary
+
+    def _send_cached_files(self, file_names):
+        """
+        | Private. Task._send_cached_files
+        | Uploads files missing in the remote input cache and links all of them into the working dir.
+        | Returns number of files and bytes actually uploaded
+
+        Args:
+            file_names (list(str)): Names of bundle files to send
+        """
+        bundle = self.task_data['local_data_bundle']
+        cache = RemoteInputCache(self.ssh_session, self.task_data['remote_base_path'])
+        cache.prepare()
+        with self._span('hash', files=len(file_names)):
+            file_hashes = {
+                file_name: file_hash(
+                    bundle.get_full_path(file_name), bundle.get_size(file_name), bundle.get_mtime(file_name)
+                )
+                for file_name in file_names
+            }
+        missing = cache.get_missing(file_hashes.values())
+        to_link = file_hashes
+        num_uploaded = 0
+        sent_bytes = 0
+        # Blobs removed by a concurrent release after get_missing are reported by link_files, and sent again
+        for _ in range(INPUT_CACHE_RETRIES):
+            uploaded = set()
+            for file_name, blob_hash in to_link.items():
+                if blob_hash in missing and blob_hash not in uploaded:
+                    full_path = bundle.get_full_path(file_name)
+                    with self._span('upload_file', file=file_name, bytes=bundle.get_size(file_name), cached=False):
+                        cache.upload(full_path, blob_hash, self.id)
+                    print("sending_file: {} -> input cache {}".format(full_path, blob_hash))
+                    uploaded.add(blob_hash)
+                    sent_bytes += bundle.get_size(file_name)
+            num_uploaded += len(uploaded)
+            with self._span('link_cached', files=len(to_link)):
+                missing = cache.link_files(self._remote_wdir(), self.id, to_link, uploaded)
+            if not missing:
+                break
+            to_link = {
+                file_name: blob_hash for file_name, blob_hash in to_link.items() if blob_hash in missing
+            }
+        else:
+            sys.exit('Error: input cache blobs removed while linking: ' + ', '.join(sorted(missing)))
+        self.ssh_session.invalidate_metadata(self._remote_wdir())
+        print("linked {} files from input cache ({} uploaded)".format(len(file_hashes), num_uploaded))
+        self.task_data['input_cache'] = sorted(set(self.task_data.get('input_cache', [])) | set(file_hashes.values()))
+        return num_uploaded, sent_bytes
+
     def get_remote_py_script(self, python_import, files, command, properties=''):
         """ 
         | Task.get_remote_py_script
@@ -503,7 +1035,7 @@ class Task():
 
         return '#script\npython -c "{}"\n'.format(';'.join(cmd))
 
-    def get_remote_comm_line(self, command, files, use_biobb=False, properties='', cmd_settings=''):
+    def get_remote_comm_line(self, command, files, use_biobb=False, properties='', cmd_settings='', use_launcher=False):
         """
         | Task.get_remote_comm_list
         | Generates a command line for queue script
@@ -514,6 +1046,7 @@ class Task():
             use_biobb (bool) (Optional): (False) Set to prepend biobb path on host
             properties (dict) (Optional): ('') BioBB properties
             cmd_settings (dict) (Optional): ('') Settings to add to command line (use -x  or --xxx as necessary)
+            use_launcher (bool) (Optional): (False) Prepend launcher from the launch profile ($BIOBB_LAUNCHER)
         """
 
         if use_biobb and 'biobb_apps_path' in self.host_config:
@@ -521,6 +1054,9 @@ class Task():
         else:
             cmd = [command]
 
+        if use_launcher:
+            cmd = ['$BIOBB_LAUNCHER'] + cmd
+
         for file in files.keys():
             if files[file]:
                 if file[0] != '-':
@@ -541,7 +1077,18 @@ class Task():
 
         return '#script\n' + ' '.join(cmd) + '\n'
 
-    def _prepare_queue_script(self, queue_settings, modules, conda_env='', set_debug=False):
+    def _prepare_queue_script(
+            self,
+            queue_settings,
+            modules,
+            conda_env='',
+            set_debug=False,
+            use_scratch=False,
+            launch_profile=None,
+            history=None,
+            output_manifest=False,
+            manifest_checksum=None
+            ):
         """
         | Private. Task._prepare_queue_script
         | Generates the remote queueing script including queue settings
@@ -551,15 +1098,38 @@ class Task():
             modules (str | list(str)): Modules to load
             conda_env (str) (Optional): ('') Conda environment to activate
             set_debug (bool) (Optional): (False) Add Debug QOS to the settings
+            use_scratch (bool) (Optional): (False) Run on node-local scratch (as defined in host configuration)
+            launch_profile (dict) (Optional): (None) Launch profile as obtained from prep_launch_profile
+            history (PerformanceHistory) (Optional): (None) Performance history used to predict the time limit
+            output_manifest (bool) (Optional): (False) End the script writing a manifest of output files
+            manifest_checksum (str) (Optional): (None) Checksum algorithm for the manifest (md5 | sha1 | sha256)
         """
 
         # Add to self.task_data
         if queue_settings:
             self._set_queue_settings(queue_settings, set_debug=set_debug)
+        if launch_profile:
+            self.task_data['launch_profile'] = launch_profile
+            self.task_data['queue_settings'].update(launch_profile['settings'])
+        elif 'launch_profile' in self.task_data:
+            del self.task_data['launch_profile']
+        if history:
+            self._set_predicted_time_limit(history)
         if modules:
             self._set_modules(modules)
         if conda_env:
             self.task_data['conda_env'] = conda_env
+        if use_scratch:
+            self.task_data['scratch'] = self._get_scratch_settings()
+            self.task_data['queue_settings'].update(
+                self._get_stage_out_signal_settings(self.task_data['scratch']['signal_time'])
+            )
+        elif 'scratch' in self.task_data:
+            del self.task_data['scratch']
+        if output_manifest:
+            self.task_data['output_manifest'] = {'checksum': manifest_checksum}
+        elif 'output_manifest' in self.task_data:
+            del self.task_data['output_manifest']
         self.modified = True
 
         # Build bash script
@@ -573,15 +1143,140 @@ class Task():
         if conda_env:
             scr_lines.append('conda activate ' + conda_env)
 
+        if launch_profile:
+            scr_lines += self._get_launch_profile_lines(launch_profile)
+
         if self.task_data['local_run_script'].find('#script') == -1:
             with open(self.task_data['local_run_script'], 'r') as scr_file:
-                script = '\n'.join(scr_lines) + '\n' + scr_file.read()
+                run_script = scr_file.read()
+        else:
+            run_script = self.task_data['local_run_script']
+
+        if output_manifest:
+            scr_lines += get_epilogue_lines(self._remote_wdir(), manifest_checksum)
+
+        if use_scratch:
+            # Scratch staging writes the manifest after copying outputs back
+            scr_lines += self._get_scratch_script_lines(run_script)
+            script = '\n'.join(scr_lines) + '\n'
+        elif output_manifest:
+            # The run script goes in a subshell, so its own traps or exit calls do not skip the manifest
+            scr_lines += [
+                "trap 'biobb_write_manifest; exit 143' USR1 TERM",
+                '# Run in background so traps are not delayed until the script ends',
+                '(',
+                run_script.rstrip('\n'),
+                ') &',
+                'wait $!',
+                'BIOBB_EXIT=$?',
+                'trap - USR1 TERM',
+                'biobb_write_manifest',
+                'exit $BIOBB_EXIT'
+            ]
+            script = '\n'.join(scr_lines) + '\n'
         else:
-            script = '\n'.join(scr_lines) + '\n' + \
-                self.task_data['local_run_script']
+            script = '\n'.join(scr_lines) + '\n' + run_script
 
         return script
 
+    def _set_predicted_time_limit(self, history):
+        """
+        | Private. Task._set_predicted_time_limit
+        | Sets a tight queue time limit from the wall time predicted by the performance history.
+        | The limit in the queue settings is kept as upper bound.
+        
+        Args:
+            history (PerformanceHistory): Performance history
+        """
+        queue_settings = self.task_data['queue_settings']
+        if 'time' in queue_settings:
+            max_time = parse_time(queue_settings['time'])
+        else:
+            max_time = None
+        predicted, limit = history.predict_time_limit(
+            self.host_config['description'],
+            self.get_script_fingerprint(),
+            self.get_input_size(),
+            queue_settings,
+            max_time=max_time
+        )
+        if limit is None:
+            print("Warning: no recorded runs to predict wall time, using queue settings time limit")
+            return
+        queue_settings['time'] = format_time(limit)
+        self.task_data['predicted_wall_time'] = predicted
+        self.task_data['requested_wall_time'] = limit
+        print("Predicted wall time {:.0f}s, requesting {}".format(predicted, queue_settings['time']))
+
+    def _get_scratch_settings(self):
+        """
+        | Private. Task._get_scratch_settings
+        | Node-local scratch settings from host configuration, completed with defaults
+        """
+        settings = dict(SCRATCH_DEFAULTS)
+        if 'scratch' in self.host_config:
+            settings.update(self.host_config['scratch'])
+        if settings['copy_strategy'] not in ('serial', 'parallel'):
+            sys.exit('Error: unknown scratch copy strategy ' + settings['copy_strategy'])
+        if int(self.task_data['queue_settings'].get('nodes', 1)) > 1:
+            print("Warning: scratch staging only uses the first node's local storage")
+        return settings
+
+    def _get_stage_out_signal_settings(self, signal_time):
+        """
+        | Private. Task._get_stage_out_signal_settings
+        | Queue settings to get a signal before the time limit, so outputs can be copied back.
+        | Developed in inherited queue classes
+        
+        Args:
+            signal_time (int): Seconds before the time limit
+        """
+        return {}
+
+    def _get_scratch_script_lines(self, run_script):
+        """
+        | Private. Task._get_scratch_script_lines
+        | Wraps the run script to work on node-local scratch. Inputs are copied in at start,
+        | new or modified files are copied back at the end, on failure, or on the stage-out signal.
+        
+        Args:
+            run_script (str): Script to run
+        """
+        scratch = self.task_data['scratch']
+        if scratch['copy_strategy'] == 'parallel':
+            xargs = 'xargs -0 -r -P {} -n 16'.format(int(scratch['copy_jobs']))
+        else:
+            xargs = 'xargs -0 -r'
+        return [
+            '# Node-local scratch staging',
+            'BIOBB_WORKDIR=' + self._remote_wdir(),
+            'BIOBB_SCRATCH={}/biobb_{}'.format(scratch['path'], self.id),
+            'mkdir -p "$BIOBB_SCRATCH" || exit 1',
+            'cd "$BIOBB_WORKDIR" && find . -type f ! -name {} -print0 | {} cp -p --parents -t "$BIOBB_SCRATCH"'.format(
+                os.path.basename(self.task_data['remote_run_script']), xargs
+            ),
+            'touch "$BIOBB_SCRATCH/.biobb_stage_in"',
+            'biobb_stage_out() {',
+            '    trap - EXIT USR1 TERM',
+            '    cd "$BIOBB_SCRATCH" && find . -type f -newer .biobb_stage_in -print0 | {} cp -p --parents -t "$BIOBB_WORKDIR"'.format(xargs),
+            '    cd "$BIOBB_WORKDIR" && rm -rf "$BIOBB_SCRATCH"',
+        ] + ([
+            '    biobb_write_manifest'
+        ] if 'output_manifest' in self.task_data else []) + [
+            '}',
+            'trap biobb_stage_out EXIT',
+            "trap 'biobb_stage_out; exit 143' USR1 TERM",
+            'cd "$BIOBB_SCRATCH"',
+            '# Run in background so traps are not delayed until the script ends',
+            '(',
+            run_script.rstrip('\n'),
+            ') &',
+            'wait $!',
+            'BIOBB_EXIT=$?',
+            'biobb_stage_out',
+            'exit $BIOBB_EXIT'
+        ]
+
     def _get_queue_settings_string_array(self):
         """
         | Private. Task._get_queue_settings_string_array
@@ -590,6 +1285,7 @@ class Task():
         """
         return []
 
+    @metrics.instrument(metrics.TASK_STAGE, 'submit')
     def submit(
             self, 
             job_name=None, 
@@ -599,7 +1295,13 @@ class Task():
             local_run_script='', 
             conda_env='', 
             save_file_path=None, 
-            poll_time=0
+            poll_time=0,
+            use_scratch=False,
+            launch_profile=None,
+            history=None,
+            output_manifest=False,
+            manifest_checksum=None,
+            save_mode=None
             ):
         """
         | Task.submit
@@ -614,6 +1316,12 @@ class Task():
             local_run_script (str) (Optional): ('') Path to local bash script to run or a string with the script itself (identified by a leading '#script' tag)
             save_file_path (str) (Optional): (None) Path to save task log
             poll_time (int) (Optional): (0) Polling time for job completion (seconds). Set to O to do not wait. 
+            use_scratch (bool) (Optional): (False) Stage data to node-local scratch and run there (as defined in host configuration)
+            launch_profile (dict) (Optional): (None) Launch profile from prep_launch_profile. Its settings override queue_settings
+            history (PerformanceHistory) (Optional): (None) Predict the time limit from earlier runs. The run is added to the history when found finished
+            output_manifest (bool) (Optional): (False) The job ends writing a manifest of its output files, get_output_data reads it instead of listing the remote dir
+            manifest_checksum (str) (Optional): (None) Add checksums to the manifest (md5 | sha1 | sha256), downloads are verified against them
+            save_mode (str) (Optional): (None) Format of save_file_path (json | pickle | journal), defaults to journal if the task uses that journal file, json otherwise
         """
         # Checking that configuration is a valid one
         if self.ssh_data.host not in self.host_config['login_hosts']:
@@ -628,34 +1336,58 @@ class Task():
         if job_name:
             self.task_data['job_name'] = job_name
 
-        self.ssh_session.run_sftp(
-            'create',
-            self._prepare_queue_script(
-                queue_settings, modules, conda_env=conda_env, set_debug=set_debug),
-            self.task_data['remote_run_script']
-        )
+        with self._span('create_script') as script_span:
+            queue_script = self._prepare_queue_script(
+                queue_settings,
+                modules,
+                conda_env=conda_env,
+                set_debug=set_debug,
+                use_scratch=use_scratch,
+                launch_profile=launch_profile,
+                history=history,
+                output_manifest=output_manifest,
+                manifest_checksum=manifest_checksum
+            )
+            script_span.set_attribute('bytes', len(queue_script))
+            self.ssh_session.run_sftp('create', queue_script, self.task_data['remote_run_script'])
 
-        stdout, stderr = self.ssh_session.run_command(
-            self.commands['submit'] + ' ' + self.task_data['remote_run_script']
-        )
+        with self._span('submit', host=self.ssh_data.host or '') as submit_span:
+            stdout, stderr = self._submit_queue_script(self.task_data['remote_run_script'])
 
-        if stderr:
-            sys.exit(stderr)
+            if stderr:
+                sys.exit(stderr)
+
+            self.task_data['remote_job_id'] = self._get_submitted_job_id(stdout)
+            submit_span.set_attribute('job_id', self.task_data['remote_job_id'])
 
-        self.task_data['remote_job_id'] = self._get_submitted_job_id(stdout)
+        self.perf_history = history
 
         self.task_data['status'] = SUBMITTED
+        if self.get_trace() is not None:
+            self.get_trace().mark(JOB_STATUS[SUBMITTED])
 
         self.modified = True
 
         print('Submitted job {}'.format(self.task_data['remote_job_id']))
         
         if save_file_path:
-            self.save(save_file_path)
+            self.save(save_file_path, self._get_save_mode(save_file_path, save_mode))
         
         if poll_time:
             self.check_job(poll_time=poll_time)
 
+    def _submit_queue_script(self, remote_run_script):
+        """
+        | Private. Task._submit_queue_script
+        | Sends the queue script to the queue manager, returns stdout, stderr tuple
+        
+        Args:
+            remote_run_script (str): Path to the queue script on remote
+        """
+        return self.ssh_session.run_command(
+            self.commands['submit'] + ' ' + remote_run_script
+        )
+
     def _get_submitted_job_id(self):
         """
         | Private. Task._get_submitted_job_id
@@ -665,6 +1397,7 @@ class Task():
         return ''
 
 # Job management
+    @metrics.instrument(metrics.TASK_STAGE, 'cancel')
     def cancel(self, remove_data=False):
         """
         | Task.cancel
@@ -676,9 +1409,10 @@ class Task():
 
         if self.task_data['status'] in [SUBMITTED, RUNNING]:
             self._open_ssh_session()
-            stdout, stderr = self.ssh_session.run_command(
-                self.commands['cancel'] + ' ' + self.task_data['remote_job_id']
-            )
+            with self._span('cancel', job_id=self.task_data['remote_job_id']):
+                stdout, stderr = self.ssh_session.run_command(
+                    self.commands['cancel'] + ' ' + self.task_data['remote_job_id']
+                )
             print("Job {} cancelled".format(self.task_data['remote_job_id']))
             if remove_data:
                 self.clean_remote()
@@ -697,6 +1431,7 @@ class Task():
         data = self.ssh_session.run_command(self.commands['queue'])
         return data
 
+    @metrics.instrument(metrics.TASK_STAGE, 'status')
     def _check_job_status(self):
         """
         | Private. Task._check_job_status
@@ -724,9 +1459,15 @@ class Task():
                 elif stat == 'PD':
                     self.task_data['status'] = SUBMITTED
             self.modified = old_status != self.task_data['status']
+            if self.modified or self.task_data['status'] == RUNNING:
+                # The job writes in the working dir, cached stats are outdated
+                self.ssh_session.invalidate_metadata(self._remote_wdir())
+            if self.perf_history and self.modified and self.task_data['status'] == FINISHED:
+                self.perf_history.record_task(self)
+            self._trace_job_status()
         return self.task_data['status']
 
-    def check_job(self, update=True, save_file_path=None,  poll_time=0):
+    def check_job(self, update=True, save_file_path=None,  poll_time=0, save_mode=None):
         """
         | Task.check_job
         | Prints current job status
@@ -734,11 +1475,12 @@ class Task():
             update (bool) (Optional): (True) Update status before printing it.
             save_file_path (str) (Optional): (None) Local task log file to update progress.
             poll_time (int) (Optional): (0) Poll until job finished (seconds).
+            save_mode (str) (Optional): (None) Format of save_file_path (json | pickle | journal), defaults to journal if the task uses that journal file, json otherwise
         """
         if update:
             self._check_job_status()
             if save_file_path:
-                self.save(save_file_path)
+                self.save(save_file_path, self._get_save_mode(save_file_path, save_mode))
         current_time = 0
         if self.task_data['status'] is CANCELLED:
             print("Job cancelled by user")
@@ -750,7 +1492,29 @@ class Task():
                     current_time += poll_time
             self._print_job_status()
             if save_file_path:
-                self.save(save_file_path)
+                self.save(save_file_path, self._get_save_mode(save_file_path, save_mode))
+
+    @metrics.instrument(metrics.TASK_STAGE, 'accounting')
+    def get_job_accounting(self):
+        """
+        | Task.get_job_accounting
+        | Returns accounting data for the job (state, elapsed seconds, submit, start and end times), if available
+        """
+        if 'remote_job_id' not in self.task_data:
+            return {}
+        self._open_ssh_session()
+        return self._get_job_accounting(self.task_data['remote_job_id'])
+
+    def _get_job_accounting(self, job_id):
+        """
+        | Private. Task._get_job_accounting
+        | Reads job accounting data
+        | Developed in inherited queue classes
+        
+        Args:
+            job_id (str): Job id
+        """
+        return {}
 
     def _print_job_status(self, prefix=''):
         """
@@ -790,25 +1554,128 @@ class Task():
 
         return stdout, stderr
 
-    def get_remote_file_stats(self):
+    def get_remote_file_stats(self, refresh=False):
         """
         | Task.get_remote_file_stats
-        | Returns remote files stats
+        | Returns remote files stats. Obtained in a single sftp request and cached
+        | by the session for a few seconds (see SSHSession.get_dir_stats)
+
+        Args:
+            refresh (bool) (Optional): (False) Ignore cached stats
         """
         self._open_ssh_session()
-        stats = {}
-        for file in self.ssh_session.run_sftp('listdir', self._remote_wdir()):
-            stats[file] = vars(self.ssh_session.run_sftp(
-                'lstat', opj(self._remote_wdir(), file)))
+        with self._span('stat', host=self.ssh_data.host or '') as span:
+            stats = self.ssh_session.get_dir_stats(self._remote_wdir(), refresh)
+            span.set_attribute('files', len(stats))
         return stats
 
+    def reduce_remote_files(self, reduction, files_only=None):
+        """
+        | Task.reduce_remote_files
+        | Reduces trajectory files in the remote working dir (frame stride, atom selection, format conversion)
+        | with gmx trjconv, run on the login node with the modules from the host configuration.
+        | Original and reduced sizes are recorded in task_data['reductions']. Returns {original: result}
+
+        Args:
+            reduction (TrajectoryReduction): Reduction settings
+            files_only (list(str)) (Optional): (None) Only reduce files in list, all matching files if not set
+        """
+        self._open_ssh_session()
+        remote_files = self.get_remote_file_stats(refresh=True)
+        file_names = reduction.select_files(list(remote_files))
+        if files_only:
+            file_names = [file_name for file_name in file_names if file_name in files_only]
+        if not file_names:
+            print("No trajectory files to reduce")
+            return {}
+        modules = []
+        if reduction.module_set:
+            if reduction.module_set not in self.host_config.get('modules', {}):
+                sys.exit('Error: unknown module set ' + reduction.module_set)
+            modules = self.host_config['modules'][reduction.module_set]
+        script = reduction.get_script(
+            self._remote_wdir(), file_names, modules, reduction.get_structure(list(remote_files))
+        )
+        with self._span('reduce', host=self.ssh_data.host or '', files=len(file_names)) as span:
+            stdout, stderr = self.ssh_session.run_command(script)
+            results, failed = reduction.parse_output(stdout)
+            self.ssh_session.invalidate_metadata(self._remote_wdir())
+            span.set_attribute('bytes', sum(result['original_bytes'] for result in results.values()))
+            span.set_attribute('reduced_bytes', sum(result['reduced_bytes'] for result in results.values()))
+        if failed:
+            sys.exit('Error reducing {}: {}'.format(', '.join(failed), stderr))
+        for file_name, result in results.items():
+            print("reduced_file: {} ({} bytes) -> {} ({} bytes, {:.1f}x)".format(
+                file_name, result['original_bytes'], result['file'], result['reduced_bytes'],
+                result['original_bytes'] / max(result['reduced_bytes'], 1)
+            ))
+        self.task_data.setdefault('reductions', {}).update(results)
+        self.modified = True
+        return results
+
+    def get_output_manifest(self):
+        """
+        | Task.get_output_manifest
+        | Output manifest written at the end of the job (see submit), None if not available (job not finished,
+        | or submitted without output_manifest)
+        """
+        self._open_ssh_session()
+        with self._span('stat', host=self.ssh_data.host or '', source='manifest') as span:
+            stdout, stderr = self.ssh_session.run_command(
+                'cat {} 2>/dev/null'.format(opj(self._remote_wdir(), MANIFEST_FILE))
+            )
+            manifest = OutputManifest.parse(stdout)
+            span.set_attribute('files', len(manifest.files) if manifest else 0)
+        return manifest
+
+    def _get_queue_log_names(self):
+        """
+        | Private. Task._get_queue_log_names
+        | Names of the queue stdout and stderr files
+        """
+        return [
+            self.task_data.get('queue_settings', {}).get(key) for key in ('stdout', 'stderr')
+        ]
+
+    def get_lazy_output(self, cache=None):
+        """
+        | Task.get_lazy_output
+        | Output files as handles downloading contents on first access (see lazy_output.LazyOutputBundle),
+        | useful to read a few results without downloading the whole working dir
+
+        Args:
+            cache (OutputFileCache) (Optional): (None) Local cache for downloaded files, defaults to a shared one in ~/.biobb_remote/output_cache
+        """
+        return LazyOutputBundle(self, cache)
+
+    def _verify_output_files(self, manifest, file_names, local_data_path):
+        """
+        | Private. Task._verify_output_files
+        | Checks downloaded files against the output manifest, exits listing the files not matching.
+        | Queue log files are not checked, the queue may still write on them after the manifest
+        """
+        queue_logs = self._get_queue_log_names()
+        errors = []
+        with self._span('verify', files=len(file_names), checksum=manifest.checksum or ''):
+            for file_name in file_names:
+                if file_name in queue_logs or file_name not in manifest.files:
+                    continue
+                error = manifest.verify(file_name, opj(local_data_path, file_name))
+                if error:
+                    errors.append(error)
+        if errors:
+            sys.exit("Error: downloaded files do not match the output manifest\n" + '\n'.join(errors))
+
+    @metrics.instrument(metrics.TASK_STAGE, 'download')
     def get_output_data(
         self, 
         local_data_path='', 
         files_only=None, 
         overwrite=True, 
         new_only=True, 
-        verbose=False
+        verbose=False,
+        use_manifest=True,
+        reduction=None
         ):
         """
         | Task.get_output_data
@@ -820,6 +1687,8 @@ class Task():
             overwrite (bool) (Optional): (True) Overwrite local files if they exist
             new_only (bool) (Optional): (True) Overwrite only with newer files
             verbose (bool) (Optional): (False) Show file status
+            use_manifest (bool) (Optional): (True) Plan the download from the output manifest written by the job (see submit), and verify the files received. The remote dir is listed if no manifest is available
+            reduction (TrajectoryReduction) (Optional): (None) Reduce trajectories on the remote host first (see reduce_remote_files), reduced files are downloaded instead of the original ones (also when named in files_only). Files reduced with other settings are not downloaded
         """
 
         self._open_ssh_session()
@@ -838,13 +1707,36 @@ class Task():
 
         if not os.path.exists(local_data_path):
             os.mkdir(local_data_path)
-        if verbose:
-            print("Getting remote file stats")
-        if new_only:
-            remote_files = self.get_remote_file_stats()
+        reductions = {}
+        if reduction:
+            reductions = self.reduce_remote_files(reduction, files_only)
+
+        manifest = None
+        if use_manifest and self.task_data.get('output_manifest'):
+            manifest = self.get_output_manifest()
+        if manifest:
+            if verbose:
+                print("Using output manifest")
+            remote_files = manifest.files
         else:
-            remote_files = self.ssh_session.run_sftp('listdir', self._remote_wdir())
-        
+            if verbose:
+                print("Getting remote file stats")
+            remote_files = self.get_remote_file_stats()
+
+        if reduction:
+            # Reduced files from earlier reductions (other settings) are left out
+            remote_files = {
+                file_name: stats for file_name, stats in remote_files.items() if not reduction.is_reduced(file_name)
+            }
+            for file_name, result in reductions.items():
+                remote_files.pop(file_name, None)
+                remote_files[result['file']] = {'st_size': result['reduced_bytes'], 'st_mtime': result['mtime']}
+            if files_only:
+                files_only = [
+                    reductions[file_name]['file'] if file_name in reductions else file_name
+                    for file_name in files_only
+                ]
+
         if files_only:
             for file in files_only:
                 if file not in remote_files:
@@ -862,7 +1754,7 @@ class Task():
         local_file_names = os.listdir(local_data_path)
 
         for file in remote_file_list:
-            if file in local_file_names:
+            if file in local_file_names and new_only:
                 is_new = remote_files[file]['st_mtime'] > os.stat(opj(local_data_path, file)).st_mtime
             else:
                 is_new = True
@@ -871,20 +1763,32 @@ class Task():
                 print('{:20s} Exists: {}, New: {}'.format(file, file in local_file_names, is_new))
             
             if (file not in local_file_names) or (overwrite and (not new_only or is_new)):
-                output_data_bundle.add_file(file)
-                output_data_bundle.files[file]['stats'] = remote_files[file]
-
-        for file in output_data_bundle.files:
-            local_file_path = opj(local_data_path, file)
-            remote_file_path = opj(self._remote_wdir(), file)
-            self.ssh_session.run_sftp('get', remote_file_path, local_file_path)
-
-            print("getting_file: {} -> {}".format(remote_file_path, local_file_path))
+                output_data_bundle.add_file(file, remote_files[file])
+
+        with self._span('download', host=self.ssh_data.host or '') as download_span:
+            received_bytes = 0
+            for file in output_data_bundle.get_file_names():
+                local_file_path = opj(local_data_path, file)
+                remote_file_path = opj(self._remote_wdir(), file)
+                with self._span('download_file', file=file) as file_span:
+                    self.ssh_session.run_sftp('get', remote_file_path, local_file_path)
+                    if self.get_trace() is not None:
+                        file_size = os.path.getsize(local_file_path)
+                        file_span.set_attribute('bytes', file_size)
+                        received_bytes += file_size
+
+                print("getting_file: {} -> {}".format(remote_file_path, local_file_path))
+            download_span.set_attribute('files', output_data_bundle.get_num_files())
+            download_span.set_attribute('bytes', received_bytes)
+
+        if manifest:
+            self._verify_output_files(manifest, output_data_bundle.get_file_names(), local_data_path)
 
         self.task_data['output_data_bundle'] = output_data_bundle
         self.task_data['output_data_path'] = local_data_path
         self.modified = True
 
+    @metrics.instrument(metrics.TASK_STAGE, 'clean')
     def clean_remote(self):
         """
         | Task.clean_remote
@@ -895,7 +1799,14 @@ class Task():
         
         print("Removing remote data for task {}".format(self.id))
         
-        self.ssh_session.run_command('rm -rf ' + self._remote_wdir())
+        with self._span('clean', host=self.ssh_data.host or ''):
+            self.ssh_session.run_command('rm -rf ' + self._remote_wdir())
+            self.ssh_session.invalidate_metadata(self._remote_wdir())
+            if self.task_data.get('input_cache'):
+                RemoteInputCache(self.ssh_session, self.task_data['remote_base_path']).release(
+                    self.id, self.task_data['input_cache']
+                )
+                del self.task_data['input_cache']
         if 'output_data_path' in self.task_data:
             del self.task_data['output_data_path']
         if 'output_data_bundle' in self.task_data:
@@ -917,5 +1828,7 @@ class Task():
             return False
         if not self.ssh_data:
             sys.exit("No credentials available")
-        self.ssh_session = SSHSession(ssh_data=self.ssh_data, debug=self.debug)
+        with self._span('connect', host=self.ssh_data.host or '', port=getattr(self.ssh_data, 'port', 22)):
+            self.ssh_session = SSHSession(ssh_data=self.ssh_data, debug=self.debug)
         return False
+
@@ -0,0 +1,55 @@
+import os
+import json
+
+from biobb_remote.task import DataBundle
+
+
+class TestDataBundle():
+    def test_json_round_trip(self, tmp_path):
+        (tmp_path / 'a.txt').write_text('data')
+        (tmp_path / 'b.txt').write_text('more data')
+        bundle = DataBundle('bundle')
+        bundle.add_dir(str(tmp_path))
+        bundle.add_file('/remote/dir/c.txt', {'st_size': 3, 'st_mtime': 10.5, 'st_mode': 0o100644})
+        copy = DataBundle.from_json(bundle.to_json())
+        assert copy.id == 'bundle'
+        assert sorted(copy.get_file_names()) == ['a.txt', 'b.txt', 'c.txt']
+        assert copy.get_full_path('a.txt') == str(tmp_path / 'a.txt')
+        assert copy.get_full_path('c.txt') == '/remote/dir/c.txt'
+        assert copy.get_size('b.txt') == 9
+        assert copy.get_mtime('c.txt') == 10.5
+        assert copy.get_total_size() == 16
+        assert json.loads(copy.to_json()) == json.loads(bundle.to_json())
+
+    def test_remote_bundle_unknown_stats(self):
+        bundle = DataBundle('remote', remote=True)
+        bundle.add_file('/remote/dir/a.txt')
+        copy = DataBundle.from_json(json.loads(bundle.to_json()))
+        assert copy.remote
+        assert copy.get_size('a.txt') is None
+        assert copy.get_total_size() == 0
+
+    def test_from_legacy_json(self, tmp_path):
+        (tmp_path / 'a.txt').write_text('data')
+        legacy = {
+            'id': 'old',
+            'remote': False,
+            'files': {
+                'a.txt': {'full_path': str(tmp_path / 'a.txt'), 'stats': list(os.stat(str(tmp_path / 'a.txt')))},
+                'b.txt': {'full_path': '/remote/b.txt', 'stats': None}
+            }
+        }
+        bundle = DataBundle.from_json(json.dumps(legacy))
+        assert sorted(bundle.get_file_names()) == ['a.txt', 'b.txt']
+        assert bundle.get_size('a.txt') == 4
+        assert bundle.get_full_path('b.txt') == '/remote/b.txt'
+        assert bundle.get_size('b.txt') is None
+
+    def test_rows(self):
+        bundle = DataBundle('bundle', remote=True)
+        bundle.add_file('/dir/a.txt', {'st_size': 1, 'st_mtime': 1., 'st_mode': 0})
+        bundle.add_file('/other/b.txt', {'st_size': 2, 'st_mtime': 2., 'st_mode': 0})
+        copy = DataBundle('copy', remote=True)
+        copy.add_rows(bundle.get_rows(1))
+        assert list(copy.get_file_names()) == ['b.txt']
+        assert copy.get_full_path('b.txt') == '/other/b.txt'
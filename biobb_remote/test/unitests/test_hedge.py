@@ -0,0 +1,51 @@
+from biobb_remote.hedge import HedgedSubmission
+from biobb_remote.task import SUBMITTED, RUNNING, FINISHED
+
+
+class FakeTask():
+    def __init__(self, status, accounting):
+        self.status = status
+        self.accounting = accounting
+        self.cancelled = False
+        self.task_data = {'status': SUBMITTED, 'remote_job_id': '1'}
+        self.host_config = {'description': 'host'}
+
+    def set_local_data_bundle(self, local_data_path):
+        pass
+
+    def send_input_data(self, remote_base_path):
+        pass
+
+    def submit(self, **submit_args):
+        pass
+
+    def _check_job_status(self):
+        self.task_data['status'] = self.status
+        return self.status
+
+    def get_job_accounting(self):
+        return self.accounting
+
+    def cancel(self, remove_data=True):
+        self.cancelled = True
+
+
+class TestHedgedSubmission():
+    def test_failed_copy_does_not_win(self, tmp_path):
+        hedge = HedgedSubmission(str(tmp_path))
+        failed = hedge.add_target(FakeTask(FINISHED, {'state': 'FAILED'}), label='failed')
+        running = hedge.add_target(FakeTask(RUNNING, {}), label='running')
+        assert hedge.run(poll_time=0) is running
+        assert hedge.report['copies'][0]['failed'] == 'FAILED'
+        assert failed.cancelled
+
+    def test_completed_copy_wins(self, tmp_path):
+        hedge = HedgedSubmission(str(tmp_path))
+        completed = hedge.add_target(FakeTask(FINISHED, {'state': 'COMPLETED', 'wait': 5}), label='completed')
+        assert hedge.run(poll_time=0) is completed
+        assert hedge.report['time_to_start'] == 5
+
+    def test_all_failed(self, tmp_path):
+        hedge = HedgedSubmission(str(tmp_path))
+        hedge.add_target(FakeTask(FINISHED, {'state': 'NODE_FAIL'}), label='failed')
+        assert hedge.run(poll_time=0) is None
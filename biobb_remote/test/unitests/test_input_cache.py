@@ -0,0 +1,31 @@
+import os
+
+from biobb_remote.local import LocalSession
+from biobb_remote.input_cache import RemoteInputCache, _chunks
+
+
+class TestRemoteInputCache():
+    def test_chunks_by_size(self):
+        items = ['x' * 100] * 50
+        chunks = list(_chunks(items, 1010))
+        assert sum(len(chunk) for chunk in chunks) == 50
+        assert all(len(' '.join(chunk)) <= 1010 for chunk in chunks)
+        assert list(_chunks(['x' * 2000, 'y'], 1000)) == [['x' * 2000], ['y']]
+
+    def test_link_and_release(self, tmp_path):
+        cache = RemoteInputCache(LocalSession(), str(tmp_path))
+        cache.prepare()
+        wdir = tmp_path / 'task'
+        wdir.mkdir()
+        source = tmp_path / 'input.txt'
+        source.write_text('data')
+        cache.upload(str(source), 'abc', 'task')
+        assert cache.get_missing(['abc', 'def']) == {'abc', 'def'}
+        missing = cache.link_files(str(wdir), 'task', {'a.txt': 'abc', 'b.txt': 'abc', 'c.txt': 'def'}, {'abc'})
+        assert missing == {'def'}
+        assert (wdir / 'a.txt').read_text() == 'data'
+        assert not (wdir / 'c.txt').exists()
+        assert not os.path.exists(os.path.join(cache.refs_path, 'def'))
+        assert cache.get_usage() == {'blobs': 1, 'bytes': 4}
+        cache.release('task', ['abc'])
+        assert cache.get_usage() == {'blobs': 0, 'bytes': 0}
@@ -0,0 +1,92 @@
+import json
+
+from biobb_remote.task import Task, DataBundle, FINISHED
+from biobb_remote.local import LocalTask
+from biobb_remote.journal import TaskJournal
+
+
+def _new_task():
+    task = Task()
+    bundle = DataBundle('input', remote=True)
+    bundle.add_file('/data/a.txt', {'st_size': 1, 'st_mtime': 1., 'st_mode': 0})
+    task.task_data['local_data_bundle'] = bundle
+    task.task_data['status'] = 1
+    task.modified = True
+    return task
+
+
+class TestTaskJournal():
+    def test_round_trip(self, tmp_path):
+        path = str(tmp_path / 'task.journal')
+        task = _new_task()
+        task.save(path, 'journal')
+        task.task_data['status'] = 2
+        task.task_data['remote_job_id'] = '123'
+        task.task_data['local_data_bundle'].add_file('/data/b.txt', {'st_size': 2, 'st_mtime': 2., 'st_mode': 0})
+        task.modified = True
+        task.save(path, 'journal')
+        del task.task_data['remote_job_id']
+        task.modified = True
+        task.save(path, 'journal')
+        with open(path) as journal_file:
+            assert len(journal_file.readlines()) == 5
+        loaded = Task()
+        loaded.load_data_from_file(path, 'journal')
+        assert loaded.id == task.id
+        assert loaded.task_data['status'] == 2
+        assert 'remote_job_id' not in loaded.task_data
+        assert loaded.task_data['local_data_bundle'].get_size('b.txt') == 2
+        assert json.loads(loaded.task_data['local_data_bundle'].to_json()) == \
+            json.loads(task.task_data['local_data_bundle'].to_json())
+
+    def test_unchanged_task_appends_nothing(self, tmp_path):
+        path = str(tmp_path / 'task.journal')
+        task = _new_task()
+        journal = TaskJournal(path)
+        assert journal.write(task) == 1
+        assert journal.write(task) == 0
+
+    def test_truncated_last_line(self, tmp_path):
+        path = str(tmp_path / 'task.journal')
+        task = _new_task()
+        task.save(path, 'journal')
+        task.task_data['status'] = 2
+        task.modified = True
+        task.save(path, 'journal')
+        with open(path, 'a') as journal_file:
+            journal_file.write('{"op": "set", "key": "sta')
+        assert TaskJournal(path).replay()['status'] == 2
+
+    def test_compaction(self, tmp_path):
+        path = str(tmp_path / 'task.journal')
+        task = _new_task()
+        journal = TaskJournal(path, compact_every=3)
+        # Snapshot and 3 changes, then rewritten as a snapshot followed by 1 change
+        for status in range(6):
+            task.task_data['status'] = status
+            journal.write(task)
+        with open(path) as journal_file:
+            lines = journal_file.readlines()
+        assert len(lines) == 2
+        assert json.loads(lines[0])['op'] == 'snapshot'
+        assert TaskJournal(path).replay()['status'] == 5
+
+    def test_check_job_appends_to_journal(self, tmp_path):
+        path = str(tmp_path / 'task.journal')
+        task = LocalTask()
+        (tmp_path / 'in').mkdir()
+        (tmp_path / 'in' / 'a.txt').write_text('data')
+        task.set_local_data_bundle(str(tmp_path / 'in'))
+        task.send_input_data(str(tmp_path / 'remote'))
+        task.submit(local_run_script='#script\ntrue\n', save_file_path=path, save_mode='journal')
+        loaded = LocalTask()
+        loaded.load_data_from_file(path, 'journal')
+        loaded.scheduler = task.scheduler
+        loaded.ssh_session = task.ssh_session
+        # Path of the loaded journal, saved as journal without save_mode
+        loaded.check_job(save_file_path=path, poll_time=1)
+        with open(path) as journal_file:
+            lines = journal_file.readlines()
+        assert len(lines) > 1
+        assert all(json.loads(line)['op'] for line in lines)
+        assert TaskJournal(path).replay()['status'] == FINISHED
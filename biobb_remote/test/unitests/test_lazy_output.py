@@ -0,0 +1,64 @@
+import os
+import json
+
+from biobb_remote.local import LocalTask
+from biobb_remote.lazy_output import OutputFileCache
+
+
+def _put(cache, task_id, file_name, size, mtime=None):
+    local_path = cache.get_path(task_id, file_name)
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    with open(local_path, 'wb') as data_file:
+        data_file.write(b'x' * size)
+    return cache.add(task_id, file_name, mtime)
+
+
+class TestOutputFileCache():
+    def test_lru_order_is_saved(self, tmp_path):
+        cache = OutputFileCache(str(tmp_path), max_bytes=30)
+        _put(cache, 'task', 'a', 10)
+        _put(cache, 'task', 'b', 10)
+        _put(cache, 'task', 'c', 10)
+        assert cache.lookup('task', 'a')
+        # Hits are saved on close, not on every access
+        with open(os.path.join(str(tmp_path), '.index.json')) as index_file:
+            assert json.load(index_file)[0] == ['task', 'a']
+        cache.close()
+        # Order survives a new session, whatever the file access times
+        cache = OutputFileCache(str(tmp_path), max_bytes=30)
+        assert list(cache.entries) == [('task', 'b'), ('task', 'c'), ('task', 'a')]
+        _put(cache, 'task', 'd', 10)
+        assert ('task', 'b') not in cache.entries
+        assert not os.path.exists(cache.get_path('task', 'b'))
+
+    def test_oversized_file_kept_until_next_download(self, tmp_path):
+        cache = OutputFileCache(str(tmp_path), max_bytes=30)
+        _put(cache, 'task', 'a', 10)
+        big_path = _put(cache, 'task', 'big', 50)
+        assert os.path.exists(big_path)
+        assert list(cache.entries) == [('task', 'big')]
+        _put(cache, 'task', 'b', 10)
+        assert not os.path.exists(big_path)
+        assert cache.get_usage()['bytes'] == 10
+
+    def test_lookup_checks_mtime(self, tmp_path):
+        cache = OutputFileCache(str(tmp_path), max_bytes=30)
+        _put(cache, 'task', 'a', 10, mtime=1000)
+        assert cache.lookup('task', 'a', 10, 1000.5)
+        assert cache.lookup('task', 'a', 10, 2000) is None
+        assert cache.get_usage()['files'] == 0
+
+
+class TestLazyOutputBundle():
+    def test_is_cached_checks_mtime(self, tmp_path):
+        (tmp_path / 'in').mkdir()
+        (tmp_path / 'in' / 'out.txt').write_text('data')
+        task = LocalTask()
+        task.set_local_data_bundle(str(tmp_path / 'in'))
+        task.send_input_data(str(tmp_path / 'remote'))
+        outputs = task.get_lazy_output(OutputFileCache(str(tmp_path / 'cache')))
+        assert not outputs['out.txt'].is_cached()
+        assert outputs['out.txt'].read_text() == 'data'
+        assert outputs['out.txt'].is_cached()
+        outputs['out.txt'].stats['st_mtime'] += 100
+        assert not outputs['out.txt'].is_cached()
@@ -0,0 +1,39 @@
+import os
+import time
+
+from biobb_remote.local import LocalScheduler, TIMEOUT, COMPLETED
+
+
+class TestLocalScheduler():
+    def test_unique_job_ids(self, tmp_path):
+        script = tmp_path / 'job.sh'
+        script.write_text('true\n')
+        first = LocalScheduler(cores=[0])
+        second = LocalScheduler(cores=[0])
+        job_id = first.submit(str(script), {'working_dir': str(tmp_path)})
+        assert '-{}-'.format(os.getpid()) in job_id
+        assert job_id != second.submit(str(script), {'working_dir': str(tmp_path)})
+        assert first.wait(job_id, 10)
+        assert first.get_job(job_id).state == COMPLETED
+
+    def test_timeout_kills_job_ignoring_sigterm(self, tmp_path):
+        script = tmp_path / 'job.sh'
+        script.write_text("trap '' TERM\nsleep 30\n")
+        scheduler = LocalScheduler(cores=[0], kill_grace=0.5)
+        start = time.time()
+        job_id = scheduler.submit(str(script), {'working_dir': str(tmp_path), 'time': '00:00:01'})
+        assert scheduler.wait(job_id, 10)
+        assert scheduler.get_job(job_id).state == TIMEOUT
+        assert time.time() - start < 10
+
+    def test_kill_timer_cancelled_when_job_ends(self, tmp_path):
+        script = tmp_path / 'job.sh'
+        script.write_text('sleep 30\n')
+        scheduler = LocalScheduler(cores=[0], kill_grace=30)
+        job_id = scheduler.submit(str(script), {'working_dir': str(tmp_path)})
+        while scheduler.get_job(job_id).process is None:
+            time.sleep(0.05)
+        scheduler.cancel(job_id)
+        assert scheduler.wait(job_id, 10)
+        job = scheduler.get_job(job_id)
+        assert job.kill_timer.finished.is_set()
@@ -0,0 +1,44 @@
+import stat
+import hashlib
+import subprocess
+
+from biobb_remote.output_manifest import OutputManifest, MANIFEST_FILE, get_epilogue_lines
+
+
+class TestOutputManifest():
+    def test_parse(self):
+        text = '#biobb_manifest 1 md5\n12\t1700000000.5\t644\tabc\tmd.log\n3\t1700000001\t755\tdef\tname\twith tab\n#end\n'
+        manifest = OutputManifest.parse(text)
+        assert manifest.checksum == 'md5'
+        assert manifest.files['md.log'] == {
+            'st_size': 12, 'st_mtime': 1700000000.5, 'st_mode': stat.S_IFREG | 0o644, 'checksum': 'abc'
+        }
+        assert 'name\twith tab' in manifest.files
+
+    def test_parse_incomplete(self):
+        assert OutputManifest.parse('') is None
+        assert OutputManifest.parse('#biobb_manifest 1 -\n12\t1\t644\t-\tmd.log\n') is None
+        assert OutputManifest.parse('#biobb_manifest 1 -\nbad line\n#end') is None
+        manifest = OutputManifest.parse('#biobb_manifest 1 -\n12\t1\t644\t-\tmd.log\n#end')
+        assert manifest.checksum is None
+        assert manifest.files['md.log']['checksum'] is None
+
+    def test_verify(self, tmp_path):
+        data_path = tmp_path / 'md.log'
+        data_path.write_bytes(b'0123456789')
+        manifest = OutputManifest('sha1', {
+            'md.log': {'st_size': 10, 'checksum': hashlib.sha1(b'0123456789').hexdigest()}
+        })
+        assert manifest.verify('md.log', str(data_path)) == ''
+        manifest.files['md.log']['checksum'] = '0' * 40
+        assert 'checksum' in manifest.verify('md.log', str(data_path))
+        manifest.files['md.log']['st_size'] = 11
+        assert 'size 10, expected 11' in manifest.verify('md.log', str(data_path))
+
+    def test_epilogue_round_trip(self, tmp_path):
+        (tmp_path / 'out.txt').write_text('data')
+        script = '\n'.join(get_epilogue_lines(str(tmp_path), 'md5') + ['biobb_write_manifest'])
+        subprocess.run(['bash', '-c', script], check=True)
+        manifest = OutputManifest.parse((tmp_path / MANIFEST_FILE).read_text())
+        assert list(manifest.files) == ['out.txt']
+        assert manifest.verify('out.txt', str(tmp_path / 'out.txt')) == ''
@@ -0,0 +1,56 @@
+from biobb_remote.queue_info import (
+    QueueSnapshot, split_sections, parse_sinfo, parse_qos_limits, parse_queue_limits, SECTION_MARK
+)
+
+BSC_QUEUES = '''
+QUEUE          Max Wall Time   Max Running Jobs   Max Submitted Jobs   Max Cores
+-------------------------------------------------------------------------------
+debug          02:00:00        1                  1                    768
+bsc_ls         48:00:00        100                366                  2400
+'''
+
+
+class TestQueueInfo():
+    def test_split_sections(self):
+        output = '{0} sinfo\na|up|1/2/0/3\n{0} qos\nnormal|1-00:00:00|10|20|cpu=100\n'.format(SECTION_MARK)
+        sections = split_sections(output)
+        assert sections['sinfo'][0] == 'a|up|1/2/0/3'
+        assert sections['qos'][0].startswith('normal')
+
+    def test_parse_sinfo(self):
+        snapshot = QueueSnapshot('host')
+        parse_sinfo(snapshot, ['main*|up|10/5/1/16', 'gpu|down|0/0/4/4', 'bad line'])
+        assert snapshot.partitions['main']['idle_nodes'] == 5
+        assert not snapshot.partitions['gpu']['available']
+        assert snapshot.get_load('main') == 10 / 15.
+
+    def test_parse_sinfo_gres(self):
+        snapshot = QueueSnapshot('host')
+        parse_sinfo(snapshot, ['main*|up|10/5/1/16|(null)', 'acc|up|2/3/0/5|gpu:v100:4(S:0-1)'])
+        assert not snapshot.partitions['main']['gpu']
+        assert snapshot.partitions['acc']['gpu']
+        assert snapshot.get_idle_gpu_nodes() == 3
+        snapshot = QueueSnapshot('host')
+        parse_sinfo(snapshot, ['main*|up|10/5/1/16'])
+        assert snapshot.get_idle_gpu_nodes() is None
+
+    def test_parse_qos_limits(self):
+        snapshot = QueueSnapshot('host')
+        parse_qos_limits(snapshot, ['normal|2-00:00:00|50|||', 'debug|02:00:00||1|cpu=48'])
+        assert snapshot.user_limits['debug']['max_submit'] == 1
+        assert snapshot.user_limits['debug']['max_jobs'] is None
+
+    def test_parse_queue_limits(self):
+        snapshot = QueueSnapshot('host')
+        parse_queue_limits(snapshot, BSC_QUEUES.split('\n'))
+        assert snapshot.queue_limits['debug'] == {
+            'max_wall': '02:00:00', 'max_jobs': 1, 'max_submit': 1, 'max_cores': 768
+        }
+        assert snapshot.queue_limits['bsc_ls']['max_submit'] == 366
+        assert 'queue_limits' in snapshot.to_dict()
+
+    def test_parse_queue_limits_unknown_output(self):
+        snapshot = QueueSnapshot('host')
+        parse_queue_limits(snapshot, ['command not found'])
+        assert snapshot.queue_limits == {}
+        assert snapshot.raw_queues == 'command not found'
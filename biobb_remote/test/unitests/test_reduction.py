@@ -0,0 +1,85 @@
+import os
+import stat
+import subprocess
+
+from biobb_remote.local import LocalTask
+from biobb_remote.reduction import TrajectoryReduction
+
+# Stand-in for gmx trjconv: copies -f to -o, counting calls
+FAKE_GMX = '''#!/bin/bash
+while [ $# -gt 0 ]; do
+    case "$1" in
+        -f) src="$2"; shift;;
+        -o) out="$2"; shift;;
+    esac
+    shift
+done
+echo "$src" >> calls.txt
+head -c 4 "$src" > "$out"
+'''
+
+
+def _fake_gmx(tmp_path):
+    gmx = tmp_path / 'gmx'
+    gmx.write_text(FAKE_GMX)
+    gmx.chmod(gmx.stat().st_mode | stat.S_IXUSR)
+    return str(gmx)
+
+
+class TestTrajectoryReduction():
+    def test_output_name_has_settings(self):
+        assert TrajectoryReduction().get_output_name('md.xtc') == 'md_reduced.xtc'
+        reduction = TrajectoryReduction(stride=10, group='Protein & r 1-10', output_format='.pdb')
+        assert reduction.get_output_name('md.xtc') == 'md_reduced_s10_Protein-r-1-10.pdb'
+        assert TrajectoryReduction(stride=5).select_files(
+            ['md.xtc', 'md_reduced.xtc', 'md_reduced_s10.xtc', 'md.tpr']
+        ) == ['md.xtc']
+
+    def test_parse_output(self):
+        reduction = TrajectoryReduction(stride=2)
+        results, failed = reduction.parse_output(
+            'BIOBB_REDUCED 1000 100 1700000000 md run.xtc\n'
+            'BIOBB_REDUCE_FAILED other.xtc\n'
+            'BIOBB_REDUCED 2000 200 1700000001 b.trr\n'
+        )
+        assert results['md run.xtc'] == {
+            'file': 'md run_reduced_s2.xtc', 'original_bytes': 1000, 'reduced_bytes': 100, 'mtime': 1700000000.
+        }
+        assert results['b.trr']['reduced_bytes'] == 200
+        assert failed == ['other.xtc']
+
+    def test_script_rebuilds_on_new_settings(self, tmp_path):
+        gmx = _fake_gmx(tmp_path)
+        (tmp_path / 'md.xtc').write_bytes(b'0123456789')
+
+        def run(reduction):
+            script = reduction.get_script(str(tmp_path), ['md.xtc'], [])
+            stdout = subprocess.run(['bash', '-c', script], stdout=subprocess.PIPE, check=True).stdout.decode()
+            return reduction.parse_output(stdout)
+
+        results, failed = run(TrajectoryReduction(stride=2, gmx=gmx))
+        assert not failed
+        assert results['md.xtc']['original_bytes'] == 10
+        assert results['md.xtc']['reduced_bytes'] == 4
+        run(TrajectoryReduction(stride=2, gmx=gmx))
+        run(TrajectoryReduction(stride=5, gmx=gmx))
+        assert (tmp_path / 'calls.txt').read_text().split() == ['md.xtc', 'md.xtc']
+        assert os.path.exists(str(tmp_path / 'md_reduced_s5.xtc'))
+
+    def test_get_output_data_files_only(self, tmp_path):
+        gmx = _fake_gmx(tmp_path)
+        (tmp_path / 'in').mkdir()
+        for file_name in ('md.xtc', 'other.xtc', 'md_reduced_s5.xtc', 'md.log'):
+            (tmp_path / 'in' / file_name).write_bytes(b'0123456789')
+        task = LocalTask()
+        task.set_local_data_bundle(str(tmp_path / 'in'))
+        task.send_input_data(str(tmp_path / 'remote'))
+        reduction = TrajectoryReduction(stride=2, gmx=gmx, module_set=None)
+        task.get_output_data(str(tmp_path / 'out'), files_only=['md.xtc', 'md.log'], reduction=reduction)
+        assert sorted(os.listdir(str(tmp_path / 'out'))) == ['md.log', 'md_reduced_s2.xtc']
+        assert list(task.task_data['reductions']) == ['md.xtc']
+        task.get_output_data(str(tmp_path / 'all'), reduction=reduction)
+        assert (tmp_path / 'all' / 'calls.txt').read_text().split() == ['md.xtc', 'other.xtc']
+        assert sorted(os.listdir(str(tmp_path / 'all'))) == [
+            'calls.txt', 'md.log', 'md_reduced_s2.xtc', 'other_reduced_s2.xtc'
+        ]
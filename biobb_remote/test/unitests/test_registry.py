@@ -0,0 +1,52 @@
+from biobb_remote.task import Task, SUBMITTED, RUNNING, FINISHED
+from biobb_remote.registry import TaskRegistry
+
+
+def _new_task(job_id, status):
+    task = Task(host='login.example.org')
+    task.task_data['remote_job_id'] = job_id
+    task.task_data['status'] = status
+    return task
+
+
+class TestTaskRegistry():
+    def test_save_and_load(self, tmp_path):
+        registry = TaskRegistry(str(tmp_path / 'tasks.db'))
+        task = _new_task('101', SUBMITTED)
+        task.task_data['queue_settings'] = {'ntasks': 4}
+        registry.save_task(task, campaign='test')
+        loaded = registry.load_task(task.id)
+        assert type(loaded) is Task
+        assert loaded.id == task.id
+        assert loaded.task_data['queue_settings'] == {'ntasks': 4}
+        assert registry.load_task('unknown') is None
+        # Campaign is kept when saving again without one
+        registry.save_task(loaded)
+        assert registry.find(job_id='101')[0]['campaign'] == 'test'
+        registry.close()
+
+    def test_find_and_update_status(self, tmp_path):
+        registry = TaskRegistry(str(tmp_path / 'tasks.db'))
+        tasks = [_new_task(str(num), SUBMITTED) for num in range(3)]
+        registry.save_tasks(tasks, campaign='test')
+        assert len(registry.find(status=SUBMITTED, host='login.example.org')) == 3
+        assert registry.update_status({tasks[0].id: RUNNING, tasks[1].id: FINISHED}) == 2
+        assert {row['id'] for row in registry.find(status=[RUNNING, FINISHED])} == {tasks[0].id, tasks[1].id}
+        assert registry.load_task(tasks[1].id).task_data['status'] == FINISHED
+        assert registry.count_by_status(campaign='test') == {'Submitted': 1, 'Running': 1, 'Finished': 1}
+        registry.delete_task(tasks[2].id)
+        assert len(registry.load_tasks(campaign='test')) == 2
+        registry.close()
+
+    def test_import_export(self, tmp_path):
+        task = _new_task('7', FINISHED)
+        task.modified = True
+        task.save(str(tmp_path / 'task.json'))
+        registry = TaskRegistry(str(tmp_path / 'tasks.db'))
+        registry.import_file(str(tmp_path / 'task.json'), campaign='imported')
+        registry.export_file(task.id, str(tmp_path / 'copy.json'))
+        copy = Task()
+        copy.load_data_from_file(str(tmp_path / 'copy.json'))
+        assert copy.id == task.id
+        assert copy.task_data['remote_job_id'] == '7'
+        registry.close()
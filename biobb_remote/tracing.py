@@ -0,0 +1,375 @@
+""" Module to trace the lifecycle of tasks as timed spans """
+
+import os
+import sys
+import json
+import time
+import uuid
+import threading
+
+TRACE_ENV_VAR = 'BIOBB_REMOTE_TRACING'
+CHROME = 'chrome'
+OTLP = 'otlp'
+TRACE_FORMATS = [CHROME, OTLP]
+ACCOUNTING_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+SERVICE_NAME = 'biobb_remote'
+
+_ENABLED = bool(os.environ.get(TRACE_ENV_VAR))
+
+
+class _NullSpan():
+    """
+    | Private. tracing._NullSpan
+    | Span doing nothing, used when the task is not traced
+    """
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def set_attribute(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _ActiveSpan():
+    """
+    | Private. tracing._ActiveSpan
+    | Context manager recording a span in a TaskTrace
+    """
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.data = {
+            'name': name,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': None,
+            'start': None,
+            'end': None,
+            'thread': threading.get_ident(),
+            'attributes': attributes
+        }
+
+    def __enter__(self):
+        stack = self.trace._get_stack()
+        if stack:
+            self.data['parent_id'] = stack[-1]['span_id']
+        stack.append(self.data)
+        self.data['start'] = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.data['end'] = time.time()
+        if exc_type is not None:
+            self.data['attributes']['error'] = exc_type.__name__
+            if exc_value is not None and str(exc_value):
+                self.data['attributes']['error_message'] = str(exc_value)
+        self.trace._get_stack().pop()
+        self.trace._append(self.data)
+        return False
+
+    def set_attribute(self, key, value):
+        """ Adds an attribute to the span """
+        self.data['attributes'][key] = value
+
+
+class TaskTrace():
+    """
+    | biobb_remote tracing.TaskTrace
+    | Spans recorded along the lifecycle of a single task (connect, stat, upload, script creation,
+    | submit, queue wait, run, download, clean). Stored in task_data, so it follows saved tasks.
+
+    Args:
+        task_id (str): Task id
+        trace_id (str) (Optional): (None) Trace id, a new one is created if not set
+    """
+    def __init__(self, task_id, trace_id=None):
+        self.task_id = task_id
+        self.trace_id = trace_id or uuid.uuid4().hex
+        self.spans = []
+        self.marks = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['lock']
+        del state['local']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def _get_stack(self):
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        return self.local.stack
+
+    def _append(self, span_data):
+        with self.lock:
+            self.spans.append(span_data)
+
+    def span(self, name, **attributes):
+        """
+        | TaskTrace.span
+        | Context manager timing a span, nested spans get the enclosing one as parent
+
+        Args:
+            name (str): Span name
+            attributes: Span attributes (bytes, job_id, host, ...)
+        """
+        return _ActiveSpan(self, name, attributes)
+
+    def add_span(self, name, start, end, **attributes):
+        """
+        | TaskTrace.add_span
+        | Adds an already finished span (e.g. queue wait, from accounting data)
+
+        Args:
+            name (str): Span name
+            start (float): Start time (epoch seconds)
+            end (float): End time (epoch seconds)
+            attributes: Span attributes
+        """
+        self._append({
+            'name': name,
+            'span_id': uuid.uuid4().hex[:16],
+            'parent_id': None,
+            'start': start,
+            'end': end,
+            'thread': 0,
+            'attributes': attributes
+        })
+
+    def mark(self, event, timestamp=None):
+        """
+        | TaskTrace.mark
+        | Records the first time an event (e.g. a job status) was seen
+
+        Args:
+            event (str): Event name
+            timestamp (float) (Optional): (None) Event time, defaults to now
+        """
+        if event not in self.marks:
+            self.marks[event] = timestamp or time.time()
+
+    def get_total_times(self):
+        """
+        | TaskTrace.get_total_times
+        | Total seconds per span name, for a quick breakdown
+        """
+        totals = {}
+        for span_data in self.spans:
+            totals[span_data['name']] = totals.get(span_data['name'], 0.) + span_data['end'] - span_data['start']
+        return totals
+
+    def to_json(self):
+        """
+        | TaskTrace.to_json
+        | Trace as a json-serializable dict
+        """
+        with self.lock:
+            return {
+                'task_id': self.task_id,
+                'trace_id': self.trace_id,
+                'spans': list(self.spans),
+                'marks': dict(self.marks)
+            }
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        | TaskTrace.from_json
+        | Rebuilds a trace from to_json output
+
+        Args:
+            data (dict): Trace data
+        """
+        trace = cls(data['task_id'], data['trace_id'])
+        trace.spans = data.get('spans', [])
+        trace.marks = data.get('marks', {})
+        return trace
+
+    def to_chrome_trace(self, pid=1):
+        """
+        | TaskTrace.to_chrome_trace
+        | Trace in Chrome trace event format (chrome://tracing, Perfetto)
+
+        Args:
+            pid (int) (Optional): (1) Process id shown for the task, to tell tasks apart in merged traces
+        """
+        threads = {}
+        events = [{
+            'name': 'process_name',
+            'ph': 'M',
+            'pid': pid,
+            'args': {'name': 'task ' + self.task_id}
+        }]
+        for span_data in sorted(self.spans, key=lambda item: item['start']):
+            tid = threads.setdefault(span_data['thread'], len(threads))
+            args = dict(span_data['attributes'])
+            args['span_id'] = span_data['span_id']
+            if span_data['parent_id']:
+                args['parent_id'] = span_data['parent_id']
+            events.append({
+                'name': span_data['name'],
+                'cat': 'biobb_remote',
+                'ph': 'X',
+                'ts': span_data['start'] * 1e6,
+                'dur': (span_data['end'] - span_data['start']) * 1e6,
+                'pid': pid,
+                'tid': tid,
+                'args': args
+            })
+        return {'traceEvents': events, 'displayTimeUnit': 'ms', 'otherData': {'trace_id': self.trace_id}}
+
+    def to_otlp(self):
+        """
+        | TaskTrace.to_otlp
+        | Trace in OpenTelemetry OTLP/JSON format (ExportTraceServiceRequest)
+        """
+        spans = []
+        for span_data in self.spans:
+            otlp_span = {
+                'traceId': self.trace_id,
+                'spanId': span_data['span_id'],
+                'name': span_data['name'],
+                'kind': 1,
+                'startTimeUnixNano': str(int(span_data['start'] * 1e9)),
+                'endTimeUnixNano': str(int(span_data['end'] * 1e9)),
+                'attributes': _otlp_attributes(span_data['attributes']),
+                'status': {'code': 2 if 'error' in span_data['attributes'] else 1}
+            }
+            if span_data['parent_id']:
+                otlp_span['parentSpanId'] = span_data['parent_id']
+            spans.append(otlp_span)
+        return {
+            'resourceSpans': [{
+                'resource': {
+                    'attributes': _otlp_attributes({'service.name': SERVICE_NAME, 'biobb.task_id': self.task_id})
+                },
+                'scopeSpans': [{'scope': {'name': SERVICE_NAME}, 'spans': spans}]
+            }]
+        }
+
+    def save(self, output_path, trace_format=CHROME):
+        """
+        | TaskTrace.save
+        | Saves the trace as json file
+
+        Args:
+            output_path (str): Path to file
+            trace_format (str) (Optional): (chrome) Format, chrome | otlp
+        """
+        if trace_format == CHROME:
+            data = self.to_chrome_trace()
+        elif trace_format == OTLP:
+            data = self.to_otlp()
+        else:
+            sys.exit("ERROR: trace format ({}) not supported".format(trace_format))
+        with open(output_path, 'w') as output_file:
+            json.dump(data, output_file, indent=1)
+
+
+def enable():
+    """
+    | tracing.enable
+    | Traces all tasks created from now on. Also enabled at import when BIOBB_REMOTE_TRACING is set
+    """
+    global _ENABLED
+    _ENABLED = True
+
+
+def disable():
+    """
+    | tracing.disable
+    | Stops tracing new tasks, already traced ones keep their traces
+    """
+    global _ENABLED
+    _ENABLED = False
+
+
+def is_enabled():
+    """
+    | tracing.is_enabled
+    | Whether new tasks are traced
+    """
+    return _ENABLED
+
+
+def span(trace, name, **attributes):
+    """
+    | tracing.span
+    | Span context manager on trace, does nothing if trace is None
+
+    Args:
+        trace (TaskTrace): Task trace or None
+        name (str): Span name
+        attributes: Span attributes
+    """
+    if trace is None:
+        return _NULL_SPAN
+    return trace.span(name, **attributes)
+
+
+def save_traces(traces, output_path, trace_format=CHROME):
+    """
+    | tracing.save_traces
+    | Saves several task traces in a single file (e.g. a whole pipeline)
+
+    Args:
+        traces (list(TaskTrace)): Traces
+        output_path (str): Path to file
+        trace_format (str) (Optional): (chrome) Format, chrome | otlp
+    """
+    if trace_format == CHROME:
+        data = {'traceEvents': [], 'displayTimeUnit': 'ms'}
+        for pid, trace in enumerate(traces, 1):
+            data['traceEvents'] += trace.to_chrome_trace(pid)['traceEvents']
+    elif trace_format == OTLP:
+        data = {'resourceSpans': []}
+        for trace in traces:
+            data['resourceSpans'] += trace.to_otlp()['resourceSpans']
+    else:
+        sys.exit("ERROR: trace format ({}) not supported".format(trace_format))
+    with open(output_path, 'w') as output_file:
+        json.dump(data, output_file, indent=1)
+
+
+def parse_accounting_time(value):
+    """
+    | tracing.parse_accounting_time
+    | Epoch seconds from an accounting time string (local time of the host), None if not available
+
+    Args:
+        value (str | float): Time string (YYYY-MM-DDTHH:MM:SS) or epoch seconds
+    """
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return time.mktime(time.strptime(value, ACCOUNTING_TIME_FORMAT))
+    except (TypeError, ValueError):
+        return None
+
+
+def _otlp_attributes(attributes):
+    """
+    | Private. tracing._otlp_attributes
+    | Attribute dict as OTLP key/value list
+    """
+    values = []
+    for key, value in attributes.items():
+        if isinstance(value, bool):
+            otlp_value = {'boolValue': value}
+        elif isinstance(value, int):
+            otlp_value = {'intValue': str(value)}
+        elif isinstance(value, float):
+            otlp_value = {'doubleValue': value}
+        else:
+            otlp_value = {'stringValue': str(value)}
+        values.append({'key': key, 'value': otlp_value})
+    return values
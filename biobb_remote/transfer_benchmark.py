@@ -0,0 +1,327 @@
+""" Module to benchmark data transfers against a local SSH/SFTP server with emulated latency and bandwidth """
+
+import os
+import sys
+import json
+import time
+import shutil
+import getpass
+import platform
+import resource
+import tempfile
+import contextlib
+import threading
+import multiprocessing
+from io import StringIO
+
+from os.path import join as opj
+
+import paramiko
+from paramiko import RSAKey
+
+from biobb_remote.task import Task
+from biobb_remote.ssh_credentials import SSHCredentials
+from biobb_remote.fake_server import FakeSSHServer, LatencyProxy, LOCAL_ADDRESS
+
+UPLOAD = 'upload'
+UPLOAD_PARALLEL = 'upload_parallel'
+DOWNLOAD = 'download'
+DOWNLOAD_ALL = 'download_all'
+# Transfer strategies available in the library
+STRATEGIES = {
+    UPLOAD: 'Task.send_input_data (remote stats, then one put per new file)',
+    UPLOAD_PARALLEL: 'Files split among parallel tasks with their own connections (as TaskPipeline upload workers)',
+    DOWNLOAD: 'Task.get_output_data, new_only (remote stats, then one get per file)',
+    DOWNLOAD_ALL: 'Task.get_output_data, new_only=False (remote listing, then one get per file)'
+}
+
+
+def _serve(conn, latency, bandwidth):
+    """
+    | Private. transfer_benchmark._serve
+    | Runs the SSH server and proxy in a child process, so client CPU use is measured alone
+    """
+    with FakeSSHServer() as server, LatencyProxy(server.port, latency, bandwidth) as proxy:
+        private = StringIO()
+        server.authorized_key.write_private_key(private)
+        conn.send((proxy.port, private.getvalue()))
+        conn.recv()
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        conn.send(usage.ru_utime + usage.ru_stime)
+
+
+class _ServerProcess():
+    """
+    | Private. transfer_benchmark._ServerProcess
+    | SSH server behind a latency/bandwidth proxy, running in a child process
+    """
+    def __init__(self, latency=0., bandwidth=0.):
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_serve, args=(child_conn, latency, bandwidth), daemon=True)
+        self.process.start()
+        port, private_key = self.conn.recv()
+        self.credentials = SSHCredentials(
+            host=LOCAL_ADDRESS, userid=getpass.getuser(), look_for_keys=False, port=port
+        )
+        self.credentials.key = RSAKey.from_private_key(StringIO(private_key))
+
+    def stop(self):
+        """ Stops the server, returns its CPU time """
+        self.conn.send('stop')
+        cpu_time = self.conn.recv()
+        self.process.join(5)
+        return cpu_time
+
+
+class TransferBenchmark():
+    """
+    | biobb_remote transfer_benchmark.TransferBenchmark
+    | Measures wall time, MB/s, per-file overhead and CPU use of the library transfer strategies
+    | for several file counts, file sizes, link latencies and bandwidths.
+    | The server runs on localhost in a child process, behind a proxy emulating the link.
+
+    Args:
+        file_counts (list(int)) (Optional): ([1, 10, 100]) Number of files per transfer
+        file_sizes (list(int)) (Optional): ([1024, 1048576]) File sizes (bytes)
+        latencies (list(float)) (Optional): ([0., 0.01]) One-way link latencies (seconds)
+        bandwidths (list(float)) (Optional): ([0.]) Link bandwidths (bytes/s), 0 for no limit
+        strategies (list(str)) (Optional): (None) Strategies to run, defaults to all (see STRATEGIES)
+        parallel_workers (int) (Optional): (4) Parallel tasks for upload_parallel
+        work_dir (str) (Optional): (None) Directory for test data, a temporary one is used if not set
+    """
+    def __init__(
+            self,
+            file_counts=None,
+            file_sizes=None,
+            latencies=None,
+            bandwidths=None,
+            strategies=None,
+            parallel_workers=4,
+            work_dir=None
+            ):
+        self.file_counts = file_counts or [1, 10, 100]
+        self.file_sizes = file_sizes or [1024, 1048576]
+        self.latencies = latencies if latencies is not None else [0., 0.01]
+        self.bandwidths = bandwidths or [0.]
+        self.strategies = strategies or list(STRATEGIES)
+        for strategy in self.strategies:
+            if strategy not in STRATEGIES:
+                sys.exit('Error: unknown transfer strategy ' + strategy)
+        self.parallel_workers = parallel_workers
+        self.work_dir = work_dir
+        self.results = []
+
+    def run(self, verbose=True):
+        """
+        | TransferBenchmark.run
+        | Runs all combinations, returns the list of results
+
+        Args:
+            verbose (bool) (Optional): (True) Print each result
+        """
+        tmp_dir = None
+        work_dir = self.work_dir
+        if not work_dir:
+            work_dir = tmp_dir = tempfile.mkdtemp(prefix='biobb_transfer_')
+        self.results = []
+        try:
+            for latency in self.latencies:
+                for bandwidth in self.bandwidths:
+                    server = _ServerProcess(latency, bandwidth)
+                    try:
+                        for num_files in self.file_counts:
+                            for file_size in self.file_sizes:
+                                run_dir = opj(work_dir, 'run')
+                                data_dir = self._make_data(opj(run_dir, 'data'), num_files, file_size)
+                                for strategy in self.strategies:
+                                    result = self._run_strategy(
+                                        strategy, server.credentials, data_dir, run_dir
+                                    )
+                                    result.update({
+                                        'latency': latency,
+                                        'bandwidth': bandwidth,
+                                        'files': num_files,
+                                        'file_size': file_size
+                                    })
+                                    self.results.append(result)
+                                    if verbose:
+                                        _print_result(result)
+                                shutil.rmtree(run_dir, ignore_errors=True)
+                    finally:
+                        server_cpu = server.stop()
+                        if verbose:
+                            print("Server CPU time: {:.2f}s".format(server_cpu))
+        finally:
+            if tmp_dir:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        return self.results
+
+    def _make_data(self, data_dir, num_files, file_size):
+        """
+        | Private. TransferBenchmark._make_data
+        | Creates num_files random files of file_size bytes
+        """
+        os.makedirs(data_dir)
+        for i in range(num_files):
+            with open(opj(data_dir, 'file_{:06d}.dat'.format(i)), 'wb') as data_file:
+                data_file.write(os.urandom(file_size))
+        return data_dir
+
+    def _new_task(self, credentials):
+        """
+        | Private. TransferBenchmark._new_task
+        | Task connecting to the benchmark server
+        """
+        task = Task(look_for_keys=False)
+        task.ssh_data = credentials
+        return task
+
+    def _run_strategy(self, strategy, credentials, data_dir, run_dir):
+        """
+        | Private. TransferBenchmark._run_strategy
+        | Runs one transfer, measuring wall and client CPU time. Connection set-up is not included
+        """
+        remote_base = opj(run_dir, 'remote_' + strategy)
+        os.makedirs(remote_base)
+        task = self._new_task(credentials)
+        task._open_ssh_session()
+        task.set_local_data_bundle(data_dir)
+        if strategy in (DOWNLOAD, DOWNLOAD_ALL):
+            # Remote files prepared outside the measure
+            _quiet(task.send_input_data, remote_base)
+            local_dir = opj(run_dir, 'local_' + strategy)
+            func = lambda: task.get_output_data(local_dir, new_only=(strategy == DOWNLOAD))
+        elif strategy == UPLOAD_PARALLEL:
+            tasks = self._split_tasks(task, credentials, data_dir)
+            func = lambda: self._parallel_upload(tasks, remote_base)
+        else:
+            func = lambda: task.send_input_data(remote_base)
+        usage0 = resource.getrusage(resource.RUSAGE_SELF)
+        t0 = time.time()
+        _quiet(func)
+        wall = time.time() - t0
+        usage1 = resource.getrusage(resource.RUSAGE_SELF)
+        cpu = (usage1.ru_utime - usage0.ru_utime) + (usage1.ru_stime - usage0.ru_stime)
+        nbytes = task.get_input_size()
+        num_files = task.task_data['local_data_bundle'].get_num_files()
+        task.ssh_session.close()
+        return {
+            'strategy': strategy,
+            'wall_time': wall,
+            'client_cpu_time': cpu,
+            'bytes': nbytes,
+            'mb_per_s': nbytes / wall / 1e6 if wall else None,
+            'time_per_file': wall / num_files if num_files else None,
+            'cpu_per_file': cpu / num_files if num_files else None
+        }
+
+    def _split_tasks(self, task, credentials, data_dir):
+        """
+        | Private. TransferBenchmark._split_tasks
+        | Tasks sharing out the data files, each with its own open connection
+        """
+        file_names = sorted(task.task_data['local_data_bundle'].get_file_names())
+        tasks = []
+        for i in range(min(self.parallel_workers, len(file_names))):
+            worker_task = self._new_task(credentials)
+            worker_task._open_ssh_session()
+            worker_task.set_local_data_bundle(data_dir, add_files=False)
+            for file_name in file_names[i::self.parallel_workers]:
+                worker_task.task_data['local_data_bundle'].add_file(opj(data_dir, file_name))
+            # All workers write to the same remote folder
+            worker_task.id = task.id
+            tasks.append(worker_task)
+        return tasks
+
+    def _parallel_upload(self, tasks, remote_base):
+        """
+        | Private. TransferBenchmark._parallel_upload
+        | Uploads from all tasks concurrently, one thread each
+        """
+        threads = [
+            threading.Thread(target=worker_task.send_input_data, args=(remote_base,)) for worker_task in tasks
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for worker_task in tasks:
+            worker_task.ssh_session.close()
+
+    def get_summary(self):
+        """
+        | TransferBenchmark.get_summary
+        | Per-file overhead (seconds) and streaming throughput (MB/s) per strategy, latency and bandwidth,
+        | from a least-squares fit of time per file against file size
+        """
+        groups = {}
+        for res in self.results:
+            groups.setdefault((res['strategy'], res['latency'], res['bandwidth']), []).append(res)
+        summary = []
+        for (strategy, latency, bandwidth), results in sorted(groups.items()):
+            xs = [res['file_size'] for res in results]
+            ys = [res['time_per_file'] for res in results]
+            num = len(xs)
+            mean_x = sum(xs) / num
+            mean_y = sum(ys) / num
+            var_x = sum((x - mean_x) ** 2 for x in xs)
+            if var_x:
+                slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+            else:
+                slope = 0.
+            overhead = mean_y - slope * mean_x
+            summary.append({
+                'strategy': strategy,
+                'latency': latency,
+                'bandwidth': bandwidth,
+                'per_file_overhead': overhead,
+                'stream_mb_per_s': 1. / slope / 1e6 if slope > 0 else None,
+                'cpu_per_file': sum(res['cpu_per_file'] for res in results) / num
+            })
+        return summary
+
+    def save(self, output_path):
+        """
+        | TransferBenchmark.save
+        | Saves results, summary and environment as json, to compare releases
+
+        Args:
+            output_path (str): Path to file
+        """
+        with open(output_path, 'w') as output_file:
+            json.dump(
+                {
+                    'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                    'environment': {
+                        'host': platform.node(),
+                        'python': platform.python_version(),
+                        'paramiko': paramiko.__version__,
+                        'cpus': os.cpu_count()
+                    },
+                    'strategies': {name: STRATEGIES[name] for name in self.strategies},
+                    'results': self.results,
+                    'summary': self.get_summary()
+                },
+                output_file,
+                indent=3
+            )
+
+
+def _print_result(result):
+    """
+    | Private. transfer_benchmark._print_result
+    | Prints a single result line
+    """
+    print(
+        '{strategy:16s} lat {latency:.3f}s files {files:6d} size {file_size:9d}: '
+        '{wall_time:8.3f}s {mb_per_s:8.2f} MB/s {time_per_file:.4f} s/file cpu {client_cpu_time:.2f}s'.format(**result)
+    )
+
+
+def _quiet(func, *args, **kwargs):
+    """
+    | Private. transfer_benchmark._quiet
+    | Calls func without printing per-file messages
+    """
+    with contextlib.redirect_stdout(StringIO()):
+        return func(*args, **kwargs)
@@ -28,7 +28,10 @@ setuptools.setup(
             "credentials = biobb_remote.scripts.credentials:main",
             "scp_service = biobb_remote.scripts.scp_service:main",
             "slurm_test = biobb_remote.scripts.slurm_test:main",
-            "ssh_command = biobb_remote.scripts.ssh_command:main"
+            "ssh_command = biobb_remote.scripts.ssh_command:main",
+            "fake_slurm_benchmark = biobb_remote.scripts.fake_slurm_benchmark:main",
+            "transfer_benchmark = biobb_remote.scripts.transfer_benchmark:main",
+            "bundle_benchmark = biobb_remote.scripts.bundle_benchmark:main"
         ]
     },
     classifiers=(